@@ -0,0 +1,157 @@
+import asyncio
+import math
+import random
+import time
+
+import ccxt
+import ccxt.async_support as ccxt_async
+from tqdm import tqdm
+
+import candle_store
+import validate
+
+# ====== 設定 ======
+CONCURRENCY = 8  # 同時に取得する銘柄数
+MAX_RETRIES = 5
+BACKOFF_BASE_SEC = 0.5
+
+
+# ====== 全銘柄で共有するトークンバケット ======
+class TokenBucket:
+    def __init__(self, rate, capacity=None):
+        self.rate = float(rate)  # 1 秒あたりのリクエスト数
+        self.capacity = float(capacity or max(1.0, rate))
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = asyncio.Lock()
+        self.waited = 0.0  # レート制限で待った合計秒数
+
+    async def acquire(self, tokens=1.0):
+        async with self.lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= tokens:
+                    self.tokens -= tokens
+                    return
+                wait = (tokens - self.tokens) / self.rate
+                self.waited += wait
+                await asyncio.sleep(wait)
+
+
+def make_exchange():
+    # レート制御は TokenBucket で行うので ccxt 側のスロットリングは切る
+    return ccxt_async.bitget({
+        "enableRateLimit": False,
+    })
+
+
+async def fetch_page(exchange, limiter, symbol, timeframe, since, limit):
+    for attempt in range(MAX_RETRIES + 1):
+        await limiter.acquire()
+        try:
+            return await exchange.fetch_ohlcv(symbol, timeframe, since=since, limit=limit)
+        except ccxt.NetworkError:
+            # タイムアウト・429・一時的な障害は指数バックオフ（ジッター付き）で再試行
+            if attempt >= MAX_RETRIES:
+                raise
+            await asyncio.sleep(BACKOFF_BASE_SEC * (2 ** attempt) * (1 + random.random()))
+
+
+async def fetch_range(exchange, limiter, symbol, timeframe, since, until=None, limit=500, pbar=None):
+    tf_ms = exchange.parse_timeframe(timeframe) * 1000
+    out = []
+    while True:
+        page = await fetch_page(exchange, limiter, symbol, timeframe, since, limit)
+        if not page:
+            break
+        out += page
+        if pbar:
+            pbar.update(len(page))
+        since = page[-1][0] + 1
+        if until is not None and page[-1][0] >= until:
+            break
+        if page[-1][0] + tf_ms > exchange.milliseconds():
+            break
+    return out
+
+
+async def sync_symbol(exchange, limiter, store, symbol, timeframe, days, limit=500, max_gaps=10, force=False, position=None):
+    # getcsv.sync_symbol の非同期版。既存データがあれば末尾と欠損だけ、無ければ days 日分を取得。
+    # 1 本も返らなかった欠損は記録し、次回からは取りに行かない
+    tf_ms = exchange.parse_timeframe(timeframe) * 1000
+    now = exchange.milliseconds()
+    exists = store.exists(symbol, timeframe) and not force
+    gaps = []
+    if exists:
+        stored = store.read_arrays(symbol, timeframe)
+        known = store.empty_gaps(symbol, timeframe)
+        gaps = [g for g in candle_store.find_gaps(stored["timestamp"], tf_ms) if g not in known][:max_gaps]
+        since = int(stored["timestamp"][-1])
+    else:
+        since = now - days * 24 * 60 * 60 * 1000
+
+    total = max(1, math.ceil((now - since) / tf_ms))
+    pbar = tqdm(total=total, desc=f"fetch {symbol}", unit="candle", position=position, leave=False)
+    empty = []
+    try:
+        ohlcv = await fetch_range(exchange, limiter, symbol, timeframe, since, limit=limit, pbar=pbar)
+        for start, end in gaps:
+            rows = await fetch_range(exchange, limiter, symbol, timeframe, start + tf_ms, until=end - tf_ms, limit=limit)
+            if not any(start < row[0] < end for row in rows):
+                empty.append((start, end))
+            ohlcv += rows
+    finally:
+        pbar.close()
+    if empty:
+        await asyncio.to_thread(store.add_empty_gaps, symbol, timeframe, empty)
+
+    if not ohlcv:
+        if not exists:
+            raise RuntimeError(f"{symbol} の OHLCV が取得できませんでした")
+        return store.path(symbol, timeframe), 0, len(gaps)
+    arrays = candle_store.arrays_from_ohlcv(ohlcv)
+    if exists:
+        written = await asyncio.to_thread(store.append, symbol, timeframe, arrays)
+    else:
+        # ページの継ぎ目の重複・順序を直してから保存する（追記は append 側で同じ処理をする）
+        arrays, report = validate.validate(arrays, timeframe)
+        if validate.issues(report):
+            tqdm.write(f"[DATA] {symbol}: {validate.issues(report)}")
+        await asyncio.to_thread(store.save, symbol, timeframe, arrays)
+        written = len(arrays["timestamp"])
+    return store.path(symbol, timeframe), written, len(gaps)
+
+
+async def download_all(symbols, store, timeframe, days, limit=500, max_gaps=10, force=False, concurrency=CONCURRENCY, rate=None):
+    # 銘柄を最大 concurrency 並列で取得。全体の速度は共有トークンバケット（取引所のレート制限）で決まる
+    exchange = make_exchange()
+    limiter = TokenBucket(rate or 1000 / exchange.rateLimit)
+    slots = asyncio.Queue()
+    for i in range(concurrency):
+        slots.put_nowait(i + 1)
+    results = {}
+    overall = tqdm(total=len(symbols), desc="銘柄取得/保存", unit="symbol", position=0)
+
+    async def worker(sym):
+        position = await slots.get()
+        try:
+            path, written, gaps = await sync_symbol(exchange, limiter, store, sym, timeframe, days, limit, max_gaps, force, position)
+            tqdm.write(f"Synced: {path} ({written} rows written, gaps fetched={gaps})")
+            results[sym] = (path, written, gaps)
+        except Exception as e:
+            tqdm.write(f"Error {sym}: {e}")
+            results[sym] = e
+        finally:
+            slots.put_nowait(position)
+            overall.update(1)
+
+    started = time.monotonic()
+    try:
+        await asyncio.gather(*(worker(s) for s in symbols))
+    finally:
+        overall.close()
+        await exchange.close()
+    tqdm.write(f"Done: {len(symbols)} symbols in {time.monotonic() - started:.1f}s (rate-limit wait {limiter.waited:.1f}s)")
+    return results
@@ -1,33 +1,46 @@
-import ccxt
 import pandas as pd
-import ta
-import time
-from datetime import datetime
-import matplotlib.pyplot as plt
+import indicators
 import os
 import numpy as np
 from tqdm import tqdm
 import glob
 from concurrent.futures import ProcessPoolExecutor, as_completed
-import csv
-import matplotlib.dates as mdates
-# ====== 実行対象を直接指定（先頭のプレフィックス = ファイル名の _ の前） ======
-# 例: TARGET_SYMBOL = "BTC" とすると data/BTC_USDT_5m_100d.csv を使う
-# None のままだと data/ 内の全CSVを処理します
+import shared_frame
+import candle_store
+import result_store
+import report
+import resample
+import validate
+# ====== 実行対象を直接指定（シンボルのベース通貨 = "BTC/USDT" の "BTC"） ======
+# 例: TARGET_SYMBOL = "BTC" とするとストア内の BTC/USDT を使う
+# None のままだとストア内の全銘柄を処理します
 TARGET_SYMBOL = "PI"  # ここを "BTC" や "ETH" 等に変える
 
 # ====== 設定 ======
-TIMEFRAME = "5m"
+TIMEFRAME = "5m"  # ストアに無い timeframe は基準足（resample.BASE_TIMEFRAME）から合成する
 LOOKBACK_DAYS = 100
 CSV_DIR = "data"
 CSV_PATTERN = f"{CSV_DIR}/*_{TIMEFRAME}_{LOOKBACK_DAYS}d.csv"
+# ローソク足ストア（candle_store.STORES のキー）。空なら CSV_PATTERN の CSV を一度だけ変換する
+STORE_FORMAT = candle_store.STORE_FORMAT
 
 initial_capital = 1000
 taker_fee_rate = 0.00042
 
+# 資産曲線の dtype（np.float32 にするとメモリ半分。統計は常に float64 で計算）
+EQUITY_DTYPE = np.float64
+# 資産曲線を保持するのは銘柄ごとに上位 N 件だけ（None なら全件保持）
+KEEP_CURVES_TOP_N = 3
+
 # 並列ワーカー数（環境に合わせて調整）
 PARAM_WORKERS = 20
-SYMBOL_WORKERS = 1
+SYMBOL_WORKERS = 1  # ポートフォリオモードで 1 つの period を何分割（銘柄方向）してワーカーに配るか
+
+# True なら全銘柄を同じ時刻軸に揃えたポートフォリオとして評価（各銘柄に資金を等分）
+PORTFOLIO_MODE = False
+
+# 結果ストア（計算済みの組み合わせは再実行時にスキップ）。results_all.csv はここから書き出す
+RESULTS_DB = result_store.RESULTS_PATH
 
 # ====== テストするパラメータ（ここを編集して範囲拡張） ======
 param_sets = [(p, m) for p in range(7, 28) for m in [
@@ -46,220 +59,370 @@ def load_df_from_csv(path):
         df["timestamp"] = pd.to_datetime(df["timestamp"])
     return df
 
+def list_symbols(store):
+    symbols = store.symbols(TIMEFRAME)
+    if not symbols and list_csv_files():
+        # ストアが空なら既存 CSV をワンショット変換
+        print(f"CSV をストアへ変換します: {CSV_PATTERN} -> {store.root}")
+        symbols = candle_store.convert_csvs(CSV_PATTERN, TIMEFRAME, store)
+    return symbols
+
 # ====== SuperTrend ======
 def calculate_supertrend(df, period=14, multiplier=3.5):
-    hl2 = (df["high"] + df["low"]) / 2
-    atr = ta.volatility.AverageTrueRange(df["high"], df["low"], df["close"], window=period).average_true_range()
-    upperband = hl2 + (multiplier * atr)
-    lowerband = hl2 - (multiplier * atr)
-
-    supertrend = [True] * len(df)
-    # copy bands to be mutable
-    upper = upperband.copy()
-    lower = lowerband.copy()
-
-    for i in range(1, len(df)):
-        if df["close"].iloc[i] > upper.iloc[i-1]:
-            supertrend[i] = True
-        elif df["close"].iloc[i] < lower.iloc[i-1]:
-            supertrend[i] = False
-        else:
-            supertrend[i] = supertrend[i-1]
-            if supertrend[i] and lower.iloc[i] < lower.iloc[i-1]:
-                lower.iloc[i] = lower.iloc[i-1]
-            if not supertrend[i] and upper.iloc[i] > upper.iloc[i-1]:
-                upper.iloc[i] = upper.iloc[i-1]
-
+    trend, upper, lower = indicators.supertrend(df["high"].to_numpy(), df["low"].to_numpy(), df["close"].to_numpy(), period, multiplier)
     return pd.DataFrame({
-        "supertrend": supertrend,
+        "supertrend": trend,
         "upperband": upper,
         "lowerband": lower
-    })
+    }, index=df.index)
 
 # ====== バックテストロジック ======
-def backtest_supertrend_serial(args):
-    # wrapper for ProcessPoolExecutor mapping (receives tuple)
-    df, period, multiplier = args
-    return backtest_supertrend(df, period, multiplier)
-
-def backtest_supertrend(df, period, multiplier):
-    st = calculate_supertrend(df, period=period, multiplier=multiplier)
-    df2 = pd.concat([df.reset_index(drop=True), st], axis=1)
-
-    current_price = df2["close"].iloc[0]
-    lot_size = initial_capital / current_price
-
-    position = None
-    entry_price = 0.0
-    profit = 0.0
-    profits = []
-    timestamps = []
-
-    trade_count = 0
-    win_count = 0
-
-    for i in range(period, len(df2)):
-        close = df2["close"].iloc[i]
-        trend = df2["supertrend"].iloc[i]
-
-        if position is None:
-            position = "long" if trend else "short"
-            entry_price = close
-        else:
-            if position == "long" and not trend:
-                trade_profit = (close - entry_price) * lot_size
-                fee = (entry_price + close) * lot_size * taker_fee_rate
-                net_profit = trade_profit - fee
-                profit += net_profit
-                trade_count += 1
-                if net_profit > 0:
-                    win_count += 1
-                position = "short"
-                entry_price = close
-            elif position == "short" and trend:
-                trade_profit = (entry_price - close) * lot_size
-                fee = (entry_price + close) * lot_size * taker_fee_rate
-                net_profit = trade_profit - fee
-                profit += net_profit
-                trade_count += 1
-                if net_profit > 0:
-                    win_count += 1
-                position = "long"
-                entry_price = close
-
-        profits.append(profit)
-        timestamps.append(df2["timestamp"].iloc[i])
+def backtest_supertrend_grid_shared(args):
+    # period 単位のタスク。OHLCV は共有メモリから読み、返すのは資産曲線（任意）と統計だけ
+    handle, period, multipliers, curves = args
+    cols = shared_frame.attach(handle)
+    trend, _, _ = indicators.supertrend_grid(cols["high"], cols["low"], cols["close"], period, multipliers)
+    return simulate_grid(cols["close"], trend, period, curves=curves)
+
+def simulate_grid(close, trend, start, curves=True, dtype=None, lot_bar=0):
+    # trend: (multiplier × bars)。ドテン売買の損益を全行まとめてベクトル計算する
+    # close は全行共通の (bars,) か、行ごとの (rows × bars)（ポートフォリオで行 = 銘柄）
+    # 枚数は close[lot_bar] で initial_capital 分（ウォームアップ付きの区間評価では区間の先頭を渡す）
+    # 戻り値の equity は (multiplier × (bars - start)) の配列。curves=False なら None
+    n_rows, n_bars = trend.shape
+    close = np.broadcast_to(close, (n_rows, n_bars))
+    lot_size = initial_capital / close[:, lot_bar]
+    length = max(0, n_bars - start)
+    equity = np.zeros((n_rows, length))
+    rows = np.zeros(0, dtype=np.intp)
+    net = np.zeros(0)
+    if length > 1:
+        # bar start+1+j で trend が反転したら決済 & 反対方向へエントリー
+        flips = trend[:, start + 1:] != trend[:, start:-1]
+        rows, cols = np.nonzero(flips)
+        bars = cols + start + 1
+        entry_bars = np.empty_like(bars)
+        entry_bars[1:] = bars[:-1]
+        first = np.ones(len(bars), dtype=bool)
+        first[1:] = rows[1:] != rows[:-1]
+        entry_bars[first] = start
+        entry = close[rows, entry_bars]
+        exit_ = close[rows, bars]
+        lot = lot_size[rows]
+        was_long = trend[rows, bars - 1]
+        trade_profit = np.where(was_long, (exit_ - entry) * lot, (entry - exit_) * lot)
+        fee = (entry + exit_) * lot * taker_fee_rate
+        net = trade_profit - fee
+        equity[rows, cols + 1] = net
+    # 損益の累積 → 資産曲線（同じバッファ上で計算）
+    np.cumsum(equity, axis=1, out=equity)
+    final_profit = equity[:, -1].copy() if length > 0 else np.zeros(n_rows)
+    equity += initial_capital
 
     # ドローダウン
-    if len(profits) == 0:
-        equity_curve = np.array([initial_capital])
+    curve = equity if length > 0 else np.full((n_rows, 1), float(initial_capital))
+    peak = np.maximum.accumulate(curve, axis=1)
+    drawdown = (curve - peak) / peak
+    max_drawdown = drawdown.min(axis=1) * 100
+
+    trade_count = np.bincount(rows, minlength=n_rows)
+    win_count = np.bincount(rows[net > 0], minlength=n_rows)
+
+    stats = []
+    for r in range(n_rows):
+        profit = float(final_profit[r])
+        tc = int(trade_count[r])
+        stats.append({
+            "final_profit": profit,
+            "final_equity": initial_capital + profit,
+            "trade_count": tc,
+            "win_rate": (int(win_count[r]) / tc * 100) if tc > 0 else 0.0,
+            "max_drawdown": float(max_drawdown[r])
+        })
+    if not curves:
+        return None, stats
+    return equity.astype(dtype or EQUITY_DTYPE, copy=False), stats
+
+def backtest_supertrend_grid(df, period, multipliers, curves=True):
+    # ATR は 1 回だけ計算し、同じ period の全 multiplier を (multiplier × bars) で一括評価
+    # timestamps は元 DataFrame の配列のビュー（コピーしない）
+    trend, _, _ = indicators.supertrend_grid(df["high"].to_numpy(), df["low"].to_numpy(), df["close"].to_numpy(), period, multipliers)
+    equity, stats = simulate_grid(df["close"].to_numpy(dtype=np.float64), trend, period, curves=curves)
+    timestamps = df["timestamp"].to_numpy()[period:] if curves else None
+    return [(timestamps, equity[r] if curves else None, stats[r]) for r in range(len(stats))]
+
+def backtest_supertrend(df, period, multiplier):
+    return backtest_supertrend_grid(df, period, [multiplier])[0]
+
+def group_params_by_period(param_sets):
+    groups = {}
+    for period, mult in param_sets:
+        groups.setdefault(period, []).append(mult)
+    return groups
+
+def run_params_for_symbol(df, symbol, param_sets, workers=1, executor=None, keep_curves=None, sink=None):
+    # executor を渡すとプールを使い回す（main() では実行全体で 1 つ）
+    # keep_curves=N なら final_profit 上位 N 件だけ資産曲線を持ち、残りは統計のみ
+    # sink を渡すと period ごとの結果をその場で渡す（結果ストアへの逐次書き込み用）
+    results = []
+    groups = group_params_by_period(param_sets)
+    curves = keep_curves is None
+    pbar = tqdm(total=len(param_sets), desc=f"{symbol} params", leave=False, unit="param")
+
+    def collect(period, mults, outs):
+        batch = []
+        for mult, (ts, eq, st) in zip(mults, outs):
+            r = {"symbol": symbol, "period": period, "mult": mult, **st}
+            if eq is not None:
+                r["timestamps"] = ts
+                r["equity"] = eq
+            batch.append(r)
+        if sink is not None:
+            sink(batch)
+        results.extend(batch)
+        pbar.update(len(mults))
+
+    if (workers <= 1 and executor is None) or len(groups) <= 1:
+        for period, mults in groups.items():
+            collect(period, mults, backtest_supertrend_grid(df, period, mults, curves=curves))
     else:
-        equity_curve = np.array([initial_capital + p for p in profits])
-    peak = np.maximum.accumulate(equity_curve)
-    drawdown = (equity_curve - peak) / peak
-    max_drawdown = drawdown.min() * 100 if len(drawdown) > 0 else 0.0
-
-    win_rate = (win_count / trade_count * 100) if trade_count > 0 else 0.0
-
-    stats = {
-        "final_profit": profit,
-        "final_equity": initial_capital + profit,
-        "trade_count": trade_count,
-        "win_rate": win_rate,
-        "max_drawdown": max_drawdown
-    }
+        # use process pool to parallelize CPU work (1 タスク = 1 period、df は共有メモリ経由)
+        ex = executor or ProcessPoolExecutor(max_workers=min(workers, len(groups)))
+        timestamps = df["timestamp"].to_numpy()
+        try:
+            with shared_frame.published(df) as handle:
+                futures = {ex.submit(backtest_supertrend_grid_shared, (handle, p, ms, curves)): (p, ms) for p, ms in groups.items()}
+                for fut in as_completed(futures):
+                    period, mults = futures[fut]
+                    try:
+                        equity, stats = fut.result()
+                        collect(period, mults, [(timestamps[period:], equity[r] if curves else None, stats[r]) for r in range(len(stats))])
+                    except Exception as e:
+                        tqdm.write(f"Error {symbol} period={period}: {e}")
+        finally:
+            if executor is None:
+                ex.shutdown()
+    pbar.close()
+
+    if not curves and keep_curves > 0:
+        # 上位だけ曲線を再計算（結果は決定的なので統計と一致する）
+        for r in sorted(results, key=lambda x: x["final_profit"], reverse=True)[:keep_curves]:
+            ts, eq, _ = backtest_supertrend(df, r["period"], r["mult"])
+            r["timestamps"] = ts
+            r["equity"] = eq
+    return results
 
-    return timestamps, profits, stats
+# ====== ポートフォリオ（全銘柄を同じ時刻軸に揃えて同時に評価） ======
+def align_symbols(store, symbols):
+    # 全銘柄のデータがそろう期間に絞って時刻の和集合に揃え、(銘柄 × 本数) の配列にする。
+    # 欠けた足は直前の終値で埋めたフラットな足（その銘柄はその足では動かない）
+    frames = []
+    for sym in symbols:
+        a = store.read_arrays(sym, TIMEFRAME)
+        frames.append(pd.DataFrame({c: np.asarray(a[c]) for c in ("open", "high", "low", "close")}, index=np.asarray(a["timestamp"])))
+    start = max(f.index[0] for f in frames)
+    end = min(f.index[-1] for f in frames)
+    index = np.unique(np.concatenate([f.index.to_numpy() for f in frames]))
+    index = index[(index >= start) & (index <= end)]
+    panel = {c: np.empty((len(frames), len(index))) for c in ("open", "high", "low", "close")}
+    for i, f in enumerate(frames):
+        f = f.reindex(index)
+        close = f["close"].ffill()
+        panel["close"][i] = close.to_numpy()
+        for col in ("open", "high", "low"):
+            panel[col][i] = f[col].fillna(close).to_numpy()
+    return index, panel
+
+def backtest_portfolio_shared(args):
+    # (period, 銘柄の範囲) 単位のタスク。multiplier ごとに銘柄の損益曲線を合計して返す
+    handle, period, multipliers, lo, hi = args
+    cols = shared_frame.attach(handle)
+    close = cols["close"][lo:hi]
+    trend, _, _ = indicators.supertrend_panel(cols["high"][lo:hi], cols["low"][lo:hi], close, period, multipliers)
+    pnl = []
+    stats = []
+    for m in range(len(multipliers)):
+        equity, st = simulate_grid(close, trend[m], period, dtype=np.float64)
+        pnl.append((equity - initial_capital).sum(axis=0))
+        stats.append(st)
+    return np.vstack(pnl), stats
+
+def portfolio_stats(pnl, symbol_stats, n_symbols):
+    # 資金を銘柄数で等分した合成資産曲線の統計（pnl は各銘柄を initial_capital で運用した損益の合計）
+    equity = initial_capital + pnl / n_symbols
+    peak = np.maximum.accumulate(equity)
+    trades = sum(st["trade_count"] for st in symbol_stats)
+    wins = sum(st["trade_count"] * st["win_rate"] / 100 for st in symbol_stats)
+    return equity, {
+        "final_profit": float(equity[-1] - initial_capital),
+        "final_equity": float(equity[-1]),
+        "trade_count": int(trades),
+        "win_rate": (wins / trades * 100) if trades > 0 else 0.0,
+        "max_drawdown": float(((equity - peak) / peak).min() * 100),
+        "profitable_symbols": sum(st["final_profit"] > 0 for st in symbol_stats),
+    }
 
-def run_params_for_symbol(df, symbol, param_sets, workers=1):
+def portfolio_detail(panel, period, mult):
+    # 上位パラメータ用: 銘柄ごとの資産曲線と、その足ごとの損益変化の相関行列
+    trend, _, _ = indicators.supertrend_panel(panel["high"], panel["low"], panel["close"], period, [mult])
+    equity, stats = simulate_grid(panel["close"], trend[0], period)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        corr = np.corrcoef(np.diff(equity, axis=1))
+    return equity, stats, np.atleast_2d(corr)
+
+def run_portfolio(timestamps, panel, param_sets, workers=1, executor=None, symbol_chunks=SYMBOL_WORKERS, keep_curves=KEEP_CURVES_TOP_N):
+    # period × 銘柄チャンクでタスクを分け、チャンクの損益曲線を親で合算する。
+    # 合成曲線は統計を出したら捨て、上位 keep_curves 件だけ銘柄別の曲線と相関を再計算する
+    n_symbols = panel["close"].shape[0]
+    groups = group_params_by_period(param_sets)
+    bounds = np.linspace(0, n_symbols, max(1, min(symbol_chunks, n_symbols)) + 1).astype(int)
+    chunks = list(zip(bounds[:-1], bounds[1:]))
     results = []
-    if workers <= 1:
-        for period, mult in tqdm(param_sets, desc=f"{symbol} params", leave=False, unit="param"):
-            ts, pf, st = backtest_supertrend(df, period, mult)
-            results.append({
-                "symbol": symbol,
-                "period": period,
-                "mult": mult,
-                "timestamps": ts,
-                "profits": pf,
-                **st
-            })
-    else:
-        # use process pool to parallelize CPU work
-        args = [(df, p, m) for p, m in param_sets]
-        with ProcessPoolExecutor(max_workers=workers) as ex:
-            futures = {ex.submit(backtest_supertrend_serial, a): a[1:] for a in args}
-            for fut in tqdm(as_completed(futures), total=len(futures), desc=f"{symbol} params", leave=False, unit="param"):
-                period, mult = futures[fut]
-                try:
-                    ts, pf, st = fut.result()
-                    results.append({
-                        "symbol": symbol,
-                        "period": period,
-                        "mult": mult,
-                        "timestamps": ts,
-                        "profits": pf,
-                        **st
-                    })
-                except Exception as e:
-                    tqdm.write(f"Error {symbol} {(period, mult)}: {e}")
+    pbar = tqdm(total=len(param_sets), desc="portfolio params", leave=False, unit="param")
+    ex = executor
+    if ex is None and workers > 1:
+        ex = ProcessPoolExecutor(max_workers=min(workers, len(groups) * len(chunks)))
+    try:
+        with shared_frame.published_arrays(panel) as handle:
+            tasks = [(handle, p, ms, lo, hi) for p, ms in groups.items() for lo, hi in chunks]
+            outs = ex.map(backtest_portfolio_shared, tasks) if ex is not None else map(backtest_portfolio_shared, tasks)
+            partial = {}
+            for (_, period, mults, _, _), (pnl, stats) in zip(tasks, outs):
+                acc = partial.setdefault(period, [np.zeros_like(pnl), [[] for _ in mults], 0])
+                acc[0] += pnl
+                for m, st in enumerate(stats):
+                    acc[1][m].extend(st)
+                acc[2] += 1
+                if acc[2] < len(chunks):
+                    continue
+                for m, mult in enumerate(mults):
+                    _, st = portfolio_stats(acc[0][m], acc[1][m], n_symbols)
+                    results.append({"symbol": "PORTFOLIO", "period": period, "mult": mult, **st})
+                del partial[period]
+                pbar.update(len(mults))
+    finally:
+        if executor is None and ex is not None:
+            ex.shutdown()
+    pbar.close()
+
+    for r in sorted(results, key=lambda x: x["final_profit"], reverse=True)[:keep_curves or 0]:
+        equity, stats, corr = portfolio_detail(panel, r["period"], r["mult"])
+        r["timestamps"] = timestamps[r["period"]:].view("datetime64[ms]")
+        r["equity"], _ = portfolio_stats((equity - initial_capital).sum(axis=0), stats, n_symbols)
+        r["symbol_stats"] = stats
+        r["corr"] = corr
+    return results
+
+def main_portfolio(store, symbols, executor=None):
+    rep = report.ReportWriter("plots", title="Portfolio backtest")
+    timestamps, panel = align_symbols(store, symbols)
+    print(f"ポートフォリオ: {len(symbols)} 銘柄 × {len(timestamps)} 本（共通期間）")
+    results = run_portfolio(timestamps, panel, param_sets, workers=PARAM_WORKERS, executor=executor)
+    top3 = sorted(results, key=lambda x: x["final_profit"], reverse=True)[:3]
+    print("\n=== ポートフォリオ 上位3パターン ===")
+    for idx, r in enumerate(top3, start=1):
+        print(f"ATR={r['period']}, Mult={r['mult']} → 損益:{r['final_profit']:.4f}, 最終資産:{r['final_equity']:.4f}, 取引数:{r['trade_count']}, 勝率:{r['win_rate']:.2f}%, 最大DD:{r['max_drawdown']:.2f}%, プラス銘柄:{r['profitable_symbols']}/{len(symbols)}")
+        if r.get("corr") is not None:
+            off = r["corr"][~np.eye(len(symbols), dtype=bool)]
+            print(f"  銘柄間の損益相関（平均）: {np.nanmean(off) if off.size else float('nan'):.3f}")
+            for sym, st in zip(symbols, r["symbol_stats"]):
+                print(f"  {sym}: 損益:{st['final_profit']:.4f}, 取引数:{st['trade_count']}, 最大DD:{st['max_drawdown']:.2f}%")
+        outpath = os.path.join("plots", f"portfolio_top{idx}_ATR{r['period']}_M{r['mult']}.png")
+        rep.add("Portfolio", f"Portfolio ({len(symbols)} symbols) ATR={r['period']} Mult={r['mult']}", outpath,
+                [(None, r.get("timestamps"), r.get("equity"))], stats=format_stats(r), baseline=initial_capital)
+    print(f"Report: {rep.close()}")
     return results
 
-def _ensure_dir(path):
-    d = os.path.dirname(path)
-    if d and not os.path.exists(d):
-        os.makedirs(d, exist_ok=True)
+def format_stats(r):
+    return f"損益:{r['final_profit']:.4f}, 最終資産:{r['final_equity']:.4f}, 取引数:{r['trade_count']}, 勝率:{r['win_rate']:.2f}%, 最大DD:{r['max_drawdown']:.2f}%"
 
-def plot_equity(timestamps, profits, title=None, outpath=None, show=True):
-    if not timestamps or not profits:
+def plot_equity(timestamps, equity, title=None, outpath=None, show=False):
+    # 単発の描画。バックテスト本体は report.ReportWriter で非同期に描画する（show=True は対話用）
+    if timestamps is None or equity is None or len(equity) == 0:
         return
-    x = pd.to_datetime(timestamps)
-    equity = np.array([initial_capital + p for p in profits])
-
-    plt.figure(figsize=(10, 5))
-    plt.plot(x, equity, linewidth=1.25)
-    plt.fill_between(x, equity, initial_capital, where=(equity >= initial_capital), color="tab:green", alpha=0.12)
-    plt.fill_between(x, equity, initial_capital, where=(equity < initial_capital), color="tab:red", alpha=0.12)
-    plt.axhline(initial_capital, color="gray", linestyle="--", linewidth=0.8)
-    if title:
-        plt.title(title)
-    plt.xlabel("Time")
-    plt.ylabel("Equity (USDT)")
-    plt.grid(True, alpha=0.3)
-    ax = plt.gca()
-    ax.xaxis.set_major_locator(mdates.AutoDateLocator())
-    ax.xaxis.set_major_formatter(mdates.ConciseDateFormatter(mdates.AutoDateLocator()))
-    plt.tight_layout()
     if outpath:
-        _ensure_dir(outpath)
-        plt.savefig(outpath, dpi=150)
+        report.render_equity({"outpath": outpath, "series": [(None, timestamps, equity)], "title": title, "baseline": initial_capital})
     if show:
+        import matplotlib.pyplot as plt
+        fig, ax = plt.subplots(figsize=(10, 5))
+        report.draw_equity(ax, [(None, *report.downsample(timestamps, equity))], title, initial_capital)
         plt.show()
-    plt.close()
+        plt.close(fig)
 
 # ====== メイン ======
 def main():
     os.chdir(os.path.dirname(os.path.abspath(__file__)))
-    csv_files = list_csv_files()
-    if not csv_files:
-        print(f"CSV が見つかりません: {CSV_PATTERN}")
+    store = resample.get_store(STORE_FORMAT)
+    symbols = list_symbols(store)
+    if not symbols:
+        print(f"ローソク足データが見つかりません: {store.root} / {CSV_PATTERN}")
         return
 
-    # 単一指定がある場合はプレフィックスでフィルタ
+    if PORTFOLIO_MODE:
+        # ポートフォリオは TARGET_SYMBOL に関係なくストア内の全銘柄で評価
+        executor = ProcessPoolExecutor(max_workers=PARAM_WORKERS) if PARAM_WORKERS > 1 else None
+        try:
+            main_portfolio(store, symbols, executor)
+        finally:
+            if executor is not None:
+                executor.shutdown()
+        return
+
+    # 単一指定がある場合はベース通貨でフィルタ
     if TARGET_SYMBOL:
-        pref = f"{TARGET_SYMBOL}_"
-        csv_files = [p for p in csv_files if os.path.basename(p).startswith(pref)]
-        if not csv_files:
-            print(f"{TARGET_SYMBOL} に対応する CSV が見つかりません（プレフィックス: {pref}）")
+        symbols = [s for s in symbols if s.split("/")[0] == TARGET_SYMBOL]
+        if not symbols:
+            print(f"{TARGET_SYMBOL} に対応するデータが見つかりません")
             return
 
     plots_dir = "plots"
     os.makedirs(plots_dir, exist_ok=True)
 
     overall_best = []
-    all_results = []
-
-    for path in tqdm(csv_files, desc="CSV読み込み/銘柄", unit="file"):
-        base = os.path.basename(path)
-        # ファイル名からシンボルを復元: ABC_USDT_5m_100d.csv -> ABC/USDT
-        sym = base.split("_")[0].replace("_", "/")
-        df = load_df_from_csv(path)
-        results = run_params_for_symbol(df, sym, param_sets, workers=PARAM_WORKERS)
-        if not results:
-            tqdm.write(f"{sym} は結果無し")
-            continue
-        all_results.extend(results)
-        best = max(results, key=lambda x: x["final_profit"])
-        overall_best.append(best)
-        # 銘柄上位3表示 + プロット表示/保存
-        top3 = sorted(results, key=lambda x: x["final_profit"], reverse=True)[:3]
-        print(f"\n=== {sym} 上位3パターン ===")
-        for idx, r in enumerate(top3, start=1):
-            print(f"ATR={r['period']}, Mult={r['mult']} → 損益:{r['final_profit']:.4f}, 最終資産:{r['final_equity']:.4f}, 取引数:{r['trade_count']}, 勝率:{r['win_rate']:.2f}%, 最大DD:{r['max_drawdown']:.2f}%")
-            title = f"{sym} SuperTrend ATR={r['period']} Mult={r['mult']}"
-            outpath = os.path.join(plots_dir, f"{sym.replace('/','_')}_top{idx}_ATR{r['period']}_M{r['mult']}.png")
-            # 同時に保存して画面にも表示
-            plot_equity(r.get("timestamps", []), r.get("profits", []), title=title, outpath=outpath, show=True)
+    done_keys = []
+    # 描画は別プロセスで非同期に行い、最後に plots/index.html を書き出す
+    rep = report.ReportWriter(plots_dir)
+    results_db = result_store.ResultStore(RESULTS_DB)
+    version = result_store.code_version(indicators, simulate_grid) + f":{initial_capital}"
+
+    # プロセスプールは実行全体で 1 回だけ起動し、全銘柄で使い回す
+    executor = ProcessPoolExecutor(max_workers=PARAM_WORKERS) if PARAM_WORKERS > 1 else None
+    try:
+        for sym in tqdm(symbols, desc="読み込み/銘柄", unit="symbol"):
+            # 検証（並べ替え・重複除去）済みのデータで回し、マニフェストのハッシュを結果キャッシュのキーにする
+            arrays, data_report = validate.validate(store.read_arrays(sym, TIMEFRAME), TIMEFRAME)
+            if validate.issues(data_report):
+                tqdm.write(f"[DATA] {sym}: {validate.issues(data_report)}")
+            df = candle_store.frame_from_arrays(arrays)
+            key = {"symbol": sym, "data_hash": validate.manifest(sym, TIMEFRAME, arrays, data_report)["content_hash"],
+                   "fee_rate": taker_fee_rate, "code_version": version}
+            # データ・手数料・コードが同じで計算済みの組み合わせは飛ばす。結果は period ごとに書き込む
+            done = results_db.done(**key)
+            todo = [ps for ps in param_sets if ps not in done]
+            if todo:
+                run_params_for_symbol(df, sym, todo, workers=PARAM_WORKERS, executor=executor, keep_curves=0,
+                                      sink=lambda batch: results_db.add_many(batch, **key))
+            elif done:
+                tqdm.write(f"{sym} は計算済み（{len(done)} 件）")
+            done_keys.append(tuple(key.values()))
+            # 銘柄上位3表示 + プロット表示/保存（曲線は上位だけ再計算）
+            top3 = results_db.top(3, **key)
+            if not top3:
+                tqdm.write(f"{sym} は結果無し")
+                continue
+            overall_best.append(top3[0])
+            print(f"\n=== {sym} 上位3パターン ===")
+            for idx, r in enumerate(top3, start=1):
+                print(f"ATR={r['period']}, Mult={r['mult']} → {format_stats(r)}")
+                r["timestamps"], r["equity"], _ = backtest_supertrend(df, r["period"], r["mult"])
+                title = f"{sym} SuperTrend ATR={r['period']} Mult={r['mult']}"
+                outpath = os.path.join(plots_dir, f"{candle_store.safe_name(sym)}_top{idx}_ATR{r['period']}_M{r['mult']}.png")
+                rep.add(sym, title, outpath, [(None, r["timestamps"], r["equity"])], stats=format_stats(r), baseline=initial_capital)
+                if idx > 1:
+                    del r["timestamps"], r["equity"]
+    finally:
+        if executor is not None:
+            executor.shutdown()
 
     # 全銘柄ランキング
     overall_sorted = sorted(overall_best, key=lambda x: x["final_profit"], reverse=True)
@@ -267,36 +430,18 @@ def main():
     for r in overall_sorted[:20]:
         print(f"{r['symbol']} | ATR={r['period']} Mult={r['mult']} → 総損益:{r['final_profit']:.4f}, 最終資産:{r['final_equity']:.4f}")
 
-    # 全銘柄トップ比較プロット（上位5を比較、表示＋保存）
+    # 全銘柄トップ比較プロット（上位5を比較）
     top_overall = overall_sorted[:5]
     if top_overall:
-        plt.figure(figsize=(12, 6))
-        for r in top_overall:
-            ts = pd.to_datetime(r.get("timestamps", []))
-            if len(ts) == 0:
-                continue
-            equity = np.array([initial_capital + p for p in r.get("profits", [])])
-            plt.plot(ts, equity, label=f"{r['symbol']} ATR={r['period']} M={r['mult']}")
-        plt.axhline(initial_capital, color="gray", linestyle="--", linewidth=0.8)
-        plt.title("Top overall equity comparison")
-        plt.xlabel("Time")
-        plt.ylabel("Equity (USDT)")
-        plt.legend(loc="best", fontsize="small")
-        plt.grid(True, alpha=0.3)
+        series = [(f"{r['symbol']} ATR={r['period']} M={r['mult']}", r.get("timestamps"), r.get("equity")) for r in top_overall]
         outall = os.path.join(plots_dir, "overall_top5.png")
-        _ensure_dir(outall)
-        plt.tight_layout()
-        plt.savefig(outall, dpi=150)
-        plt.show()
-        plt.close()
+        rep.add("全銘柄", "Top overall equity comparison", outall, series, baseline=initial_capital, figsize=(12, 6))
+    print(f"Report: {rep.close()}")
 
-    # 結果を CSV に保存
+    # 結果を CSV に保存（今回の銘柄・データ・コードの結果をストアから書き出す）
     outf = "results_all.csv"
-    with open(outf, "w", newline="") as f:
-        writer = csv.DictWriter(f, fieldnames=["symbol", "period", "mult", "final_profit", "final_equity", "trade_count", "win_rate", "max_drawdown"])
-        writer.writeheader()
-        for r in all_results:
-            writer.writerow({k: r.get(k) for k in writer.fieldnames})
+    results_db.export_csv(outf, done_keys)
+    results_db.close()
     print(f"Saved {outf}")
 
 if __name__ == "__main__":
@@ -0,0 +1,162 @@
+import argparse
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+
+import backtest
+import candle_store
+import indicators
+import report
+
+# ====== ベンチマーク（ネットワーク不要・合成ローソク足） ======
+# 各ステージ（指標 / シミュレーション / グリッド / 読み込み / 描画）の時間とピークメモリを測り JSON に書く。
+# --baseline を渡すと、スループット（bars/s）が基準より TOLERANCE 以上落ちたステージを報告して終了コード 1 を返す。
+SIZES = (10_000, 100_000, 1_000_000)
+SEED = 42
+TOLERANCE = 0.2
+MIN_TIME_SEC = 1.0  # 短いステージはこの秒数に達するまで繰り返して最速値を取る
+GRID_PERIODS = (10, 14, 21)
+GRID_MULTIPLIERS = (3.0, 4.5, 6.3, 8.1)
+OUT_PATH = "bench_results.json"
+
+
+def synthetic_ohlcv(n, seed=SEED, start_ms=1_700_000_000_000, timeframe_ms=5 * 60 * 1000):
+    # ボラティリティが時々切り替わる幾何ランダムウォーク。同じ seed なら同じ系列
+    rng = np.random.default_rng(seed)
+    start_ms -= start_ms % timeframe_ms  # 実データと同じく timeframe の境界に揃える
+    vol = np.repeat(rng.uniform(0.001, 0.006, n // 500 + 1), 500)[:n]
+    close = 1.0 * np.exp(np.cumsum(rng.normal(0, 1, n) * vol))
+    open_ = np.empty(n)
+    open_[0] = close[0]
+    open_[1:] = close[:-1]
+    wick = np.abs(rng.normal(0, 1, (2, n))) * vol * close
+    return {
+        "timestamp": start_ms + np.arange(n, dtype=np.int64) * timeframe_ms,
+        "open": open_,
+        "high": np.maximum(open_, close) + wick[0],
+        "low": np.minimum(open_, close) - wick[1],
+        "close": close,
+        "volume": rng.uniform(100, 10_000, n),
+    }
+
+
+def measure(fn, repeat=3, memory=True, min_time=MIN_TIME_SEC):
+    # 最速の実行時間（秒）と、別途 1 回 tracemalloc で測ったピーク（MB）。
+    # repeat > 1 なら 1 回空回ししてから、repeat 回以上かつ合計 min_time 秒以上繰り返す
+    if repeat > 1:
+        fn()
+    best = float("inf")
+    total = 0.0
+    runs = 0
+    while runs < repeat or (repeat > 1 and total < min_time):
+        t0 = time.perf_counter()
+        fn()
+        elapsed = time.perf_counter() - t0
+        best = min(best, elapsed)
+        total += elapsed
+        runs += 1
+    peak = None
+    if memory:
+        tracemalloc.start()
+        try:
+            fn()
+            peak = tracemalloc.get_traced_memory()[1] / 1e6
+        finally:
+            tracemalloc.stop()
+    return best, peak
+
+
+def stages(arrays, workdir):
+    # (ステージ名, 処理する本数, 関数) のリスト
+    n = len(arrays["timestamp"])
+    df = candle_store.frame_from_arrays(arrays)
+    close = df["close"].to_numpy()
+    trend, _, _ = indicators.supertrend(df["high"].to_numpy(), df["low"].to_numpy(), close, 21, 6.3)
+    params = [(p, m) for p in GRID_PERIODS for m in GRID_MULTIPLIERS]
+
+    csv_path = os.path.join(workdir, f"BENCH_USDT_5m_{n}.csv")
+    df.to_csv(csv_path, index=False)
+    store = candle_store.get_store("npy", os.path.join(workdir, "candles"))
+    store.save("BENCH/USDT", "5m", arrays)
+    ts = arrays["timestamp"]
+    equity = backtest.simulate_grid(close, trend[None, :], 21)[0][0]
+    png = os.path.join(workdir, "bench.png")
+
+    return [
+        ("indicator", n, lambda: backtest.calculate_supertrend(df, 21, 6.3)),
+        ("simulation", n, lambda: backtest.simulate_grid(close, trend[None, :], 21)),
+        ("backtest", n, lambda: backtest.backtest_supertrend(df, 21, 6.3)),
+        ("grid_sweep", n * len(params), lambda: backtest.run_params_for_symbol(df, "BENCH/USDT", params, workers=1, keep_curves=0)),
+        ("load_csv", n, lambda: backtest.load_df_from_csv(csv_path)),
+        ("load_store", n, lambda: store.load("BENCH/USDT", "5m")),
+        ("plot", n, lambda: report.render_equity({"outpath": png, "series": [(None, ts[21:], equity)], "baseline": backtest.initial_capital})),
+    ]
+
+
+def run(sizes=SIZES, memory=True, log=print):
+    results = []
+    with tempfile.TemporaryDirectory() as workdir:
+        for n in sizes:
+            arrays = synthetic_ohlcv(n)
+            for name, work, fn in stages(arrays, workdir):
+                repeat = 3 if n <= 100_000 else 1
+                seconds, peak = measure(fn, repeat, memory)
+                r = {"stage": name, "bars": n, "seconds": seconds, "bars_per_sec": work / seconds, "peak_mb": peak}
+                results.append(r)
+                log(f"{name:<11} {n:>9} bars  {seconds * 1000:10.2f} ms  {r['bars_per_sec']:14.0f} bars/s  peak {peak if peak is None else round(peak, 1)} MB")
+    return {
+        "meta": {
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "jit": indicators.USE_JIT,
+            "cpu_count": os.cpu_count(),
+            "machine": platform.machine(),
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        },
+        "results": results,
+    }
+
+
+def compare(current, baseline, tolerance=TOLERANCE):
+    # スループットが baseline × (1 - tolerance) を下回った (stage, bars, 比率) を返す
+    base = {(r["stage"], r["bars"]): r["bars_per_sec"] for r in baseline["results"]}
+    regressions = []
+    for r in current["results"]:
+        ref = base.get((r["stage"], r["bars"]))
+        if ref and r["bars_per_sec"] < ref * (1 - tolerance):
+            regressions.append((r["stage"], r["bars"], r["bars_per_sec"] / ref))
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="SuperTrend バックテストのベンチマーク")
+    parser.add_argument("--sizes", default=",".join(str(s) for s in SIZES), help="本数（カンマ区切り）")
+    parser.add_argument("--out", default=OUT_PATH, help="結果の JSON")
+    parser.add_argument("--baseline", help="比較する基準の JSON（回帰があれば終了コード 1）")
+    parser.add_argument("--tolerance", type=float, default=TOLERANCE, help="許容するスループット低下率")
+    parser.add_argument("--no-memory", action="store_true", help="tracemalloc によるメモリ計測を省く")
+    args = parser.parse_args()
+
+    current = run([int(s) for s in args.sizes.split(",")], memory=not args.no_memory)
+    with open(args.out, "w") as f:
+        json.dump(current, f, indent=2)
+    print(f"Saved {args.out}")
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        base_sizes = sorted({r["bars"] for r in baseline["results"]})
+        if not set(base_sizes) & {r["bars"] for r in current["results"]}:
+            # 本数が 1 つも重ならなければ何も比較していない（--sizes を基準の作成時とそろえる）
+            sys.exit(f"{args.baseline} に同じ本数の結果がありません（基準の本数: {base_sizes}）")
+        regressions = compare(current, baseline, args.tolerance)
+        for stage, bars, ratio in regressions:
+            print(f"[REGRESSION] {stage} ({bars} bars): 基準の {ratio * 100:.0f}%")
+        if regressions:
+            sys.exit(1)
+        print("回帰なし")
@@ -0,0 +1,289 @@
+import glob
+import hashlib
+import json
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+# ====== ローソク足ストア（CSV の代わりの列指向バイナリ） ======
+# timestamp は int64 の epoch ミリ秒、OHLCV は float64 で列ごとに保存する。
+#   npy     : {root}/{SYMBOL}_{TF}/{列}.{version}.npy + meta.json（mmap で読むので数ミリ秒）
+#   parquet : {root}/{SYMBOL}_{TF}.parquet（pyarrow が必要）
+# 取引所にも無かった欠損区間は npy なら {SYMBOL}_{TF}/gaps.json、parquet なら .parquet.gaps.json に記録する。
+STORE_DIR = os.path.join("data", "candles")
+STORE_FORMAT = "npy"
+COLUMNS = ("timestamp", "open", "high", "low", "close", "volume")
+PRICE_COLUMNS = COLUMNS[1:]
+
+
+def safe_name(symbol: str) -> str:
+    # BTC/USDT -> BTC_USDT, BTC/USDT:USDT -> BTC_USDT-USDT
+    return symbol.replace("/", "_").replace(":", "-")
+
+
+def arrays_from_ohlcv(ohlcv):
+    # ccxt の [[ts, o, h, l, c, v], ...] を列配列に変換
+    raw = np.asarray(ohlcv, dtype=np.float64).reshape(-1, len(COLUMNS))
+    arrays = {"timestamp": raw[:, 0].astype(np.int64)}
+    for i, col in enumerate(PRICE_COLUMNS, start=1):
+        arrays[col] = np.ascontiguousarray(raw[:, i])
+    return arrays
+
+
+def arrays_from_frame(df):
+    ts = df["timestamp"]
+    if pd.api.types.is_datetime64_any_dtype(ts):
+        ts = ts.to_numpy().astype("datetime64[ms]").astype(np.int64)
+    else:
+        ts = ts.to_numpy(dtype=np.int64)
+    arrays = {"timestamp": ts}
+    for col in PRICE_COLUMNS:
+        arrays[col] = df[col].to_numpy(dtype=np.float64)
+    return arrays
+
+
+def frame_from_arrays(arrays):
+    # timestamp は datetime64[ms]（UTC naive）。従来の CSV 読み込みと同じ形の DataFrame
+    data = {"timestamp": np.asarray(arrays["timestamp"], dtype=np.int64).view("datetime64[ms]")}
+    for col in PRICE_COLUMNS:
+        data[col] = arrays[col]
+    return pd.DataFrame(data)
+
+
+def merge_arrays(old, new):
+    # 時刻順に結合し、同じ timestamp は new 側を残す（境界足は後から取得した値で上書き）
+    merged = {col: np.concatenate([np.asarray(old[col]), np.asarray(new[col])]) for col in COLUMNS}
+    order = np.argsort(merged["timestamp"], kind="stable")
+    ts = merged["timestamp"][order]
+    keep = np.ones(len(ts), dtype=bool)
+    keep[:-1] = ts[1:] != ts[:-1]
+    idx = order[keep]
+    return {col: merged[col][idx] for col in COLUMNS}
+
+
+def changed_rows(old, merged):
+    # merged のうち old に無い、または値が変わった行の数（追記で実際に書き込む行数）
+    old_ts = np.asarray(old["timestamp"], dtype=np.int64)
+    ts = np.asarray(merged["timestamp"], dtype=np.int64)
+    if len(old_ts) == 0:
+        return len(ts)
+    idx = np.minimum(np.searchsorted(old_ts, ts), len(old_ts) - 1)
+    same = old_ts[idx] == ts
+    for col in PRICE_COLUMNS:
+        same &= np.asarray(old[col])[idx] == np.asarray(merged[col])
+    return int(np.count_nonzero(~same))
+
+
+def find_gaps(timestamps, timeframe_ms):
+    # 足の間隔が timeframe を超える箇所を (直前の足, 次の足) の timestamp で返す
+    ts = np.asarray(timestamps, dtype=np.int64)
+    if len(ts) < 2:
+        return []
+    pos = np.nonzero(np.diff(ts) > timeframe_ms)[0]
+    return [(int(ts[i]), int(ts[i + 1])) for i in pos]
+
+
+def content_hash(arrays):
+    # 全列の中身から作る短いハッシュ（結果キャッシュのキー。足が 1 本でも変われば変わる）
+    h = hashlib.blake2b(digest_size=16)
+    for col in COLUMNS:
+        dtype = np.int64 if col == "timestamp" else np.float64
+        h.update(np.ascontiguousarray(arrays[col], dtype=dtype).tobytes())
+    return h.hexdigest()
+
+
+def _column_file(col, version):
+    # version は meta.json が指す列ファイルの世代（旧形式の {列}.npy は version 無し）
+    return f"{col}.npy" if version is None else f"{col}.{version}.npy"
+
+
+class _CandleStoreBase:
+    def __init__(self, root=STORE_DIR):
+        self.root = root
+
+    def last_timestamp(self, symbol, timeframe):
+        if not self.exists(symbol, timeframe):
+            return None
+        ts = self.read_arrays(symbol, timeframe)["timestamp"]
+        return int(ts[-1]) if len(ts) else None
+
+    def append(self, symbol, timeframe, arrays):
+        # 既存データとマージして丸ごと置き換える（書き込みは save と同じくアトミック）。
+        # 新しく増えた行と値が変わった行の数を返す（0 なら書き込まない）
+        if not self.exists(symbol, timeframe):
+            self.save(symbol, timeframe, arrays)
+            return len(arrays["timestamp"])
+        old = self.read_arrays(symbol, timeframe, mmap=False)
+        merged = merge_arrays(old, arrays)
+        written = changed_rows(old, merged)
+        if written:
+            self.save(symbol, timeframe, merged)
+        return written
+
+    # ---------- 取引所にも無い欠損 ----------
+    def empty_gaps(self, symbol, timeframe):
+        # 取りに行っても 1 本も返らなかった欠損 (直前の足, 次の足)。上場廃止・メンテナンス中の区間など
+        try:
+            with open(self._gaps_path(symbol, timeframe)) as f:
+                return {tuple(g) for g in json.load(f)}
+        except (FileNotFoundError, ValueError):
+            return set()
+
+    def add_empty_gaps(self, symbol, timeframe, gaps):
+        # 次回以降の同期で取りに行かないよう記録する
+        known = self.empty_gaps(symbol, timeframe) | {(int(a), int(b)) for a, b in gaps}
+        path = self._gaps_path(symbol, timeframe)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f"{path}.tmp"
+        with open(tmp, "w") as f:
+            json.dump(sorted(known), f)
+        os.replace(tmp, path)
+
+
+class NpyCandleStore(_CandleStoreBase):
+    def path(self, symbol, timeframe):
+        return os.path.join(self.root, f"{safe_name(symbol)}_{timeframe}")
+
+    def exists(self, symbol, timeframe):
+        return os.path.exists(os.path.join(self.path(symbol, timeframe), "meta.json"))
+
+    def _gaps_path(self, symbol, timeframe):
+        return os.path.join(self.path(symbol, timeframe), "gaps.json")
+
+    def _meta(self, d):
+        with open(os.path.join(d, "meta.json")) as f:
+            return json.load(f)
+
+    def symbols(self, timeframe):
+        out = []
+        for meta in sorted(glob.glob(os.path.join(self.root, f"*_{timeframe}", "meta.json"))):
+            with open(meta) as f:
+                out.append(json.load(f)["symbol"])
+        return out
+
+    def read_arrays(self, symbol, timeframe, mmap=True):
+        d = self.path(symbol, timeframe)
+        meta = self._meta(d)
+        rows, version = meta["rows"], meta.get("version")
+        mode = "r" if mmap else None
+        return {col: np.load(os.path.join(d, _column_file(col, version)), mmap_mode=mode)[:rows] for col in COLUMNS}
+
+    def load(self, symbol, timeframe):
+        return frame_from_arrays(self.read_arrays(symbol, timeframe))
+
+    def save(self, symbol, timeframe, arrays):
+        # 列は新しい世代のファイル名で書き、meta.json の置き換えで全列を一度に切り替える。
+        # 途中で落ちても meta.json は前の世代の（互いに整合した）列を指したまま
+        d = self.path(symbol, timeframe)
+        os.makedirs(d, exist_ok=True)
+        try:
+            version = (self._meta(d).get("version") or 0) + 1
+        except (FileNotFoundError, ValueError):
+            version = 1
+        files = {_column_file(col, version) for col in COLUMNS}
+        for col in COLUMNS:
+            dtype = np.int64 if col == "timestamp" else np.float64
+            np.save(os.path.join(d, _column_file(col, version)), np.ascontiguousarray(arrays[col], dtype=dtype))
+        meta = {"symbol": symbol, "timeframe": timeframe, "rows": int(len(arrays["timestamp"])), "version": version}
+        tmp = os.path.join(d, "meta.json.tmp")
+        with open(tmp, "w") as f:
+            json.dump(meta, f)
+        os.replace(tmp, os.path.join(d, "meta.json"))
+        # 前の世代と、途中で落ちた書き込みの残骸を消す（mmap 中の読み手は unlink 後も読める）
+        for name in os.listdir(d):
+            if name.endswith(".npy") and name not in files:
+                os.remove(os.path.join(d, name))
+
+
+class ParquetCandleStore(_CandleStoreBase):
+    def path(self, symbol, timeframe):
+        return os.path.join(self.root, f"{safe_name(symbol)}_{timeframe}.parquet")
+
+    def exists(self, symbol, timeframe):
+        return os.path.exists(self.path(symbol, timeframe))
+
+    def _gaps_path(self, symbol, timeframe):
+        return f"{self.path(symbol, timeframe)}.gaps.json"
+
+    def symbols(self, timeframe):
+        out = []
+        for p in sorted(glob.glob(os.path.join(self.root, f"*_{timeframe}.parquet"))):
+            meta = pd.read_parquet(p, columns=["symbol"]).iloc[:1]
+            out.extend(meta["symbol"].tolist())
+        return out
+
+    def read_arrays(self, symbol, timeframe, mmap=True):
+        df = pd.read_parquet(self.path(symbol, timeframe), columns=list(COLUMNS), memory_map=mmap)
+        return {col: df[col].to_numpy() for col in COLUMNS}
+
+    def load(self, symbol, timeframe):
+        return frame_from_arrays(self.read_arrays(symbol, timeframe))
+
+    def save(self, symbol, timeframe, arrays):
+        os.makedirs(self.root, exist_ok=True)
+        df = pd.DataFrame({col: arrays[col] for col in COLUMNS})
+        df["symbol"] = pd.Categorical([symbol] * len(df))
+        path = self.path(symbol, timeframe)
+        tmp = f"{path}.tmp"
+        df.to_parquet(tmp, index=False)
+        os.replace(tmp, path)
+
+
+STORES = {
+    "npy": NpyCandleStore,
+    "parquet": ParquetCandleStore,
+}
+
+
+def resolve_symbol(store, hint, timeframe):
+    # "PI/USDT" や "PI" を保存済みのシンボルに解決する。完全一致が無ければ base が同じもの
+    # （quote が一致するもの → 無期限 "X/USDT:USDT" の順に優先。backtest の TARGET_SYMBOL と同じ base 比較）
+    symbols = store.symbols(timeframe)
+    if hint in symbols:
+        return hint
+    base = hint.split("/")[0]
+    pair = hint.split(":")[0]
+    matches = sorted((s for s in symbols if s.split("/")[0] == base), key=lambda s: (s.split(":")[0] != pair, ":" not in s))
+    if not matches:
+        raise ValueError(f"保存済みのローソク足が見つかりません: {hint} ({timeframe}) in {store.root}")
+    return matches[0]
+
+
+def get_store(kind=STORE_FORMAT, root=STORE_DIR):
+    if kind not in STORES:
+        raise ValueError(f"未対応のストア形式です: {kind}")
+    return STORES[kind](root)
+
+
+# ====== 既存 CSV からの一括変換 ======
+def read_csv_arrays(path):
+    df = pd.read_csv(path, parse_dates=["timestamp"])
+    return arrays_from_frame(df)
+
+
+def symbol_from_csv_path(path):
+    # ABC_USDT_5m_100d.csv -> ABC/USDT
+    parts = os.path.basename(path).split("_")
+    return f"{parts[0]}/{parts[1]}" if len(parts) >= 4 else parts[0]
+
+
+def convert_csvs(pattern, timeframe, store=None):
+    store = store or get_store()
+    converted = []
+    for path in sorted(glob.glob(pattern)):
+        symbol = symbol_from_csv_path(path)
+        store.save(symbol, timeframe, read_csv_arrays(path))
+        converted.append(symbol)
+    return converted
+
+
+if __name__ == "__main__":
+    # 使い方: python candle_store.py "data/*_5m_100d.csv" 5m [npy|parquet]
+    if len(sys.argv) < 3:
+        print("usage: python candle_store.py <csv glob> <timeframe> [npy|parquet]")
+        sys.exit(1)
+    kind = sys.argv[3] if len(sys.argv) > 3 else STORE_FORMAT
+    done = convert_csvs(sys.argv[1], sys.argv[2], get_store(kind))
+    print(f"Converted {len(done)} files -> {get_store(kind).root}")
@@ -0,0 +1,249 @@
+import asyncio
+import json
+import os
+import sys
+import time
+import traceback
+
+import main
+import metrics
+import resample
+import universe
+import ws_feed
+from main import log
+
+# ====== 複数銘柄のライブエンジン ======
+# 設定ファイルの戦略（symbol / period / multiplier ...）を 1 プロセス・1 イベントループで動かす。
+# 取引所クライアント・市場情報キャッシュ・公開 WS 接続は全戦略で共有し、
+# 戦略ごとに持つのは SuperTrend の状態（O(1)）と直近 2 本の足、ポジションだけ。
+CONFIG_PATH = os.getenv("ENGINE_CONFIG", "strategies.json")
+SEED_CONCURRENCY = 4  # 起動時・再シード時に同時に走らせる REST 取得数
+RESEED_RETRY_SEC = 10  # 起動時の履歴取得に失敗したときの再試行間隔
+FEED_CHUNK = 40  # 1 接続あたりのチャンネル数（Bitget は 1 接続 50 チャンネル未満を推奨）
+FEED_TICKER = True  # 足に加えて ticker も購読する（1 銘柄 2 チャンネル）
+
+
+def load_config(path=CONFIG_PATH):
+    # {"strategies": [{"symbol": "PI/USDT", "period": 21, "multiplier": 6.3, "timeframe": "5m", "target_jpy": 1000}, ...]}
+    # period / multiplier / timeframe / target_jpy は省略時 main.py の設定値。
+    # {"universe": {"top": 10, "period": 21, ...}} を足すと出来高上位 10 銘柄（USDT 無期限）に同じ設定の戦略を追加する。
+    # 単方向モードでは同じ銘柄のポジションは 1 つに相殺されるので、1 銘柄につき戦略は 1 本まで
+    with open(path) as f:
+        cfg = json.load(f)
+    entries = list(cfg.get("strategies", [])) if isinstance(cfg, dict) else list(cfg)
+    if isinstance(cfg, dict) and cfg.get("universe"):
+        u = dict(cfg["universe"])
+        listed = {s["symbol"].split(":")[0] for s in entries}  # PI/USDT と PI/USDT:USDT は同じ銘柄として扱う
+        for symbol in universe.get_universe().top(int(u.pop("top")), u.pop("type", universe.DEFAULT_TYPE)):
+            if symbol.split(":")[0] not in listed:
+                entries.append({**u, "symbol": symbol})
+    seen = set()
+    for s in entries:
+        pair = s["symbol"].split(":")[0]  # PI/USDT と PI/USDT:USDT は同じ銘柄
+        if pair in seen:
+            raise ValueError(f"同じ銘柄の戦略が複数あります（ポジションを共有してしまうため不可）: {s['symbol']}")
+        seen.add(pair)
+    out = []
+    for s in entries:
+        out.append({
+            "symbol": s["symbol"],
+            "period": int(s.get("period", main.ATR_PERIOD)),
+            "multiplier": float(s.get("multiplier", main.MULTIPLIER)),
+            "timeframe": s.get("timeframe", main.TIMEFRAME),
+            "target_jpy": float(s.get("target_jpy", main.TARGET_JPY)),
+        })
+    return out
+
+
+class Strategy:
+    def __init__(self, conf, symbol):
+        self.symbol = symbol
+        self.period = conf["period"]
+        self.multiplier = conf["multiplier"]
+        self.timeframe = conf["timeframe"]
+        self.target_jpy = conf["target_jpy"]
+        self.tf_ms = main.exchange.parse_timeframe(self.timeframe) * 1000
+        # 取引所に無い timeframe は元の足（source）を購読して畳み込む
+        self.source = resample.source_timeframe(self.timeframe, main.exchange.timeframes)
+        self.aggregator = resample.CandleAggregator(self.timeframe) if self.source != self.timeframe else None
+        self.name = f"{symbol} {self.timeframe} p={self.period} m={self.multiplier}"
+        self.queue = asyncio.Queue()
+        self.position = None
+        self.contracts = None
+        self.st = None
+        self.window = None  # [直近の確定足, 形成中の足]
+        self.last_price = None
+        self.last_log = 0.0
+        self.last_eval = 0.0  # 最後に形成中の足で判断した時刻
+        self.busy = False  # 発注中は突き合わせで position を書き換えない
+
+    def log(self, msg):
+        log(f"[{self.name}] {msg}")
+
+    async def reseed(self, sem):
+        async with sem:
+            ohlcv = await asyncio.to_thread(main.fetch_candles, self.symbol, self.timeframe, None, main.SEED_LIMIT, self.aggregator)
+        self.st = main.seed_supertrend(ohlcv, self.period, self.multiplier)
+        self.window = ohlcv[-2:]
+        self.last_price = float(self.window[-1][4])
+
+    def _signal(self, last_trend):
+        # 発注はスレッド側で実行する（契約数は戦略ごとに最初の発注判断時に 1 回だけ計算）
+        if self.contracts is None:
+            self.contracts = main.get_contracts_from_jpy(self.symbol, self.target_jpy, self.last_price)
+        return main.handle_signal(self.symbol, self.position, last_trend, self.last_price, self.contracts, state_key=self.name)
+
+    def restore(self, side, contracts):
+        self.position = side
+        if contracts:
+            self.contracts = contracts
+
+    async def run(self, sem):
+        # 起動時の取得失敗で他の戦略まで止めないよう、成功するまでこの戦略だけ再試行する
+        while self.st is None:
+            try:
+                await self.reseed(sem)
+            except Exception as e:
+                self.log(f"[ERROR] 初期化に失敗 → {RESEED_RETRY_SEC} 秒後に再試行: {e}")
+                await asyncio.sleep(RESEED_RETRY_SEC)
+        while True:
+            kind, data = await self.queue.get()
+            try:
+                if kind == "error":
+                    self.log(f"[WS] 切断 → 再接続します: {data}")
+                    continue
+                if kind == "ticker":
+                    self.last_price = data["last"] or self.last_price
+                    continue
+                if self.aggregator is not None:
+                    data = self.aggregator.update(data)
+                    if data is None:
+                        continue
+
+                forming = self.window[-1]
+                closed = data[0] > forming[0]
+                if data[0] < forming[0]:
+                    continue
+                if data[0] == forming[0]:
+                    self.window[-1] = data
+                elif data[0] > forming[0] + self.tf_ms:
+                    self.log("[INFO] 確定足の取りこぼしを検知 → 再シード")
+                    await self.reseed(sem)
+                else:
+                    self.window = [forming, data]
+                    main.get_state().set_last_candle(self.name, forming[0])
+                self.last_price = float(self.window[-1][4])
+
+                now = time.monotonic()
+                last_trend, prev_trend, self.last_eval = main.ws_trend(self.st, self.window, closed, self.last_eval, now)
+                if last_trend is None:
+                    continue
+                if now - self.last_log >= main.POLL_INTERVAL_SEC or last_trend != prev_trend:
+                    self.log(f"[TICK] price={self.last_price:.4f}, trend={'LONG' if last_trend else 'SHORT'}, prev={'LONG' if prev_trend else 'SHORT'}")
+                    self.last_log = now
+                if self.position is None or (self.position == "long") != last_trend:
+                    self.busy = True
+                    try:
+                        self.position = await asyncio.to_thread(self._signal, last_trend)
+                    finally:
+                        self.busy = False
+
+            except Exception as e:
+                self.log(f"[ERROR] {e}")
+                traceback.print_exc()
+
+
+def state_keys(strategies):
+    # symbol -> 戦略（load_config で 1 銘柄 1 戦略に制限済み）
+    return {s.symbol: s for s in strategies}
+
+
+async def reconcile(strategies):
+    targets = {sym: s for sym, s in state_keys(strategies).items() if not s.busy}
+    if not targets:
+        return
+    restored = await asyncio.to_thread(main.reconcile_positions, {sym: s.name for sym, s in targets.items()})
+    for s in targets.values():
+        if not s.busy:
+            s.restore(*restored[s.name])
+
+
+async def reconcile_loop(strategies):
+    while True:
+        await asyncio.sleep(main.RECONCILE_INTERVAL_SEC)
+        try:
+            await reconcile(strategies)
+        except Exception as e:
+            log(f"[ERROR] reconcile: {e}")
+
+
+def build_feeds(strategies, url=None):
+    # (購読する timeframe, instType) ごとに instId -> [戦略の queue, ...] の表を作り、チャンネル数が FEED_CHUNK 以下になるよう 1 接続にまとめる。
+    # 合成する timeframe（10m など）の戦略は元の足（5m）の購読を共有する
+    routes = {}
+    symbols = {}
+    for s in strategies:
+        market = main.exchange.market(s.symbol)
+        inst_type = "USDT-FUTURES" if market.get("swap") else "SPOT"
+        routes.setdefault((s.source, inst_type), {}).setdefault(market["id"], []).append(s.queue)
+        symbols[(s.source, market["id"])] = s.symbol
+
+    feeds = []
+    for (timeframe, inst_type), table in routes.items():
+        async def gap_fill(inst_id, since, timeframe=timeframe):
+            symbol = symbols[(timeframe, inst_id)]
+            return await asyncio.to_thread(main.exchange.fetch_ohlcv, symbol, timeframe, since, main.SEED_LIMIT)
+
+        ids = list(table)
+        per_feed = FEED_CHUNK // 2 if FEED_TICKER else FEED_CHUNK
+        for i in range(0, len(ids), per_feed):
+            chunk = {inst_id: table[inst_id] for inst_id in ids[i:i + per_feed]}
+            feeds.append(ws_feed.BitgetFanoutFeed(chunk, timeframe, inst_type=inst_type, url=url, gap_fill=gap_fill, ticker=FEED_TICKER))
+    return feeds
+
+
+async def run_engine(configs, url=None):
+    # 市場情報は 1 回のキャッシュ参照でまとめて解決し、共有の exchange に登録する
+    entries = main.get_market_cache().get_many([c["symbol"] for c in configs])
+    main.exchange.set_markets([e["market"] for e in entries.values()])
+    strategies = [Strategy(c, entries[c["symbol"]]["symbol"]) for c in configs]
+    resolved = [s.symbol for s in strategies]
+    if len(set(resolved)) != len(resolved):
+        raise ValueError(f"同じ銘柄に解決される戦略が複数あります: {sorted({x for x in resolved if resolved.count(x) > 1})}")
+    feeds = build_feeds(strategies, url)
+    # 保存済みの状態から即座に復元し、取引所とは fetch_positions 1 回で突き合わせる
+    store = main.get_state()
+    for s in strategies:
+        s.restore(*store.get_position(s.name))
+    await reconcile(strategies)
+    log(f"エンジン開始: 戦略 {len(strategies)} 本 / WS 接続 {len(feeds)} 本")
+
+    sem = asyncio.Semaphore(SEED_CONCURRENCY)
+    tasks = [asyncio.create_task(f.run()) for f in feeds]
+    tasks += [asyncio.create_task(s.run(sem)) for s in strategies]
+    tasks.append(asyncio.create_task(reconcile_loop(strategies)))
+    try:
+        await asyncio.gather(*tasks)
+    finally:
+        for f in feeds:
+            f.stop()
+        for t in tasks:
+            t.cancel()
+
+
+def run():
+    if not (main.BITGET_API_KEY and main.BITGET_SECRET and main.BITGET_PASSPHRASE):
+        raise RuntimeError("APIキーが未設定です")
+    configs = load_config(sys.argv[1] if len(sys.argv) > 1 else CONFIG_PATH)
+    if any(c["target_jpy"] <= 0 for c in configs):
+        raise RuntimeError("target_jpy（または TARGET_JPY）が未設定の戦略があります")
+    sampler = metrics.start()
+    try:
+        asyncio.run(run_engine(configs))
+    finally:
+        if sampler:
+            sampler.stop()
+
+
+if __name__ == "__main__":
+    run()
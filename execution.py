@@ -0,0 +1,250 @@
+import asyncio
+import base64
+import hashlib
+import hmac
+import json
+import os
+import threading
+import time
+import uuid
+from collections import deque
+
+import aiohttp
+import ccxt.async_support as ccxt_async
+
+import metrics
+
+# ====== 低レイテンシ発注（ドテンは 1 注文、約定はプライベート WS で非同期に確認） ======
+# 発注は専用スレッドのイベントループ上の ccxt.async_support（接続はセッション内でプール）で行い、
+# 呼び出し側は REST の受付応答（注文 ID）だけを待つ。約定は orders チャンネルで受け取り、
+# 発注→受付・発注→約定のレイテンシを注文ごとに記録する。
+PRIVATE_WS_URL = os.getenv("BITGET_PRIVATE_WS_URL", "wss://ws.bitget.com/v2/ws/private")
+PING_INTERVAL_SEC = 25
+RECONNECT_MAX_SEC = 30
+FILL_TIMEOUT_SEC = 10  # WS で約定が来なければ fetch_order で確認する
+FLIP_MODE = "single"  # "single": 保有枚数 + size の 1 注文 / "batch": 決済 + 新規を 1 回の一括注文
+LATENCY_HISTORY = 1000  # 保持する約定記録の件数（常駐しても増え続けないように）
+
+
+def login_message(api_key, secret, passphrase, timestamp=None):
+    ts = str(int(timestamp if timestamp is not None else time.time()))
+    sign = base64.b64encode(hmac.new(secret.encode(), f"{ts}GET/user/verify".encode(), hashlib.sha256).digest()).decode()
+    return {"op": "login", "args": [{"apiKey": api_key, "passphrase": passphrase, "timestamp": ts, "sign": sign}]}
+
+
+class OrderExecutor:
+    def __init__(self, api_key="", secret="", passphrase="", exchange=None, ws_url=None, inst_type="USDT-FUTURES",
+                 flip_mode=FLIP_MODE, log=print):
+        self.api_key = api_key
+        self.secret = secret
+        self.passphrase = passphrase
+        self.exchange = exchange or ccxt_async.bitget({
+            "apiKey": api_key,
+            "secret": secret,
+            "password": passphrase,
+            "enableRateLimit": True,
+            "options": {
+                "defaultType": "swap",
+                "createMarketBuyOrderRequiresPrice": False,
+            },
+        })
+        self.ws_url = ws_url or PRIVATE_WS_URL
+        self.inst_type = inst_type
+        self.flip_mode = flip_mode
+        self.log = log
+        self.loop = None
+        self.thread = None
+        self.stream_ready = threading.Event()
+        self.pending = {}  # clientOid -> 記録（submit 時刻、約定 future など）
+        self.latencies = deque(maxlen=LATENCY_HISTORY)  # 直近の約定済み注文の記録
+        self._stream_task = None
+
+    # ---------- ライフサイクル ----------
+    def start(self, stream=True):
+        if self.loop is not None:
+            return self
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, name="order-executor", daemon=True)
+        self.thread.start()
+        if stream and self.api_key:
+            self._stream_task = asyncio.run_coroutine_threadsafe(self._stream(), self.loop)
+        return self
+
+    def stop(self):
+        if self.loop is None:
+            return
+        if self._stream_task:
+            self._stream_task.cancel()
+        asyncio.run_coroutine_threadsafe(self.exchange.close(), self.loop).result(timeout=10)
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join(timeout=10)
+        self.loop = None
+
+    def _run(self, coro, timeout=30):
+        return asyncio.run_coroutine_threadsafe(coro, self.loop).result(timeout=timeout)
+
+    # ---------- 発注（同期 API。受付応答まで待ち、約定は待たない） ----------
+    def submit(self, symbol, side, amount, params=None):
+        return self._run(self.submit_async(symbol, side, amount, params))
+
+    def flip(self, symbol, side, size, params=None, held=None):
+        return self._run(self.flip_async(symbol, side, size, params, held))
+
+    def wait_fill(self, client_oid, timeout=FILL_TIMEOUT_SEC * 2):
+        return self._run(self._wait_fill(client_oid), timeout=timeout)
+
+    # ---------- 発注（非同期 API） ----------
+    def _track(self, symbol, side, amount):
+        cid = uuid.uuid4().hex
+        self.pending[cid] = {
+            "client_oid": cid,
+            "symbol": symbol,
+            "side": side,
+            "amount": amount,
+            "submit": time.perf_counter(),
+            "filled": self.loop.create_future(),
+        }
+        return cid
+
+    async def submit_async(self, symbol, side, amount, params=None):
+        params = dict(params or {})
+        cid = self._track(symbol, side, amount)
+        params["clientOrderId"] = cid
+        try:
+            order = await self.exchange.create_order(symbol, "market", side, amount, params=params)
+        except Exception:
+            self.pending.pop(cid, None)  # 受け付けられなかった注文は追跡しない
+            raise
+        self._on_ack(cid, order)
+        return order
+
+    async def flip_async(self, symbol, side, size, params=None, held=None):
+        # ドテン: 単方向モードでは反対売買 held + size の 1 注文で決済と新規が同時に成立する。
+        # held（実際の保有枚数）が分からなければ、部分約定や突き合わせで枚数がずれていても
+        # 残りや行き過ぎが出ないよう reduceOnly の決済 + 新規の一括注文にする
+        params = dict(params or {})
+        params.pop("reduceOnly", None)
+        if self.flip_mode != "batch" and held is not None:
+            return await self.submit_async(symbol, side, held + size, params)
+        close_size = held if held is not None else size
+        close_cid = self._track(symbol, side, close_size)
+        open_cid = self._track(symbol, side, size)
+        try:
+            orders = await self.exchange.create_orders([
+                {"symbol": symbol, "type": "market", "side": side, "amount": close_size, "params": {**params, "reduceOnly": True, "clientOrderId": close_cid}},
+                {"symbol": symbol, "type": "market", "side": side, "amount": size, "params": {**params, "clientOrderId": open_cid}},
+            ])
+        except Exception:
+            self.pending.pop(close_cid, None)
+            self.pending.pop(open_cid, None)
+            raise
+        for cid, order in zip((close_cid, open_cid), orders):
+            self._on_ack(cid, order)
+        return orders[-1]
+
+    def _on_ack(self, cid, order):
+        rec = self.pending.get(cid)
+        if rec is None:
+            return
+        rec["ack"] = time.perf_counter()
+        rec["order_id"] = order.get("id")
+        metrics.observe("order_ack_seconds", rec["ack"] - rec["submit"])
+        # WS が落ちていても FILL_TIMEOUT_SEC 後に REST で確認する
+        self.loop.call_later(FILL_TIMEOUT_SEC, lambda: asyncio.ensure_future(self._poll_fill(cid)))
+
+    async def _wait_fill(self, cid):
+        rec = self.pending.get(cid)
+        if rec is None:
+            return next((r for r in self.latencies if r["client_oid"] == cid), None)
+        return await asyncio.shield(rec["filled"])
+
+    def _on_fill(self, cid, price=None, source="ws"):
+        rec = self.pending.pop(cid, None)
+        if rec is None:
+            return
+        now = time.perf_counter()
+        result = {
+            "client_oid": cid,
+            "order_id": rec.get("order_id"),
+            "symbol": rec["symbol"],
+            "side": rec["side"],
+            "amount": rec["amount"],
+            "price": price,
+            "ack_ms": (rec["ack"] - rec["submit"]) * 1000 if "ack" in rec else None,
+            "fill_ms": (now - rec["submit"]) * 1000,
+            "source": source,
+        }
+        self.latencies.append(result)
+        metrics.observe("order_fill_seconds", now - rec["submit"])
+        metrics.inc(f"order_fills_{source}_total")
+        ack = f"{result['ack_ms']:.1f}ms" if result["ack_ms"] is not None else "-"
+        self.log(f"[FILL] {rec['side'].upper()} {rec['amount']}枚 id={result['order_id']} price={price} submit→ack={ack} submit→fill={result['fill_ms']:.1f}ms ({source})")
+        if not rec["filled"].done():
+            rec["filled"].set_result(result)
+
+    async def _poll_fill(self, cid):
+        rec = self.pending.get(cid)
+        if rec is None or not rec.get("order_id"):
+            return
+        try:
+            order = await self.exchange.fetch_order(rec["order_id"], rec["symbol"])
+        except Exception as e:
+            self.log(f"[ERROR] fetch_order {rec['order_id']}: {e}")
+            return
+        if order.get("status") == "closed":
+            self._on_fill(cid, order.get("average"), source="rest")
+
+    # ---------- プライベート WS（orders チャンネル） ----------
+    async def _stream(self):
+        attempt = 0
+        async with aiohttp.ClientSession() as session:
+            while True:
+                try:
+                    async with session.ws_connect(self.ws_url) as ws:
+                        await ws.send_str(json.dumps(login_message(self.api_key, self.secret, self.passphrase)))
+                        ping = asyncio.create_task(self._ping(ws))
+                        try:
+                            async for msg in ws:
+                                if msg.type != aiohttp.WSMsgType.TEXT:
+                                    break
+                                if await self._on_text(ws, msg.data):
+                                    attempt = 0
+                        finally:
+                            ping.cancel()
+                            self.stream_ready.clear()
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    self.log(f"[WS-PRIVATE] {e}")
+                # 再接続の前に、待っている注文は REST で確認しておく
+                for cid in list(self.pending):
+                    await self._poll_fill(cid)
+                await asyncio.sleep(min(RECONNECT_MAX_SEC, 2 ** attempt))
+                attempt += 1
+
+    async def _ping(self, ws):
+        while True:
+            await asyncio.sleep(PING_INTERVAL_SEC)
+            await ws.send_str("ping")
+
+    async def _on_text(self, ws, text):
+        if text == "pong":
+            return False
+        msg = json.loads(text)
+        event = msg.get("event")
+        if event == "login":
+            if str(msg.get("code")) != "0":
+                raise RuntimeError(f"login failed: {msg}")
+            await ws.send_str(json.dumps({"op": "subscribe", "args": [{"instType": self.inst_type, "channel": "orders", "instId": "default"}]}))
+            return False
+        if event == "subscribe":
+            self.stream_ready.set()
+            return True
+        if event == "error":
+            raise RuntimeError(f"WS error: {msg}")
+        if msg.get("arg", {}).get("channel") == "orders":
+            for row in msg.get("data") or []:
+                if row.get("status") == "filled":
+                    price = float(row["priceAvg"]) if row.get("priceAvg") else None
+                    self._on_fill(row.get("clientOid"), price)
+        return False
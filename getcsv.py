@@ -1,17 +1,27 @@
+import asyncio
 import ccxt
-import pandas as pd
 import time
-from datetime import datetime
 import os
 import math
 from tqdm import tqdm
+import candle_store
+import async_fetch
+import resample
+import universe
+import validate
 
 # ====== 設定 ======
-TIMEFRAME = "5m"
+TIMEFRAME = resample.BASE_TIMEFRAME  # 基準足だけを保存し、上位足は読み込み時に合成する
 LOOKBACK_DAYS = 100
 TOP_N = 30
+UNIVERSE_TYPE = universe.DEFAULT_TYPE  # 出来高上位を選ぶ市場（"swap" ならライブの engine.py と同じ USDT 無期限）
 LIMIT = 500  # ccxt fetch_ohlcv limit
-FORCE = False  # 既存CSVを上書きするなら True にする
+FORCE = False  # 既存データを上書きするなら True にする
+STORE_FORMAT = candle_store.STORE_FORMAT  # 保存先ストア（candle_store.STORES のキー）
+INCREMENTAL = True  # 既存データがあれば末尾だけ追記取得する（False なら従来どおりスキップ）
+MAX_GAP_BACKFILL = 10  # 1 回の同期で埋めにいく欠損区間の上限
+ASYNC_DOWNLOAD = True  # ccxt.async_support で複数銘柄を並列取得する
+CONCURRENCY = async_fetch.CONCURRENCY  # 同時に取得する銘柄数
 
 exchange = ccxt.bitget({
     "enableRateLimit": True,
@@ -27,31 +37,18 @@ def _timeframe_minutes(tf: str) -> int:
         return int(tf[:-1]) * 60 * 24
     return 1
 
-def get_top_usdt_pairs(n=30):
-    tickers = exchange.fetch_tickers()
-    candidates = []
-    for sym, t in tickers.items():
-        if "/USDT" not in sym:
-            continue
-        # レバ・合成トークンっぽいのは除外
-        up = sym.upper()
-        if any(x in up for x in ("UP", "DOWN", "BULL", "BEAR", "3L", "3S")):
-            continue
-        vol = t.get("quoteVolume") or t.get("baseVolume") or 0
-        try:
-            vol = float(vol)
-        except Exception:
-            vol = 0
-        candidates.append((sym, vol))
-    candidates.sort(key=lambda x: x[1], reverse=True)
-    return [c[0] for c in candidates[:n]]
+def get_top_usdt_pairs(n=30, market_type=UNIVERSE_TYPE):
+    # 市場の索引と出来高は data/universe.json にキャッシュされ、TTL 内なら取引所に問い合わせない。
+    # レバレッジトークンは接尾辞を外した base が実在するものだけ除外する（SUPER / JUP は残る）
+    return universe.get_universe(exchange).top(n, market_type)
 
-def fetch_ohlcv_all(symbol, timeframe, days, show_progress=True):
+def fetch_ohlcv_range(symbol, timeframe, since, until=None, show_progress=True, expected=None):
+    # since から（until 指定時はそこまで）ページングで取得する
     all_data = []
-    now = exchange.milliseconds()
-    since = now - days * 24 * 60 * 60 * 1000
-    minutes = _timeframe_minutes(timeframe)
-    expected = max(1, math.ceil(days * 24 * 60 / minutes))
+    tf_ms = _timeframe_minutes(timeframe) * 60 * 1000
+    if expected is None:
+        end = until if until is not None else exchange.milliseconds()
+        expected = max(1, math.ceil((end - since) / tf_ms))
 
     pbar = tqdm(total=expected, desc=f"fetch {symbol}", unit="candle", leave=True) if show_progress else None
 
@@ -68,34 +65,79 @@ def fetch_ohlcv_all(symbol, timeframe, days, show_progress=True):
         if pbar:
             pbar.update(len(ohlcv))
         since = ohlcv[-1][0] + 1
-        time.sleep(max(0, exchange.rateLimit / 1000))
-        # 最新に到達したら終了
-        if pd.to_datetime(ohlcv[-1][0], unit="ms") >= datetime.utcnow():
+        # 指定範囲の終端、または形成中の最新足に到達したら終了
+        if until is not None and ohlcv[-1][0] >= until:
             break
+        if ohlcv[-1][0] + tf_ms > exchange.milliseconds():
+            break
+        time.sleep(max(0, exchange.rateLimit / 1000))
 
     if pbar:
         pbar.close()
     return all_data
 
-def save_symbol_csv(symbol):
-    safe = symbol.replace("/", "_")
-    fname = f"{safe}_{TIMEFRAME}_{LOOKBACK_DAYS}d.csv"
-    if os.path.exists(fname) and not FORCE:
-        return fname, False
+def fetch_ohlcv_all(symbol, timeframe, days, show_progress=True):
+    now = exchange.milliseconds()
+    since = now - days * 24 * 60 * 60 * 1000
+    minutes = _timeframe_minutes(timeframe)
+    expected = max(1, math.ceil(days * 24 * 60 / minutes))
+    return fetch_ohlcv_range(symbol, timeframe, since, show_progress=show_progress, expected=expected)
+
+def save_symbol(symbol, store=None):
+    store = store or candle_store.get_store(STORE_FORMAT)
+    path = store.path(symbol, TIMEFRAME)
+    if store.exists(symbol, TIMEFRAME) and not FORCE:
+        return path, False
     ohlcv = fetch_ohlcv_all(symbol, TIMEFRAME, LOOKBACK_DAYS, show_progress=True)
     if not ohlcv:
         raise RuntimeError(f"{symbol} の OHLCV が取得できませんでした")
-    df = pd.DataFrame(ohlcv, columns=["timestamp", "open", "high", "low", "close", "volume"])
-    df["timestamp"] = pd.to_datetime(df["timestamp"], unit="ms")
-    df.to_csv(fname, index=False)
-    return fname, True
+    # ページの継ぎ目の重複・順序を直してから保存する（外れ値・欠損は報告のみ）
+    arrays, report = validate.validate(candle_store.arrays_from_ohlcv(ohlcv), TIMEFRAME)
+    if validate.issues(report):
+        tqdm.write(f"[DATA] {symbol}: {validate.issues(report)}")
+    store.save(symbol, TIMEFRAME, arrays)
+    return path, True
+
+def sync_symbol(symbol, store=None):
+    # 保存済みの最終足から末尾だけ取得して追記する。途中の欠損も 1 回ずつ埋めにいき、
+    # 1 本も返らなかった欠損は記録して次回からは取りに行かない。(パス, 書き込んだ行数, 取りに行った欠損数) を返す
+    store = store or candle_store.get_store(STORE_FORMAT)
+    if not store.exists(symbol, TIMEFRAME):
+        path, _ = save_symbol(symbol, store)
+        return path, len(store.read_arrays(symbol, TIMEFRAME)["timestamp"]), 0
+    tf_ms = _timeframe_minutes(TIMEFRAME) * 60 * 1000
+    stored = store.read_arrays(symbol, TIMEFRAME)
+    known = store.empty_gaps(symbol, TIMEFRAME)
+    gaps = [g for g in candle_store.find_gaps(stored["timestamp"], tf_ms) if g not in known][:MAX_GAP_BACKFILL]
+
+    # 最終足は未確定だった可能性があるので、その足から取り直す（重複は append で新しい方を残す）
+    ohlcv = fetch_ohlcv_range(symbol, TIMEFRAME, int(stored["timestamp"][-1]), show_progress=False)
+    empty = []
+    for start, end in gaps:
+        rows = fetch_ohlcv_range(symbol, TIMEFRAME, start + tf_ms, until=end - tf_ms, show_progress=False)
+        if not any(start < row[0] < end for row in rows):
+            empty.append((start, end))
+        ohlcv += rows
+    written = store.append(symbol, TIMEFRAME, candle_store.arrays_from_ohlcv(ohlcv)) if ohlcv else 0
+    if empty:
+        store.add_empty_gaps(symbol, TIMEFRAME, empty)
+    return store.path(symbol, TIMEFRAME), written, len(gaps)
 
 def main():
     os.chdir(os.path.dirname(os.path.abspath(__file__)))
     symbols = get_top_usdt_pairs(TOP_N)
+    store = candle_store.get_store(STORE_FORMAT)
+    if ASYNC_DOWNLOAD:
+        targets = symbols if (INCREMENTAL or FORCE) else [s for s in symbols if not store.exists(s, TIMEFRAME)]
+        asyncio.run(async_fetch.download_all(targets, store, TIMEFRAME, LOOKBACK_DAYS, limit=LIMIT, max_gaps=MAX_GAP_BACKFILL, force=FORCE, concurrency=CONCURRENCY))
+        return
     for sym in tqdm(symbols, desc="銘柄取得/保存", unit="symbol"):
         try:
-            fname, saved = save_symbol_csv(sym)
+            if INCREMENTAL and not FORCE:
+                fname, written, gaps = sync_symbol(sym, store)
+                tqdm.write(f"Synced: {fname} ({written} rows written, gaps fetched={gaps})")
+                continue
+            fname, saved = save_symbol(sym, store)
             if saved:
                 tqdm.write(f"Saved: {fname}")
             else:
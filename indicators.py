@@ -0,0 +1,255 @@
+import numpy as np
+
+# numba があれば JIT、無ければ純 Python ループ（list 上）にフォールバック
+try:
+    from numba import njit
+except ImportError:
+    njit = None
+
+USE_JIT = njit is not None
+
+
+# ====== ATR（ta.volatility.AverageTrueRange と同一の計算） ======
+def _atr_loop(tr, atr, window):
+    for i in range(window, len(atr)):
+        atr[i] = (atr[i - 1] * (window - 1) + tr[i]) / float(window)
+
+
+def true_range(high, low, close):
+    high = np.asarray(high, dtype=np.float64)
+    low = np.asarray(low, dtype=np.float64)
+    close = np.asarray(close, dtype=np.float64)
+    tr = high - low
+    if len(tr) > 1:
+        prev_close = close[:-1]
+        tr[1:] = np.fmax(np.fmax(tr[1:], np.abs(high[1:] - prev_close)), np.abs(low[1:] - prev_close))
+    return tr
+
+
+def atr(high, low, close, period):
+    # ta と同じく先頭 period-1 本は 0、period-1 本目は単純平均、以降は Wilder 平滑
+    tr = true_range(high, low, close)
+    out = np.zeros(len(tr))
+    out[period - 1] = tr[0:period].mean()
+    if USE_JIT:
+        _atr_loop_jit(tr, out, period)
+    else:
+        vals = out.tolist()
+        _atr_loop(tr.tolist(), vals, period)
+        out = np.array(vals, dtype=np.float64)
+    return out
+
+
+# ====== SuperTrend カーネル ======
+def _supertrend_loop(close, upper, lower, trend):
+    # upper / lower / trend をその場で更新する
+    for i in range(1, len(close)):
+        if close[i] > upper[i - 1]:
+            trend[i] = True
+        elif close[i] < lower[i - 1]:
+            trend[i] = False
+        else:
+            trend[i] = trend[i - 1]
+            if trend[i] and lower[i] < lower[i - 1]:
+                lower[i] = lower[i - 1]
+            if not trend[i] and upper[i] > upper[i - 1]:
+                upper[i] = upper[i - 1]
+
+
+if USE_JIT:
+    _atr_loop_jit = njit(cache=True)(_atr_loop)
+    _supertrend_loop_jit = njit(cache=True)(_supertrend_loop)
+
+
+def supertrend_kernel(close, upper, lower):
+    # close / 初期バンド（ndarray）から trend, upper, lower を返す。入力は書き換えない
+    close = np.asarray(close, dtype=np.float64)
+    upper = np.array(upper, dtype=np.float64)
+    lower = np.array(lower, dtype=np.float64)
+    n = len(close)
+    if USE_JIT:
+        trend = np.ones(n, dtype=np.bool_)
+        _supertrend_loop_jit(close, upper, lower, trend)
+        return trend, upper, lower
+    c, u, lo, t = close.tolist(), upper.tolist(), lower.tolist(), [True] * n
+    _supertrend_loop(c, u, lo, t)
+    return np.array(t, dtype=np.bool_), np.array(u, dtype=np.float64), np.array(lo, dtype=np.float64)
+
+
+def supertrend(high, low, close, period, multiplier):
+    high = np.asarray(high, dtype=np.float64)
+    low = np.asarray(low, dtype=np.float64)
+    close = np.asarray(close, dtype=np.float64)
+    hl2 = (high + low) / 2
+    a = atr(high, low, close, period)
+    return supertrend_kernel(close, hl2 + (multiplier * a), hl2 - (multiplier * a))
+
+
+# ====== パラメータグリッド用（同一 period の全 multiplier を一括計算） ======
+def _supertrend_grid_loop(close, upper, lower, trend):
+    # numba 用。行ごとに _supertrend_loop と同じ漸化式
+    for r in range(upper.shape[0]):
+        for i in range(1, len(close)):
+            if close[i] > upper[r, i - 1]:
+                trend[r, i] = True
+            elif close[i] < lower[r, i - 1]:
+                trend[r, i] = False
+            else:
+                trend[r, i] = trend[r, i - 1]
+                if trend[r, i] and lower[r, i] < lower[r, i - 1]:
+                    lower[r, i] = lower[r, i - 1]
+                if not trend[r, i] and upper[r, i] > upper[r, i - 1]:
+                    upper[r, i] = upper[r, i - 1]
+
+
+if USE_JIT:
+    _supertrend_grid_loop_jit = njit(cache=True)(_supertrend_grid_loop)
+
+
+def supertrend_grid(high, low, close, period, multipliers):
+    # ATR は period ごとに 1 回だけ計算し、(multiplier × bars) の 2 次元配列で返す
+    high = np.asarray(high, dtype=np.float64)
+    low = np.asarray(low, dtype=np.float64)
+    close = np.asarray(close, dtype=np.float64)
+    mults = np.asarray(multipliers, dtype=np.float64)[:, None]
+    hl2 = (high + low) / 2
+    a = atr(high, low, close, period)
+    upper = hl2 + (mults * a)
+    lower = hl2 - (mults * a)
+    trend = np.ones(upper.shape, dtype=np.bool_)
+    if USE_JIT:
+        _supertrend_grid_loop_jit(close, upper, lower, trend)
+        return trend, upper, lower
+    # 純 Python では行ごとに list カーネルを回す方が 2 次元の numpy 逐次演算より速い
+    c = close.tolist()
+    for r in range(len(mults)):
+        t, u, lo = [True] * len(c), upper[r].tolist(), lower[r].tolist()
+        _supertrend_loop(c, u, lo, t)
+        trend[r], upper[r], lower[r] = t, u, lo
+    return trend, upper, lower
+
+
+# ====== ポートフォリオ用（銘柄 × multiplier を一括計算） ======
+def _supertrend_panel_loop(close, upper, lower, trend):
+    # numba 用。close は (symbols × bars)、upper / lower / trend は (multipliers × symbols × bars)
+    for m in range(upper.shape[0]):
+        for s in range(upper.shape[1]):
+            for i in range(1, close.shape[1]):
+                if close[s, i] > upper[m, s, i - 1]:
+                    trend[m, s, i] = True
+                elif close[s, i] < lower[m, s, i - 1]:
+                    trend[m, s, i] = False
+                else:
+                    trend[m, s, i] = trend[m, s, i - 1]
+                    if trend[m, s, i] and lower[m, s, i] < lower[m, s, i - 1]:
+                        lower[m, s, i] = lower[m, s, i - 1]
+                    if not trend[m, s, i] and upper[m, s, i] > upper[m, s, i - 1]:
+                        upper[m, s, i] = upper[m, s, i - 1]
+
+
+if USE_JIT:
+    _supertrend_panel_loop_jit = njit(cache=True)(_supertrend_panel_loop)
+
+
+def supertrend_panel(high, low, close, period, multipliers):
+    # 時刻を揃えた (symbols × bars) の配列から (multipliers × symbols × bars) を返す。
+    # trend[m, s] は supertrend_grid(銘柄 s, multipliers)[m] と同じ値
+    high = np.asarray(high, dtype=np.float64)
+    low = np.asarray(low, dtype=np.float64)
+    close = np.asarray(close, dtype=np.float64)
+    a = np.vstack([atr(high[s], low[s], close[s], period) for s in range(close.shape[0])])
+    mults = np.asarray(multipliers, dtype=np.float64)[:, None, None]
+    hl2 = (high + low) / 2
+    upper = hl2 + (mults * a)
+    lower = hl2 - (mults * a)
+    trend = np.ones(upper.shape, dtype=np.bool_)
+    if USE_JIT:
+        _supertrend_panel_loop_jit(close, upper, lower, trend)
+        return trend, upper, lower
+    for s in range(close.shape[0]):
+        c = close[s].tolist()
+        for m in range(upper.shape[0]):
+            t, u, lo = [True] * len(c), upper[m, s].tolist(), lower[m, s].tolist()
+            _supertrend_loop(c, u, lo, t)
+            trend[m, s], upper[m, s], lower[m, s] = t, u, lo
+    return trend, upper, lower
+
+
+# ====== ライブ用のインクリメンタル SuperTrend（1 本あたり O(1)） ======
+class StreamingSuperTrend:
+    # 確定足（closed=True）で状態を進め、形成中の足（closed=False）は状態を変えずに暫定値だけ返す。
+    # 同じ系列を全て確定足として流すと supertrend() のバッチ計算と同じ結果になる。
+    def __init__(self, period, multiplier):
+        self.period = period
+        self.multiplier = multiplier
+        self.count = 0
+        self.prev_close = None
+        self.atr = 0.0
+        self.upper = None
+        self.lower = None
+        self.trend = True
+        self.last_timestamp = None
+        self._warmup_tr = []
+
+    def seed(self, high, low, close, timestamps=None):
+        # 履歴（全て確定足）から状態を作る。十分な本数があればバッチ計算で一気に進める
+        high = np.asarray(high, dtype=np.float64)
+        low = np.asarray(low, dtype=np.float64)
+        close = np.asarray(close, dtype=np.float64)
+        if self.count > 0 or len(close) < self.period:
+            for i in range(len(close)):
+                self.update(high[i], low[i], close[i], closed=True, timestamp=None if timestamps is None else timestamps[i])
+            return self
+        a = atr(high, low, close, self.period)
+        hl2 = (high + low) / 2
+        trend, upper, lower = supertrend_kernel(close, hl2 + (self.multiplier * a), hl2 - (self.multiplier * a))
+        self.count = len(close)
+        self.prev_close = float(close[-1])
+        self.atr = float(a[-1])
+        self.upper = float(upper[-1])
+        self.lower = float(lower[-1])
+        self.trend = bool(trend[-1])
+        self.last_timestamp = None if timestamps is None else timestamps[-1]
+        self._warmup_tr = []
+        return self
+
+    def _step(self, high, low, close):
+        # 確定状態から 1 本進めた (atr, upper, lower, trend, warmup_tr) を返す（self は変更しない）
+        high, low, close = float(high), float(low), float(close)
+        if self.prev_close is None:
+            tr = high - low
+        else:
+            tr = max(high - low, abs(high - self.prev_close), abs(low - self.prev_close))
+        i = self.count
+        warmup = self._warmup_tr
+        if i < self.period:
+            warmup = warmup + [tr]
+            a = float(np.array(warmup).mean()) if i == self.period - 1 else 0.0
+        else:
+            a = (self.atr * (self.period - 1) + tr) / float(self.period)
+        hl2 = (high + low) / 2
+        upper = hl2 + (self.multiplier * a)
+        lower = hl2 - (self.multiplier * a)
+        if i == 0:
+            return a, upper, lower, True, warmup
+        if close > self.upper:
+            trend = True
+        elif close < self.lower:
+            trend = False
+        else:
+            trend = self.trend
+            if trend and lower < self.lower:
+                lower = self.lower
+            if not trend and upper > self.upper:
+                upper = self.upper
+        return a, upper, lower, trend, warmup
+
+    def update(self, high, low, close, closed=True, timestamp=None):
+        a, upper, lower, trend, warmup = self._step(high, low, close)
+        if closed:
+            self.count += 1
+            self.prev_close = float(close)
+            self.atr, self.upper, self.lower, self.trend = a, upper, lower, trend
+            self._warmup_tr = warmup if self.count < self.period else []
+            self.last_timestamp = timestamp
+        return trend
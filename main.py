@@ -1,10 +1,16 @@
 import os
 import time
-import math
+import asyncio
 import traceback
 import ccxt
-import pandas as pd
-import ta
+import indicators
+import ws_feed
+import scheduler
+import market_cache
+import execution
+import state_store
+import metrics
+import resample
 from datetime import datetime
 from dotenv import load_dotenv
 
@@ -15,10 +21,21 @@ user_symbol_hint = "PI/USDT"
 TIMEFRAME = "5m"
 ATR_PERIOD = 21
 MULTIPLIER = 6.3
-POLL_INTERVAL_SEC = 5
+POLL_INTERVAL_SEC = 5  # WS モードの [TICK] ログ間隔
+SETTLE_DELAY_SEC = 2.0  # 足の境界から確定データを取りに行くまでの待ち時間
+INTRABAR_EVAL_SEC = None  # 足の途中でも評価する間隔（秒、REST / WS 共通）。None なら確定足でのみ判断
+SEED_LIMIT = 200  # 起動時（取りこぼし時）に取得する履歴本数
+STREAM_FETCH_LIMIT = 3  # 毎ティック取得する本数（直近の確定足 + 形成中の足）
+MARKET_DATA_MODE = os.getenv("MARKET_DATA_MODE", "rest")  # "rest"（ポーリング） / "ws"（WebSocket ストリーム）
 TEST_MODE = False
 CONST_JPY = 150  # JPY/USDTの固定値
-TARGET_JPY = float(os.getenv("TARGET_JPY", "")) # 日本円ベースのポジション金額
+TARGET_JPY = float(os.getenv("TARGET_JPY") or 0) # 日本円ベースのポジション金額
+MARKET_CACHE_PATH = market_cache.CACHE_PATH  # 解決済みシンボル・contractSize・precision のキャッシュ
+MARKET_CACHE_TTL_SEC = market_cache.CACHE_TTL_SEC  # 期限切れ後は古い値で起動しつつ裏で更新
+EXECUTION_MODE = os.getenv("EXECUTION_MODE", "sync")  # "sync"（ccxt 同期・ドテンは 2 注文） / "async"（execution.OrderExecutor）
+FLIP_MODE = execution.FLIP_MODE  # async 時のドテン: "single"（保有枚数 + 枚数の 1 注文） / "batch"（一括注文）
+STATE_PATH = os.getenv("STATE_PATH", state_store.STATE_PATH)  # ポジション・発注中の注文・最終確定足の保存先
+RECONCILE_INTERVAL_SEC = state_store.RECONCILE_INTERVAL_SEC  # fetch_positions で突き合わせる間隔
 
 BITGET_API_KEY = os.getenv("BITGET_API_KEY", "")
 BITGET_SECRET = os.getenv("BITGET_SECRET", "")
@@ -35,20 +52,30 @@ exchange = ccxt.bitget({
         "createMarketBuyOrderRequiresPrice": False,
     },
 })
+# METRICS=1 のときだけ計測付きに差し替える（throttle の所要時間 = レート制限による待ち）
+metrics.instrument(exchange, "fetch_ohlcv", "fetch_ohlcv_seconds")
+metrics.instrument(exchange, "throttle", "ratelimit_wait_seconds")
 
 # ========= ログ出力 =========
 def log(msg):
     now = datetime.utcnow().strftime("%Y-%m-%d %H:%M:%S")
     print(f"[{now} UTC] {msg}", flush=True)
 
-# ========= 汎用関数 =========
-def round_to_precision(amount: float, precision: int):
-    if precision is None:
-        return amount
-    factor = 10 ** precision
-    return math.floor(amount * factor) / factor
-
 # ========= 市場データ取得 =========
+def fetch_candles(symbol, timeframe=TIMEFRAME, since=None, limit=None, aggregator=None):
+    # 取引所に無い timeframe（10m / 8h など）は割り切れる最大の足を同じ期間分だけ取得して合成する。
+    # aggregator（resample.CandleAggregator）を渡すと、取得した元の足で形成中の足の状態も作る
+    source = resample.source_timeframe(timeframe, exchange.timeframes)
+    if source == timeframe:
+        return exchange.fetch_ohlcv(symbol, timeframe, since, limit)
+    ratio = resample.timeframe_ms(timeframe) // resample.timeframe_ms(source)
+    if since is not None:
+        since -= since % resample.timeframe_ms(timeframe)
+    raw = exchange.fetch_ohlcv(symbol, source, since, min(resample.FETCH_MAX, (limit + 1) * ratio) if limit else None)
+    if aggregator is not None:
+        aggregator.seed(raw)
+    return resample.resample_ohlcv(raw, timeframe, source)
+
 def fetch_last_price(symbol: str) -> float:
     t = exchange.fetch_ticker(symbol)
     last = t.get("last") or t.get("close")
@@ -63,8 +90,10 @@ def fetch_last_price(symbol: str) -> float:
     return float(last)
 
 # ========= 契約数計算 =========
-def get_contracts_from_jpy(symbol: str, target_jpy: float):
-    last_price = fetch_last_price(symbol)
+def get_contracts_from_jpy(symbol: str, target_jpy: float, last_price: float = None):
+    # 価格はローソク足の終値を渡せばティッカー取得を省略できる
+    if last_price is None:
+        last_price = fetch_last_price(symbol)
 
     # 固定レートでJPY→USDT変換
     jpy_per_usdt = CONST_JPY
@@ -72,121 +101,345 @@ def get_contracts_from_jpy(symbol: str, target_jpy: float):
 
     market = exchange.market(symbol)
     contract_size = market.get("contractSize", 1) or 1
-    amount_prec = market.get("precision", {}).get("amount")
 
-    contracts = round_to_precision(target_usdt / (last_price * contract_size), amount_prec)
+    # precision は取引所の precisionMode（bitget は TICK_SIZE）に従って切り捨て
+    contracts = float(exchange.amount_to_precision(symbol, target_usdt / (last_price * contract_size)))
 
     log(f"[INFO] {target_jpy}JPY ≈ {target_usdt:.4f}USDT → {contracts}枚 (価格={last_price}USDT)")
     return contracts
 
+def get_contracts(symbol: str, last_price: float = None):
+    # 最初の発注判断のときに 1 回だけ計算する
+    global CONTRACTS
+    if CONTRACTS is None:
+        CONTRACTS = get_contracts_from_jpy(symbol, TARGET_JPY, last_price)
+    return CONTRACTS
+
 # ========= シンボル確認 =========
+_market_cache = None
+
+def get_market_cache():
+    global _market_cache
+    if _market_cache is None:
+        # キャッシュ更新は認証不要の別インスタンスで行う（取引用の exchange とは独立）
+        loader = lambda: ccxt.bitget({"options": {"defaultType": "swap"}}).load_markets()
+        _market_cache = market_cache.MarketCache(loader, MARKET_CACHE_PATH, MARKET_CACHE_TTL_SEC)
+    return _market_cache
+
 def ensure_symbol_swap(sym_hint: str) -> str:
-    markets = exchange.load_markets()
-    if sym_hint in markets and markets[sym_hint].get("type") == "swap":
-        return sym_hint
-    parts = sym_hint.replace("-", "/").split("/")
-    base, quote = (parts[0], parts[1]) if len(parts) == 2 else (sym_hint, "USDT")
-    candidates = [
-        f"{base}USDT:USDT",
-        f"{base}{quote}:{quote}",
-        f"{base}/{quote}:USDT",
-    ]
-    for c in candidates:
-        if c in markets and markets[c].get("type") == "swap":
-            return c
-    for m in markets.values():
-        if m.get("type") == "swap" and m.get("base") == base and m.get("quote") == "USDT":
-            return m["symbol"]
-    raise ValueError(f"swap(USDT無期限)のシンボルが見つかりません: {sym_hint}")
+    # キャッシュ済みの market を exchange に登録し、load_markets の全件ダウンロードを避ける
+    entry = get_market_cache().get(sym_hint)
+    exchange.set_markets([entry["market"]])
+    return entry["symbol"]
+
+# ========= 永続状態 =========
+_state = None
+
+def get_state():
+    global _state
+    if _state is None:
+        _state = state_store.StateStore(STATE_PATH)
+    return _state
+
+def reconcile_positions(keys):
+    # keys: symbol -> 状態キー。fetch_positions 1 回で保存内容を取引所に合わせ、{key: (side, contracts)} を返す
+    store = get_state()
+    stale = store.pending_orders()
+    positions = exchange.fetch_positions(list(keys))
+    for key, before, after in store.reconcile(positions, keys):
+        log(f"[STATE] {key}: 保存={before} → 取引所={after} に補正")
+    if stale:
+        log(f"[STATE] 未完了の発注記録 {len(stale)} 件を取引所の状態で解消")
+    return {key: store.get_position(key) for key in keys.values()}
 
 # ========= 注文関数 =========
+_executor = None
+
+def get_executor():
+    # async 発注用。専用スレッドのイベントループと約定確認のプライベート WS を 1 回だけ起動する
+    global _executor
+    if _executor is None:
+        _executor = execution.OrderExecutor(BITGET_API_KEY, BITGET_SECRET, BITGET_PASSPHRASE, flip_mode=FLIP_MODE, log=log)
+        _executor.exchange.set_markets(list(exchange.markets.values()))
+        _executor.start()
+    return _executor
+
+@metrics.timed("place_market_seconds")
 def place_market(symbol: str, side: str, amount_contracts: float, reduce_only: bool=False):
     params = {}
     if reduce_only:
         params["reduceOnly"] = True
     params["posMode"] = "one_way"  # 単方向モード
     log(f"[ORDER] {side.upper()} {amount_contracts}枚 reduceOnly={reduce_only}")
-    order = exchange.create_order(symbol, type="market", side=side, amount=amount_contracts, params=params)
+    if EXECUTION_MODE == "async":
+        order = get_executor().submit(symbol, side, amount_contracts, params)
+    else:
+        order = exchange.create_order(symbol, type="market", side=side, amount=amount_contracts, params=params)
+    log(f"[ORDER-ID] {order.get('id')}")
+    return order
+
+def place_flip(symbol: str, side: str, amount_contracts: float, held: float=None):
+    # ドテン。held は決済する実際の保有枚数（不明なら None）。
+    # async では 1 リクエストで決済と新規を出し、途中失敗でポジションが中途半端に残らないようにする
+    if EXECUTION_MODE != "async":
+        place_market(symbol, side, held or amount_contracts, reduce_only=True)
+        return place_market(symbol, side, amount_contracts)
+    log(f"[ORDER] {side.upper()} {amount_contracts}枚 ドテン ({FLIP_MODE}, 保有={held})")
+    order = get_executor().flip(symbol, side, amount_contracts, {"posMode": "one_way"}, held=held)
     log(f"[ORDER-ID] {order.get('id')}")
     return order
 
 # ========= Supertrend計算 =========
+@metrics.timed("supertrend_seconds")
 def calculate_supertrend(df, period, multiplier):
-    hl2 = (df["high"] + df["low"]) / 2
-    atr = ta.volatility.AverageTrueRange(df["high"], df["low"], df["close"], window=period).average_true_range()
-    upperband = hl2 + (multiplier * atr)
-    lowerband = hl2 - (multiplier * atr)
-    supertrend = [True] * len(df)
-    for i in range(1, len(df)):
-        if df["close"].iloc[i] > upperband.iloc[i - 1]:
-            supertrend[i] = True
-        elif df["close"].iloc[i] < lowerband.iloc[i - 1]:
-            supertrend[i] = False
+    trend, _, _ = indicators.supertrend(df["high"].to_numpy(), df["low"].to_numpy(), df["close"].to_numpy(), period, multiplier)
+    return trend.tolist()
+
+def seed_supertrend(ohlcv, period=ATR_PERIOD, multiplier=MULTIPLIER):
+    # 最後の 1 本は形成中なので、それ以外の確定足で状態を作る
+    closed = ohlcv[:-1]
+    st = indicators.StreamingSuperTrend(period, multiplier)
+    return st.seed([c[2] for c in closed], [c[3] for c in closed], [c[4] for c in closed], [c[0] for c in closed])
+
+@metrics.timed("supertrend_update_seconds")
+def update_supertrend(st, ohlcv):
+    # 未反映の確定足をコミットし、形成中の足は暫定評価する。(last_trend, prev_trend) を返す。
+    # シードの確定足が 0 本（last_timestamp が None）なら全て未反映として扱う
+    for ts, _, high, low, close, _ in ohlcv[:-1]:
+        if st.last_timestamp is None or ts > st.last_timestamp:
+            st.update(high, low, close, closed=True, timestamp=ts)
+    ts, _, high, low, close, _ = ohlcv[-1]
+    if st.last_timestamp is not None and ts <= st.last_timestamp:
+        return st.trend, st.trend
+    return st.update(high, low, close, closed=False), st.trend
+
+def ws_trend(st, window, closed, last_eval, now):
+    # WS の足更新 1 回分の (last_trend, prev_trend, 最後に暫定評価した時刻) を返す。
+    # 足が確定した更新（と INTRABAR_EVAL_SEC 未指定のとき）は確定足のトレンドで判断し、
+    # 形成中の足は REST の BarScheduler と同じく INTRABAR_EVAL_SEC 間隔でだけ評価する（間の更新は last_trend=None で判断しない）
+    committed = st.trend
+    provisional, _ = update_supertrend(st, window)
+    if closed or not INTRABAR_EVAL_SEC:
+        return st.trend, committed, last_eval
+    if now - last_eval < INTRABAR_EVAL_SEC:
+        return None, st.trend, last_eval
+    return provisional, st.trend, now
+
+# ========= シグナル処理 =========
+def handle_signal(symbol, position, last_trend, last_price=None, contracts=None, state_key=None):
+    # トレンドに応じて発注し、新しいポジションを返す（contracts 省略時はグローバル設定から計算）。
+    # 発注前に記録を残し、完了時にポジションと一緒に確定させる（途中で落ちたら次の突き合わせで解消）
+    if position is not None and (position == "long") == last_trend:
+        return position
+    if contracts is None:
+        contracts = get_contracts(symbol, last_price)
+    store = get_state()
+    key = state_key or symbol
+    # 決済する枚数は保存済み（突き合わせで取引所に合わせた）の保有枚数。発注する枚数と違うこともある
+    stored_side, held = store.get_position(key)
+    held = held if stored_side == position else None
+    order_id = store.begin_order(key, symbol, "buy" if last_trend else "sell", contracts)
+    if position is None:
+        if last_trend:
+            log("[SIGNAL] 初回ロングエントリー")
+            place_market(symbol, "buy", contracts)
+            position = "long"
         else:
-            supertrend[i] = supertrend[i - 1]
-            if supertrend[i] and lowerband.iloc[i] < lowerband.iloc[i - 1]:
-                lowerband.iloc[i] = lowerband.iloc[i - 1]
-            if not supertrend[i] and upperband.iloc[i] > upperband.iloc[i - 1]:
-                upperband.iloc[i] = upperband.iloc[i - 1]
-    return supertrend
+            log("[SIGNAL] 初回ショートエントリー")
+            place_market(symbol, "sell", contracts)
+            position = "short"
+
+    elif position == "long" and not last_trend:
+        log("[SIGNAL] ロング決済 & ショートエントリー")
+        place_flip(symbol, "sell", contracts, held)
+        position = "short"
+
+    elif position == "short" and last_trend:
+        log("[SIGNAL] ショート決済 & ロングエントリー")
+        place_flip(symbol, "buy", contracts, held)
+        position = "long"
+    store.finish_order(order_id, key, symbol, position, contracts)
+    return position
 
 # ========= ライブ取引ループ =========
+def commit_closed(st, ohlcv, close_ms):
+    # close_ms より前に始まった足（= 確定済み）だけを反映する
+    for ts, _, high, low, close, _ in ohlcv:
+        if (st.last_timestamp is None or st.last_timestamp < ts) and ts < close_ms:
+            st.update(high, low, close, closed=True, timestamp=ts)
+
+def restore_position(symbol):
+    # 保存済みのポジションを取引所と突き合わせて復元する。保有中ならその枚数でドテンする
+    global CONTRACTS
+    position, held = reconcile_positions({symbol: symbol})[symbol]
+    if held:
+        CONTRACTS = held
+    last_ts = get_state().last_candle(symbol)
+    since = f", 最終確定足={datetime.utcfromtimestamp(last_ts / 1000):%Y-%m-%d %H:%M}" if last_ts else ""
+    log(f"[STATE] 復元: position={position} contracts={held}{since}")
+    return position
+
 def run_live_trading(symbol):
-    position = None
+    # 足の確定（境界 + SETTLE_DELAY_SEC）に合わせて起床し、確定足のトレンドで判断する。
+    # INTRABAR_EVAL_SEC を指定すると足の途中でも形成中の足で判断する
+    position = restore_position(symbol)
+    last_reconcile = time.monotonic()
+    st = None
+    tf_ms = exchange.parse_timeframe(TIMEFRAME) * 1000
+    sched = scheduler.BarScheduler(tf_ms, settle_sec=SETTLE_DELAY_SEC, intrabar_sec=INTRABAR_EVAL_SEC, server_time=exchange.fetch_time)
+    fetches = 0
     while True:
         try:
-            ohlcv = exchange.fetch_ohlcv(symbol, TIMEFRAME, limit=200)
-            df = pd.DataFrame(ohlcv, columns=["timestamp", "open", "high", "low", "close", "volume"])
-            df[["open", "high", "low", "close", "volume"]] = df[["open", "high", "low", "close", "volume"]].astype(float)
-
-            st = calculate_supertrend(df, ATR_PERIOD, MULTIPLIER)
-            last_trend, prev_trend = st[-1], st[-2]
-            last_price = df["close"].iloc[-1]
-
-            log(f"[TICK] price={last_price:.4f}, trend={'LONG' if last_trend else 'SHORT'}, prev={'LONG' if prev_trend else 'SHORT'}")
-
-            if position is None:
-                if last_trend:
-                    log("[SIGNAL] 初回ロングエントリー")
-                    place_market(symbol, "buy", CONTRACTS)
-                    position = "long"
+            t0 = None  # 起床後の処理時間（待ちを除く）
+            if st is None:
+                ohlcv = fetch_candles(symbol, TIMEFRAME, limit=SEED_LIMIT)
+                fetches += 1
+                st = seed_supertrend(ohlcv)
+                provisional, prev_trend = update_supertrend(st, ohlcv)
+                last_trend = provisional if INTRABAR_EVAL_SEC else st.trend
+            else:
+                kind, close_ms = sched.wait()
+                t0 = time.perf_counter()
+                if kind == "close":
+                    # 予定の起床時刻（境界 + settle）からの遅れ
+                    metrics.observe("loop_lag_seconds", max(0, sched.now_ms() - close_ms - sched.settle_ms) / 1000)
+                # 2 本目以降は直近数本だけ取得して O(1) で更新
+                ohlcv = fetch_candles(symbol, TIMEFRAME, limit=STREAM_FETCH_LIMIT)
+                fetches += 1
+                if st.last_timestamp is not None and ohlcv[0][0] > st.last_timestamp + tf_ms:
+                    log("[INFO] 確定足の取りこぼしを検知 → 再シード")
+                    st = None
+                    continue
+                if kind == "close":
+                    prev_trend = st.trend
+                    commit_closed(st, ohlcv, close_ms)
+                    last_trend = st.trend
+                    if st.last_timestamp is not None:
+                        get_state().set_last_candle(symbol, st.last_timestamp)
+                    if time.monotonic() - last_reconcile >= RECONCILE_INTERVAL_SEC:
+                        position = reconcile_positions({symbol: symbol})[symbol][0]
+                        last_reconcile = time.monotonic()
+                    log(f"[SCHED] bar close {datetime.utcfromtimestamp(close_ms / 1000):%H:%M} fetches/bar={fetches} clock_offset={sched.offset_ms}ms")
+                    fetches = 0
                 else:
-                    log("[SIGNAL] 初回ショートエントリー")
-                    place_market(symbol, "sell", CONTRACTS)
-                    position = "short"
-
-            elif position == "long" and not last_trend:
-                log("[SIGNAL] ロング決済 & ショートエントリー")
-                place_market(symbol, "sell", CONTRACTS, reduce_only=True)
-                place_market(symbol, "sell", CONTRACTS)
-                position = "short"
-
-            elif position == "short" and last_trend:
-                log("[SIGNAL] ショート決済 & ロングエントリー")
-                place_market(symbol, "buy", CONTRACTS, reduce_only=True)
-                place_market(symbol, "buy", CONTRACTS)
-                position = "long"
+                    last_trend, prev_trend = update_supertrend(st, ohlcv)
+            last_price = float(ohlcv[-1][4])
 
-            time.sleep(POLL_INTERVAL_SEC)
+            log(f"[TICK] price={last_price:.4f}, trend={'LONG' if last_trend else 'SHORT'}, prev={'LONG' if prev_trend else 'SHORT'}")
+            position = handle_signal(symbol, position, last_trend, last_price)
+            if t0 is not None:
+                metrics.observe("loop_body_seconds", time.perf_counter() - t0)
+            metrics.inc("ticks_total")
 
         except Exception as e:
             log(f"[ERROR] {e}")
             traceback.print_exc()
+            metrics.inc("errors_total")
+            last_reconcile = 0  # 発注途中の失敗に備えて次の確定足で突き合わせる
             time.sleep(5)
 
+# ========= WebSocket ライブ取引ループ =========
+async def run_live_trading_ws(symbol):
+    # 公開 WS の足更新ごとに評価する。再接続時の取りこぼしは REST で補完される
+    position = await asyncio.to_thread(restore_position, symbol)
+    last_reconcile = time.monotonic()
+    tf_ms = exchange.parse_timeframe(TIMEFRAME) * 1000
+    market = exchange.market(symbol)
+    queue = asyncio.Queue()
+    # 取引所に無い timeframe は元の足を購読し、受け取るたびに上位足へ畳み込む
+    source = resample.source_timeframe(TIMEFRAME, exchange.timeframes)
+    aggregator = resample.CandleAggregator(TIMEFRAME) if source != TIMEFRAME else None
+
+    async def gap_fill(since):
+        return await asyncio.to_thread(exchange.fetch_ohlcv, symbol, source, since, SEED_LIMIT)
+
+    async def reseed():
+        ohlcv = await asyncio.to_thread(fetch_candles, symbol, TIMEFRAME, None, SEED_LIMIT, aggregator)
+        return seed_supertrend(ohlcv), ohlcv[-2:]
+
+    feed = ws_feed.BitgetPublicFeed(market["id"], source, queue, inst_type="USDT-FUTURES" if market.get("swap") else "SPOT", gap_fill=gap_fill)
+    feed_task = asyncio.create_task(feed.run())
+    st, window = await reseed()  # window = [直近の確定足, 形成中の足]
+    last_price = float(window[-1][4])
+    last_log = 0.0
+    last_eval = 0.0  # 最後に形成中の足で判断した時刻
+    try:
+        while True:
+            kind, data = await queue.get()
+            t0 = time.perf_counter()
+            metrics.gauge("ws_queue_depth", queue.qsize())
+            try:
+                if kind == "error":
+                    log(f"[WS] 切断 → 再接続します: {data}")
+                    metrics.inc("ws_reconnects_total")
+                    continue
+                if kind == "ticker":
+                    last_price = data["last"] or last_price
+                    continue
+                if aggregator is not None:
+                    data = aggregator.update(data)
+                    if data is None:
+                        continue
+
+                forming = window[-1]
+                closed = data[0] > forming[0]
+                if data[0] < forming[0]:
+                    continue
+                if data[0] == forming[0]:
+                    window[-1] = data
+                elif data[0] > forming[0] + tf_ms:
+                    log("[INFO] 確定足の取りこぼしを検知 → 再シード")
+                    st, window = await reseed()
+                else:
+                    window = [forming, data]
+                    get_state().set_last_candle(symbol, forming[0])
+                    if time.monotonic() - last_reconcile >= RECONCILE_INTERVAL_SEC:
+                        position = (await asyncio.to_thread(reconcile_positions, {symbol: symbol}))[symbol][0]
+                        last_reconcile = time.monotonic()
+
+                now = time.monotonic()
+                last_trend, prev_trend, last_eval = ws_trend(st, window, closed, last_eval, now)
+                if last_trend is None:
+                    continue
+                if now - last_log >= POLL_INTERVAL_SEC or last_trend != prev_trend:
+                    log(f"[TICK] price={last_price:.4f}, trend={'LONG' if last_trend else 'SHORT'}, prev={'LONG' if prev_trend else 'SHORT'}")
+                    last_log = now
+                if position is None or (position == "long") != last_trend:
+                    position = await asyncio.to_thread(handle_signal, symbol, position, last_trend, last_price)
+                metrics.observe("loop_body_seconds", time.perf_counter() - t0)
+
+            except Exception as e:
+                log(f"[ERROR] {e}")
+                traceback.print_exc()
+                metrics.inc("errors_total")
+                last_reconcile = 0
+    finally:
+        feed.stop()
+        feed_task.cancel()
+
 # ========= main関数 =========
 def main():
     if not (BITGET_API_KEY and BITGET_SECRET and BITGET_PASSPHRASE):
         raise RuntimeError("APIキーが未設定です")
+    if TARGET_JPY <= 0:
+        raise RuntimeError("TARGET_JPY が未設定です")
     symbol = ensure_symbol_swap(user_symbol_hint)
-    if TEST_MODE:
-        log("TEST_MODE=True → 単発注文テストを実行")
-    else:
-        log(f"リアルタイム取引開始: {symbol}")
-        run_live_trading(symbol)
+    sampler = metrics.start()
+    try:
+        if TEST_MODE:
+            log("TEST_MODE=True → 単発注文テストを実行")
+        else:
+            log(f"リアルタイム取引開始: {symbol} (market data: {MARKET_DATA_MODE})")
+            if MARKET_DATA_MODE == "ws":
+                asyncio.run(run_live_trading_ws(symbol))
+            else:
+                run_live_trading(symbol)
+    finally:
+        if sampler:
+            sampler.stop()  # 終了時（Ctrl+C を含む）にプロファイルを書き出す
 
-# ========= 実行前に契約数計算 =========
-CONTRACTS = get_contracts_from_jpy(user_symbol_hint, TARGET_JPY)
+# 契約数は最初の発注判断時に get_contracts() で計算する（import 時に通信しない）
+CONTRACTS = None
 
 if __name__ == "__main__":
     main()
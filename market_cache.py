@@ -0,0 +1,102 @@
+import json
+import os
+import threading
+import time
+
+# ====== 市場メタデータの永続キャッシュ ======
+# load_markets（全銘柄のダウンロード）を毎回起動時に払わないよう、解決済みのシンボルと
+# ccxt の market 構造（contractSize / precision など）を JSON に保存しておく。
+# TTL を過ぎたエントリは即座に古い値を返しつつ、バックグラウンドで更新する。
+CACHE_PATH = os.path.join("data", "market_cache.json")
+CACHE_TTL_SEC = 24 * 60 * 60
+
+
+def resolve_swap_symbol(markets, sym_hint: str) -> str:
+    # "PI/USDT" などのヒントから USDT 無期限（swap）のシンボルを探す
+    if sym_hint in markets and markets[sym_hint].get("type") == "swap":
+        return sym_hint
+    parts = sym_hint.replace("-", "/").split("/")
+    base, quote = (parts[0], parts[1]) if len(parts) == 2 else (sym_hint, "USDT")
+    candidates = [
+        f"{base}USDT:USDT",
+        f"{base}{quote}:{quote}",
+        f"{base}/{quote}:USDT",
+    ]
+    for c in candidates:
+        if c in markets and markets[c].get("type") == "swap":
+            return c
+    for m in markets.values():
+        if m.get("type") == "swap" and m.get("base") == base and m.get("quote") == "USDT":
+            return m["symbol"]
+    raise ValueError(f"swap(USDT無期限)のシンボルが見つかりません: {sym_hint}")
+
+
+class MarketCache:
+    def __init__(self, loader, path=CACHE_PATH, ttl=CACHE_TTL_SEC):
+        self.loader = loader  # () -> markets dict（例: 別インスタンスの exchange.load_markets）
+        self.path = path
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self._entries = None
+        self._refreshing = set()
+
+    def _read(self):
+        if self._entries is None:
+            try:
+                with open(self.path) as f:
+                    self._entries = json.load(f)
+            except (FileNotFoundError, ValueError):
+                self._entries = {}
+        return self._entries
+
+    def _write(self):
+        d = os.path.dirname(self.path)
+        if d:
+            os.makedirs(d, exist_ok=True)
+        tmp = f"{self.path}.tmp"
+        with open(tmp, "w") as f:
+            json.dump(self._entries, f)
+        os.replace(tmp, self.path)
+
+    def refresh(self, hints):
+        # 1 回の load_markets で複数ヒントをまとめて解決する
+        markets = self.loader()
+        now = time.time()
+        with self.lock:
+            entries = self._read()
+            for hint in hints:
+                symbol = resolve_swap_symbol(markets, hint)
+                entries[hint] = {"symbol": symbol, "market": markets[symbol], "fetched_at": now}
+            self._write()
+            return {hint: entries[hint] for hint in hints}
+
+    def _refresh_background(self, hints):
+        try:
+            self.refresh(hints)
+        except Exception:
+            pass  # 失敗しても古いキャッシュで動き続ける
+        finally:
+            with self.lock:
+                self._refreshing.difference_update(hints)
+
+    def get_many(self, hints, background=True):
+        with self.lock:
+            entries = self._read()
+            missing = [h for h in hints if h not in entries]
+            stale = [h for h in hints if h in entries and time.time() - entries[h]["fetched_at"] > self.ttl]
+        if missing:
+            self.refresh(missing + stale)
+        elif stale:
+            if not background:
+                self.refresh(stale)
+            else:
+                with self.lock:
+                    todo = [h for h in stale if h not in self._refreshing]
+                    self._refreshing.update(todo)
+                if todo:
+                    threading.Thread(target=self._refresh_background, args=(todo,), daemon=True).start()
+        with self.lock:
+            return {h: self._entries[h] for h in hints}
+
+    def get(self, hint, background=True):
+        return self.get_many([hint], background)[hint]
@@ -0,0 +1,258 @@
+import bisect
+import json
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager, nullcontext
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# ====== 計測（タイマー・カウンタ・ヒストグラム） ======
+# METRICS=1 のときだけ有効。無効時は timed() が元の関数をそのまま返し、timer() は共有の
+# nullcontext を返すだけなので、ホットパスに計測コードが残らない。
+# 出力は Prometheus 形式のテキスト（METRICS_PORT の /metrics）と定期的な JSON スナップショット。
+ENABLED = os.getenv("METRICS", "") not in ("", "0", "false")
+PORT = int(os.getenv("METRICS_PORT") or 0)  # 0 なら HTTP は立てない
+HOST = os.getenv("METRICS_HOST", "127.0.0.1")  # Docker などで外から取るなら 0.0.0.0
+SNAPSHOT_PATH = os.getenv("METRICS_SNAPSHOT", "")  # 例: data/metrics.json
+SNAPSHOT_INTERVAL_SEC = 60
+PROFILE_PATH = os.getenv("METRICS_PROFILE", "")  # サンプリングプロファイラの出力（collapsed stack 形式）
+PROFILE_INTERVAL_SEC = 0.01
+PREFIX = "piexchange_"
+
+# 秒単位のヒストグラム境界（100µs 〜 30s）
+BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+_NULL = nullcontext()
+
+
+class Histogram:
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self.lock = threading.Lock()
+
+    def observe(self, value):
+        i = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            self.counts[i] += 1
+            self.sum += value
+            self.count += 1
+
+    def quantile(self, q):
+        # バケット上限による近似値
+        target = q * self.count
+        acc = 0
+        for bound, c in zip(self.buckets + (float("inf"),), self.counts):
+            acc += c
+            if acc >= target and c:
+                return bound
+        return None
+
+
+class Registry:
+    def __init__(self):
+        self.histograms = {}
+        self.counters = {}
+        self.gauges = {}
+        self.lock = threading.Lock()
+
+    def histogram(self, name):
+        h = self.histograms.get(name)
+        if h is None:
+            with self.lock:
+                h = self.histograms.setdefault(name, Histogram())
+        return h
+
+    def inc(self, name, value=1):
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def set(self, name, value):
+        self.gauges[name] = value
+
+    def prometheus(self):
+        lines = []
+        for name, v in sorted(self.counters.items()):
+            lines += [f"# TYPE {PREFIX}{name} counter", f"{PREFIX}{name} {v}"]
+        for name, v in sorted(self.gauges.items()):
+            lines += [f"# TYPE {PREFIX}{name} gauge", f"{PREFIX}{name} {v}"]
+        for name, h in sorted(self.histograms.items()):
+            lines.append(f"# TYPE {PREFIX}{name} histogram")
+            acc = 0
+            for bound, c in zip(h.buckets, h.counts):
+                acc += c
+                lines.append(f'{PREFIX}{name}_bucket{{le="{bound}"}} {acc}')
+            lines.append(f'{PREFIX}{name}_bucket{{le="+Inf"}} {h.count}')
+            lines += [f"{PREFIX}{name}_sum {h.sum}", f"{PREFIX}{name}_count {h.count}"]
+        return "\n".join(lines) + "\n"
+
+    def snapshot(self):
+        return {
+            "time": time.time(),
+            "counters": dict(self.counters),
+            "gauges": dict(self.gauges),
+            "histograms": {
+                name: {"count": h.count, "sum": h.sum, "mean": h.sum / h.count if h.count else None,
+                       "p50": h.quantile(0.5), "p99": h.quantile(0.99)}
+                for name, h in self.histograms.items()
+            },
+        }
+
+
+REGISTRY = Registry()
+
+
+# ---------- 計測 API ----------
+def observe(name, seconds):
+    if ENABLED:
+        REGISTRY.histogram(name).observe(seconds)
+
+
+def inc(name, value=1):
+    if ENABLED:
+        REGISTRY.inc(name, value)
+
+
+def gauge(name, value):
+    if ENABLED:
+        REGISTRY.set(name, value)
+
+
+@contextmanager
+def _timer(name):
+    h = REGISTRY.histogram(name)
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        h.observe(time.perf_counter() - t0)
+
+
+def timer(name):
+    # with metrics.timer("loop_body"): ...
+    return _timer(name) if ENABLED else _NULL
+
+
+def timed(name, errors=True):
+    # デコレータ。無効なら関数をそのまま返す（呼び出しのオーバーヘッドも無し）
+    def wrap(fn):
+        if not ENABLED:
+            return fn
+        h = REGISTRY.histogram(name)
+
+        def inner(*args, **kwargs):
+            t0 = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            except Exception:
+                if errors:
+                    REGISTRY.inc(f"{name}_errors_total")
+                raise
+            finally:
+                h.observe(time.perf_counter() - t0)
+        inner.__wrapped__ = fn
+        inner.__name__ = fn.__name__
+        return inner
+    return wrap
+
+
+def instrument(obj, attr, name):
+    # 既存オブジェクトのメソッド（例: exchange.fetch_ohlcv）を計測付きに差し替える。無効なら何もしない
+    if ENABLED:
+        setattr(obj, attr, timed(name)(getattr(obj, attr)))
+    return obj
+
+
+# ---------- 出力 ----------
+class _Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.startswith("/metrics.json"):
+            body, ctype = json.dumps(REGISTRY.snapshot()).encode(), "application/json"
+        elif self.path.startswith("/metrics"):
+            body, ctype = REGISTRY.prometheus().encode(), "text/plain; version=0.0.4"
+        else:
+            self.send_error(404)
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", ctype)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def _write_snapshot(path):
+    d = os.path.dirname(path)
+    if d:
+        os.makedirs(d, exist_ok=True)
+    tmp = f"{path}.tmp"
+    with open(tmp, "w") as f:
+        json.dump(REGISTRY.snapshot(), f)
+    os.replace(tmp, path)
+
+
+def _snapshot_loop(path, interval):
+    while True:
+        time.sleep(interval)
+        try:
+            _write_snapshot(path)
+        except OSError:
+            pass
+
+
+class Sampler:
+    # 簡易サンプリングプロファイラ。全スレッドのスタックを一定間隔で数え、collapsed stack 形式で書き出す
+    # （flamegraph.pl / speedscope でそのまま読める）
+    def __init__(self, path, interval=PROFILE_INTERVAL_SEC):
+        self.path = path
+        self.interval = interval
+        self.stacks = Counter()
+        self._stop = threading.Event()
+        self.thread = threading.Thread(target=self._run, name="metrics-sampler", daemon=True)
+
+    def _run(self):
+        me = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            for tid, frame in sys._current_frames().items():
+                if tid == me:
+                    continue
+                names = []
+                while frame is not None:
+                    code = frame.f_code
+                    names.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+                    frame = frame.f_back
+                self.stacks[";".join(reversed(names))] += 1
+
+    def dump(self):
+        with open(self.path, "w") as f:
+            for stack, n in self.stacks.most_common():
+                f.write(f"{stack} {n}\n")
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self.thread.join()
+        self.dump()
+
+
+def start(port=PORT, host=HOST, snapshot_path=SNAPSHOT_PATH, interval=SNAPSHOT_INTERVAL_SEC, profile_path=PROFILE_PATH):
+    # 有効時のみ HTTP エンドポイント・スナップショット・プロファイラを起動する。起動した Sampler（なければ None）を返す
+    if not ENABLED:
+        return None
+    if port:
+        server = ThreadingHTTPServer((host, port), _Handler)
+        threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+    if snapshot_path:
+        threading.Thread(target=_snapshot_loop, args=(snapshot_path, interval), name="metrics-snapshot", daemon=True).start()
+    if profile_path:
+        return Sampler(profile_path).start()
+    return None
@@ -0,0 +1,148 @@
+import math
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import ccxt
+import numpy as np
+
+import backtest
+import candle_store
+import indicators
+import resample
+import shared_frame
+
+# ====== ウォークフォワード最適化（逐次半減による枝刈り） ======
+# 学習区間をさらに時系列順のサブフォールドに分け、全候補を最初のフォールドで評価 →
+# 上位 1/ETA だけを次のフォールドへ…と絞り込む（successive halving）。
+# 生き残った中で平均スコアが最良のパラメータを直後のテスト区間（アウトオブサンプル）で評価する。
+PERIODS = list(range(5, 41))
+MULTIPLIERS = [round(m, 2) for m in np.arange(2.0, 12.01, 0.1)]
+TRAIN_DAYS = 30
+TEST_DAYS = 10
+ANCHORED = False  # True なら学習区間の始点を固定して伸ばしていく
+RUNGS = 4  # 学習区間のサブフォールド数（= 枝刈りの段数）
+ETA = 4  # 各段で残す割合は 1/ETA
+WARMUP_BARS = 300  # 区間の手前から ATR / SuperTrend を立ち上げておく本数
+SCORE_KEY = "final_profit"
+WORKERS = os.cpu_count() or 1
+
+
+def walk_forward_windows(n_bars, train_bars, test_bars, anchored=ANCHORED, first=WARMUP_BARS):
+    # [(train_start, train_end, test_end), ...]（インデックス、半開区間）
+    windows = []
+    start = first
+    while start + train_bars + test_bars <= n_bars:
+        train_start = first if anchored else start
+        windows.append((train_start, start + train_bars, start + train_bars + test_bars))
+        start += test_bars
+    return windows
+
+
+def evaluate_segment(cols, period, multipliers, a, b, warmup=WARMUP_BARS):
+    # [a, b) の損益統計を multiplier ごとに返す。指標は a - warmup から計算して立ち上げ、
+    # 枚数はウォームアップの先頭ではなく区間の先頭の価格で決める
+    lo = max(0, a - warmup)
+    trend, _, _ = indicators.supertrend_grid(cols["high"][lo:b], cols["low"][lo:b], cols["close"][lo:b], period, multipliers)
+    start = max(a - lo, period)
+    _, stats = backtest.simulate_grid(np.asarray(cols["close"][lo:b]), trend, start, curves=False, lot_bar=start)
+    return stats
+
+
+def evaluate_segment_shared(args):
+    handle, period, multipliers, a, b, warmup = args
+    return evaluate_segment(shared_frame.attach(handle), period, multipliers, a, b, warmup)
+
+
+def evaluate(cols, candidates, a, b, executor=None, handle=None):
+    # candidates: [(period, mult), ...] -> 同じ順の stats。period ごとに 1 タスク
+    groups = backtest.group_params_by_period(candidates)
+    if executor is None:
+        out = {p: evaluate_segment(cols, p, ms, a, b) for p, ms in groups.items()}
+    else:
+        futures = {p: executor.submit(evaluate_segment_shared, (handle, p, ms, a, b, WARMUP_BARS)) for p, ms in groups.items()}
+        out = {p: f.result() for p, f in futures.items()}
+    lookup = {}
+    for p, ms in groups.items():
+        for m, st in zip(ms, out[p]):
+            lookup[(p, m)] = st
+    return [lookup[c] for c in candidates]
+
+
+def successive_halving(cols, candidates, a, b, rungs=RUNGS, eta=ETA, executor=None, handle=None, score_key=SCORE_KEY):
+    # 学習区間 [a, b) を rungs 個に分けて段階的に枝刈りし、(最良候補, 平均スコア, 評価した本数) を返す
+    edges = np.linspace(a, b, rungs + 1).astype(int)
+    survivors = list(candidates)
+    scores = {c: [] for c in survivors}
+    cost = 0
+    for r in range(rungs):
+        stats = evaluate(cols, survivors, edges[r], edges[r + 1], executor, handle)
+        cost += len(survivors) * (edges[r + 1] - edges[r])
+        for c, st in zip(survivors, stats):
+            scores[c].append(st[score_key])
+        if r < rungs - 1:
+            keep = max(1, math.ceil(len(survivors) / eta))
+            survivors = sorted(survivors, key=lambda c: np.mean(scores[c]), reverse=True)[:keep]
+    best = max(survivors, key=lambda c: np.mean(scores[c]))
+    return best, float(np.mean(scores[best])), cost
+
+
+def walk_forward(df, periods=PERIODS, multipliers=MULTIPLIERS, train_days=TRAIN_DAYS, test_days=TEST_DAYS,
+                 anchored=ANCHORED, rungs=RUNGS, eta=ETA, workers=WORKERS, timeframe=backtest.TIMEFRAME):
+    bars_per_day = 86400 // ccxt.Exchange.parse_timeframe(timeframe)
+    cols = {c: df[c].to_numpy(dtype=np.float64) for c in ("high", "low", "close")}
+    windows = walk_forward_windows(len(df), train_days * bars_per_day, test_days * bars_per_day, anchored)
+    candidates = [(p, m) for p in periods for m in multipliers]
+    folds = []
+    executor = ProcessPoolExecutor(max_workers=min(workers, len(periods))) if workers > 1 else None
+    try:
+        with shared_frame.published(df) as handle:
+            for a, b, c in windows:
+                best, train_score, cost = successive_halving(cols, candidates, a, b, rungs, eta, executor, handle)
+                oos = evaluate(cols, [best], b, c)[0]
+                folds.append({
+                    "train": (a, b), "test": (b, c), "period": best[0], "mult": best[1],
+                    "train_score": train_score, "oos": oos, "cost": cost,
+                    "exhaustive_cost": len(candidates) * (b - a),
+                })
+    finally:
+        if executor is not None:
+            executor.shutdown()
+    return folds
+
+
+def summarize(folds, initial_capital=backtest.initial_capital):
+    # テスト区間を資金を引き継がずに並べた単純合計（各区間とも initial_capital で開始）
+    profits = np.array([f["oos"]["final_profit"] for f in folds])
+    trades = sum(f["oos"]["trade_count"] for f in folds)
+    wins = sum(f["oos"]["trade_count"] * f["oos"]["win_rate"] / 100 for f in folds)
+    return {
+        "folds": len(folds),
+        "oos_profit": float(profits.sum()),
+        "oos_return_pct": float(profits.sum() / initial_capital * 100),
+        "oos_positive_folds": int((profits > 0).sum()),
+        "oos_trade_count": int(trades),
+        "oos_win_rate": float(wins / trades * 100) if trades else 0.0,
+        "oos_worst_drawdown": float(min((f["oos"]["max_drawdown"] for f in folds), default=0.0)),
+        "cost_ratio": float(sum(f["cost"] for f in folds) / max(1, sum(f["exhaustive_cost"] for f in folds))),
+    }
+
+
+if __name__ == "__main__":
+    # 使い方: python optimize.py PI（"PI/USDT" / "PI/USDT:USDT" も可）
+    store = resample.get_store(backtest.STORE_FORMAT)
+    symbol = candle_store.resolve_symbol(store, sys.argv[1] if len(sys.argv) > 1 else backtest.TARGET_SYMBOL, backtest.TIMEFRAME)
+    df = store.load(symbol, backtest.TIMEFRAME)
+    t0 = time.perf_counter()
+    folds = walk_forward(df)
+    elapsed = time.perf_counter() - t0
+    print(f"=== {symbol} ウォークフォワード（候補 {len(PERIODS) * len(MULTIPLIERS)} 通り, {elapsed:.1f}s） ===")
+    for f in folds:
+        o = f["oos"]
+        print(f"学習 {f['train']} → ATR={f['period']}, Mult={f['mult']} (学習スコア:{f['train_score']:.4f}) | "
+              f"検証 損益:{o['final_profit']:.4f}, 取引数:{o['trade_count']}, 勝率:{o['win_rate']:.2f}%, 最大DD:{o['max_drawdown']:.2f}%")
+    s = summarize(folds)
+    print(f"OOS 合計損益:{s['oos_profit']:.4f} ({s['oos_return_pct']:.2f}%), プラスの区間:{s['oos_positive_folds']}/{s['folds']}, "
+          f"取引数:{s['oos_trade_count']}, 勝率:{s['oos_win_rate']:.2f}%, 最悪DD:{s['oos_worst_drawdown']:.2f}%")
+    print(f"評価コスト: 全探索比 {s['cost_ratio'] * 100:.1f}%")
@@ -0,0 +1,199 @@
+import math
+import sys
+import time
+from contextlib import contextmanager
+
+import numpy as np
+
+import candle_store
+import main
+import resample
+import state_store
+
+# ====== ライブのコードをそのまま使うイベント駆動リプレイ ======
+# 保存済みのローソク足を 1 本ずつ main.py の関数（seed_supertrend / commit_closed /
+# handle_signal → place_market / place_flip / get_contracts_from_jpy）に流し、
+# 発注は手数料・スリッページ・レイテンシを持つ SimExchange が約定させる。結果は決定的。
+TAKER_FEE_RATE = 0.00042
+SLIPPAGE_BPS = 2.0  # 不利方向へのスリッページ（bps）
+LATENCY_MS = 300  # 発注判断（足の境界 + SETTLE_DELAY_SEC）から約定までの遅延
+AMOUNT_STEP = 1.0  # 数量の刻み（precision.amount、TICK_SIZE 方式）
+CONTRACT_SIZE = 1.0
+
+
+class SimExchange:
+    # main.py が使う ccxt のメソッドだけを持つ単一銘柄の取引所。単方向モードのネッティング
+    def __init__(self, symbol, fee_rate=TAKER_FEE_RATE, slippage_bps=SLIPPAGE_BPS,
+                 amount_step=AMOUNT_STEP, contract_size=CONTRACT_SIZE):
+        self.symbol = symbol
+        self.fee_rate = fee_rate
+        self.slippage = slippage_bps / 10000
+        self.amount_step = amount_step
+        self.contract_size = contract_size
+        self.decimals = max(0, -int(math.floor(math.log10(amount_step))))
+        self.markets = {symbol: self.market(symbol)}
+        self.price = None  # 次の注文が約定する価格（スリッページ前）
+        self.now_ms = None
+        self.position = 0.0  # 符号付き枚数
+        self.entry_price = 0.0
+        self.entry_fee = 0.0  # 保有中のポジションに按分される手数料
+        self.realized = 0.0  # 手数料控除後の確定損益
+        self.fees = 0.0
+        self.orders = []
+        self.trades = []  # 決済ごとの手数料込み損益
+
+    def market(self, symbol):
+        return {"symbol": symbol, "id": symbol.split(":")[0].replace("/", ""), "type": "swap", "swap": True,
+                "contractSize": self.contract_size, "precision": {"amount": self.amount_step}}
+
+    def amount_to_precision(self, symbol, amount):
+        steps = math.floor(amount / self.amount_step + 1e-9)
+        return f"{steps * self.amount_step:.{self.decimals}f}"
+
+    def parse_timeframe(self, timeframe):
+        return main.exchange.parse_timeframe(timeframe)
+
+    def fetch_ticker(self, symbol):
+        return {"symbol": symbol, "last": self.price}
+
+    def fetch_positions(self, symbols=None):
+        if self.position == 0:
+            return []
+        return [{"symbol": self.symbol, "side": "long" if self.position > 0 else "short", "contracts": abs(self.position)}]
+
+    def create_order(self, symbol, type, side, amount, price=None, params=None):
+        params = params or {}
+        amount = float(amount)
+        qty = amount if side == "buy" else -amount
+        if params.get("reduceOnly"):
+            if self.position == 0 or (qty > 0) == (self.position > 0):
+                raise RuntimeError("reduceOnly: 決済するポジションがありません")
+            qty = math.copysign(min(abs(qty), abs(self.position)), qty)
+        fill = self.price * (1 + self.slippage if qty > 0 else 1 - self.slippage)
+        fee = abs(qty) * fill * self.contract_size * self.fee_rate
+        self.fees += fee
+        self.realized -= fee
+
+        remaining = qty
+        if self.position != 0 and (qty > 0) != (self.position > 0):
+            # 反対売買はまず決済に充て、余りで新規建て（2×枚数のドテンもここを通る）
+            closed = min(abs(qty), abs(self.position))
+            direction = 1 if self.position > 0 else -1
+            pnl = (fill - self.entry_price) * closed * direction * self.contract_size
+            share = closed / abs(self.position)
+            close_fee = fee * closed / abs(qty)
+            self.realized += pnl
+            self.trades.append(pnl - self.entry_fee * share - close_fee)
+            self.entry_fee -= self.entry_fee * share
+            self.position -= closed * direction
+            remaining = qty + closed * direction
+            fee -= close_fee
+        if remaining != 0:
+            new_pos = self.position + remaining
+            self.entry_price = (self.entry_price * abs(self.position) + fill * abs(remaining)) / abs(new_pos)
+            self.position = new_pos
+            self.entry_fee += fee
+        order = {"id": str(len(self.orders) + 1), "symbol": symbol, "side": side, "amount": amount,
+                 "average": fill, "status": "closed", "timestamp": self.now_ms, "reduceOnly": bool(params.get("reduceOnly"))}
+        self.orders.append(order)
+        return order
+
+    def equity_delta(self, mark):
+        # 初期資金に対する増減（確定損益 + 含み損益）
+        return self.realized + (mark - self.entry_price) * self.position * self.contract_size
+
+
+@contextmanager
+def live_context(sim):
+    # main.py のグローバル（取引所・永続状態・契約数・ログ）をリプレイ用に差し替える
+    names = ("exchange", "_state", "CONTRACTS", "log", "EXECUTION_MODE")
+    saved = {n: getattr(main, n) for n in names}
+    main.exchange = sim
+    main._state = state_store.StateStore(":memory:")
+    main.CONTRACTS = None
+    main.log = lambda msg: None
+    main.EXECUTION_MODE = "sync"
+    try:
+        yield
+    finally:
+        main._state.close()
+        for n, v in saved.items():
+            setattr(main, n, v)
+
+
+def fill_price(o, c, elapsed_ms, tf_ms):
+    # 形成中の足の中で約定する価格。始値→終値を経過時間で線形補間する
+    frac = min(1.0, max(0.0, elapsed_ms / tf_ms))
+    return o + (c - o) * frac
+
+
+def replay(arrays, symbol="SIM/USDT:USDT", period=main.ATR_PERIOD, multiplier=main.MULTIPLIER,
+           timeframe=main.TIMEFRAME, target_jpy=None, initial_capital=1000.0, sim=None,
+           latency_ms=LATENCY_MS, settle_sec=main.SETTLE_DELAY_SEC):
+    # arrays: candle_store の列配列。ライブの REST ループと同じく「足の確定 → 確定足のトレンドで判断」を繰り返す。
+    # target_jpy 省略時は初期資金の全額（initial_capital USDT 相当）を 1 ポジションに使う
+    sim = sim or SimExchange(symbol)
+    ts = np.asarray(arrays["timestamp"], dtype=np.int64)
+    rows = list(zip(ts.tolist(), arrays["open"].tolist(), arrays["high"].tolist(), arrays["low"].tolist(),
+                    arrays["close"].tolist(), arrays["volume"].tolist()))
+    n = len(rows)
+    tf_ms = main.exchange.parse_timeframe(timeframe) * 1000
+    delay_ms = settle_sec * 1000 + latency_ms
+    if target_jpy is None:
+        target_jpy = initial_capital * main.CONST_JPY
+    start = max(period, 1)
+    equity = np.full(max(0, n - start), float(initial_capital))
+    if n <= start:
+        return {"equity": equity, "timestamps": ts[start:], "orders": [], "stats": replay_stats(equity, sim, initial_capital)}
+
+    with live_context(sim):
+        main.TARGET_JPY, saved_target = target_jpy, main.TARGET_JPY
+        try:
+            # rows[:start] を確定足として状態を作る（rows[start] は形成中）
+            st = main.seed_supertrend(rows[:start + 1], period, multiplier)
+            position = None
+            for i in range(start, n):
+                if i > start:
+                    # rows[i-1] の確定（= rows[i] の開始）で起床した想定
+                    main.commit_closed(st, rows[i - 1:i + 1], rows[i][0])
+                _, o, _, _, c, _ = rows[i]
+                sim.now_ms = rows[i][0] + delay_ms
+                sim.price = fill_price(o, c, delay_ms, tf_ms)
+                position = main.handle_signal(symbol, position, st.trend, sim.price)
+                equity[i - start] = initial_capital + sim.equity_delta(c)
+        finally:
+            main.TARGET_JPY = saved_target
+    return {"equity": equity, "timestamps": ts[start:], "orders": sim.orders, "stats": replay_stats(equity, sim, initial_capital)}
+
+
+def replay_stats(equity, sim, initial_capital):
+    # backtest.simulate_grid と同じキー
+    trades = np.asarray(sim.trades)
+    final = float(equity[-1]) if len(equity) else float(initial_capital)
+    peak = np.maximum.accumulate(equity) if len(equity) else np.array([initial_capital])
+    dd = ((equity - peak) / peak).min() * 100 if len(equity) else 0.0
+    return {
+        "final_profit": final - initial_capital,
+        "final_equity": final,
+        "trade_count": len(trades),
+        "win_rate": float((trades > 0).mean() * 100) if len(trades) else 0.0,
+        "max_drawdown": float(dd),
+        "fees": sim.fees,
+    }
+
+
+if __name__ == "__main__":
+    # 使い方: python replay.py "PI/USDT" [period] [multiplier] [timeframe]
+    symbol = sys.argv[1] if len(sys.argv) > 1 else main.user_symbol_hint
+    period = int(sys.argv[2]) if len(sys.argv) > 2 else main.ATR_PERIOD
+    multiplier = float(sys.argv[3]) if len(sys.argv) > 3 else main.MULTIPLIER
+    timeframe = sys.argv[4] if len(sys.argv) > 4 else main.TIMEFRAME
+    store = resample.get_store(candle_store.STORE_FORMAT)
+    symbol = candle_store.resolve_symbol(store, symbol, timeframe)  # "PI/USDT" -> 保存済みの "PI/USDT:USDT"
+    arrays = store.read_arrays(symbol, timeframe)
+    t0 = time.perf_counter()
+    result = replay(arrays, symbol, period, multiplier, timeframe)
+    elapsed = time.perf_counter() - t0
+    s = result["stats"]
+    print(f"{symbol} {timeframe} ATR={period} Mult={multiplier}: {len(arrays['timestamp'])} bars / {len(result['orders'])} orders in {elapsed:.3f}s")
+    print(f"損益:{s['final_profit']:.4f}, 最終資産:{s['final_equity']:.4f}, 取引数:{s['trade_count']}, 勝率:{s['win_rate']:.2f}%, 最大DD:{s['max_drawdown']:.2f}%, 手数料:{s['fees']:.4f}")
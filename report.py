@@ -0,0 +1,130 @@
+import html
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import matplotlib.dates as mdates
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+
+# ====== バックテストのレポート出力（ヘッドレス・並列） ======
+# pyplot を使わず Figure API + Agg で描画するので画面もグローバル状態も不要。
+# 資産曲線は LTTB で画面解像度程度まで間引いてから描き、描画はプロセスプールで非同期に行う。
+# close() で全ての PNG を待ち、index.html（一覧）を書き出す。
+PLOT_POINTS = 2000  # 1 系列あたりの最大点数（幅 10inch × 100dpi の 2 倍）
+PLOT_DPI = 100
+REPORT_WORKERS = 2
+
+
+def lttb(x, y, n_out=PLOT_POINTS):
+    # Largest-Triangle-Three-Buckets。形を保ったまま n_out 点に間引き、選んだインデックスを返す
+    n = len(y)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    idx = np.empty(n_out, dtype=np.intp)
+    idx[0], idx[-1] = 0, n - 1
+    edges = np.linspace(1, n - 1, n_out - 1).astype(np.intp)
+    a = 0
+    for i in range(n_out - 2):
+        lo, hi = edges[i], edges[i + 1]
+        nhi = edges[i + 2] if i + 2 < len(edges) else n
+        avg_x = x[hi:nhi].mean()
+        avg_y = y[hi:nhi].mean()
+        area = np.abs((x[a] - avg_x) * (y[lo:hi] - y[a]) - (x[a] - x[lo:hi]) * (avg_y - y[a]))
+        a = lo + int(np.argmax(area))
+        idx[i + 1] = a
+    return idx
+
+
+def downsample(timestamps, equity, n_out=PLOT_POINTS):
+    ts = np.asarray(timestamps).astype("datetime64[ms]")
+    equity = np.asarray(equity, dtype=np.float64)
+    idx = lttb(ts.astype(np.int64), equity, n_out)
+    return ts[idx], equity[idx]
+
+
+def draw_equity(ax, series, title=None, baseline=None):
+    # series: [(label, timestamps, equity), ...]。1 系列なら baseline の上下を塗り分ける
+    for label, x, y in series:
+        ax.plot(x, y, linewidth=1.25, label=label)
+    if baseline is not None:
+        if len(series) == 1:
+            _, x, y = series[0]
+            ax.fill_between(x, y, baseline, where=(y >= baseline), color="tab:green", alpha=0.12)
+            ax.fill_between(x, y, baseline, where=(y < baseline), color="tab:red", alpha=0.12)
+        ax.axhline(baseline, color="gray", linestyle="--", linewidth=0.8)
+    if title:
+        ax.set_title(title)
+    ax.set_xlabel("Time")
+    ax.set_ylabel("Equity (USDT)")
+    ax.grid(True, alpha=0.3)
+    if len(series) > 1:
+        ax.legend(loc="best", fontsize="small")
+    locator = mdates.AutoDateLocator()
+    ax.xaxis.set_major_locator(locator)
+    ax.xaxis.set_major_formatter(mdates.ConciseDateFormatter(locator))
+
+
+def render_equity(job):
+    # ワーカーで実行する。job: {"outpath", "series", "title", "baseline", "figsize"}
+    series = [(label, *downsample(x, y)) for label, x, y in job["series"] if y is not None and len(y) > 0]
+    if not series:
+        return None
+    fig = Figure(figsize=job.get("figsize", (10, 5)))
+    FigureCanvasAgg(fig)
+    draw_equity(fig.add_subplot(), series, job.get("title"), job.get("baseline"))
+    fig.tight_layout()
+    d = os.path.dirname(job["outpath"])
+    if d:
+        os.makedirs(d, exist_ok=True)
+    fig.savefig(job["outpath"], dpi=job.get("dpi", PLOT_DPI))
+    return job["outpath"]
+
+
+class ReportWriter:
+    def __init__(self, out_dir, title="Backtest report", workers=REPORT_WORKERS):
+        self.out_dir = out_dir
+        self.title = title
+        self.executor = ProcessPoolExecutor(max_workers=workers) if workers > 0 else None
+        self.entries = []  # (section, title, 統計の文字列, 画像パス, future)
+
+    def add(self, section, title, outpath, series, stats="", baseline=None, figsize=(10, 5)):
+        # 描画をキューに積むだけで戻る（スイープ側は待たない）
+        job = {"outpath": outpath, "series": series, "title": title, "baseline": baseline, "figsize": figsize}
+        fut = self.executor.submit(render_equity, job) if self.executor else None
+        if fut is None:
+            render_equity(job)
+        self.entries.append((section, title, stats, outpath, fut))
+
+    def close(self):
+        # 全ての描画を待ち、index.html を書いてパスを返す
+        for entry in self.entries:
+            if entry[4] is not None:
+                try:
+                    entry[4].result()
+                except Exception as e:
+                    print(f"描画失敗 {entry[3]}: {e}")
+        if self.executor:
+            self.executor.shutdown()
+        os.makedirs(self.out_dir, exist_ok=True)
+        path = os.path.join(self.out_dir, "index.html")
+        parts = [f"<!doctype html><meta charset='utf-8'><title>{html.escape(self.title)}</title>",
+                 "<style>body{font-family:sans-serif;margin:2em}img{max-width:100%}td{vertical-align:top;padding:4px 12px}</style>",
+                 f"<h1>{html.escape(self.title)}</h1>"]
+        section = None
+        for sec, title, stats, outpath, _ in self.entries:
+            if sec != section:
+                if section is not None:
+                    parts.append("</table>")
+                parts.append(f"<h2>{html.escape(sec)}</h2><table>")
+                section = sec
+            src = html.escape(os.path.relpath(outpath, self.out_dir))
+            parts.append(f"<tr><td><b>{html.escape(title)}</b><br>{html.escape(stats)}</td>"
+                         f"<td><a href='{src}'><img src='{src}' width='600'></a></td></tr>")
+        if section is not None:
+            parts.append("</table>")
+        with open(path, "w") as f:
+            f.write("\n".join(parts))
+        return path
@@ -0,0 +1,164 @@
+import json
+import os
+
+import ccxt
+import numpy as np
+
+import candle_store
+from candle_store import COLUMNS
+
+# ====== 上位足の合成（基準足からのリサンプリング） ======
+# 保存するのは基準足（BASE_TIMEFRAME）だけにし、15m / 1h などは読み込み時に OHLCV を集約して作る。
+# バケットは epoch ミリ秒を timeframe で割った境界（取引所の足と同じ UTC 区切り）。
+# epoch（1970-01-01）は木曜なので、週足だけは取引所に合わせて月曜 0:00 UTC 始まりにずらす。
+# 合成した足は {root}/derived/ にキャッシュし、基準足が保存・追記されたら（ファイルの更新で検知して）作り直す。
+BASE_TIMEFRAME = "1m"
+DERIVED_DIR = "derived"  # ストアの root 配下のキャッシュ置き場
+FETCH_MAX = 1000  # ライブで 1 回に取得する基準足の上限（Bitget の 1 リクエスト上限）
+WEEK_MS = 7 * 86_400_000
+WEEK_OFFSET_MS = 4 * 86_400_000  # epoch の木曜から次の月曜まで
+
+
+def timeframe_ms(timeframe):
+    return ccxt.Exchange.parse_timeframe(timeframe) * 1000
+
+
+def bucket_start(ts, tf):
+    # ts（スカラーでも配列でも）が入るバケットの先頭。週の倍数の足は月曜始まり
+    offset = WEEK_OFFSET_MS if tf % WEEK_MS == 0 else 0
+    return ts - (ts - offset) % tf
+
+
+def resample_arrays(arrays, timeframe, base_timeframe=BASE_TIMEFRAME, keep_forming=False):
+    # 列配列を timeframe の足に集約する。途中から始まる先頭のバケットは捨て、
+    # 末尾のバケットは基準足がそろっていなければ keep_forming=True のときだけ（形成中の足として）残す
+    ts = np.asarray(arrays["timestamp"], dtype=np.int64)
+    if len(ts) == 0:
+        return {col: np.asarray(arrays[col])[:0] for col in COLUMNS}
+    tf = timeframe_ms(timeframe)
+    bucket = bucket_start(ts, tf)
+    starts = np.flatnonzero(np.r_[True, bucket[1:] != bucket[:-1]])
+    ends = np.r_[starts[1:], len(ts)]
+    out = {
+        "timestamp": bucket[starts],
+        "open": np.asarray(arrays["open"], dtype=np.float64)[starts],
+        "high": np.maximum.reduceat(np.asarray(arrays["high"], dtype=np.float64), starts),
+        "low": np.minimum.reduceat(np.asarray(arrays["low"], dtype=np.float64), starts),
+        "close": np.asarray(arrays["close"], dtype=np.float64)[ends - 1],
+        "volume": np.add.reduceat(np.asarray(arrays["volume"], dtype=np.float64), starts),
+    }
+    lo = 1 if ts[0] != bucket[0] else 0
+    hi = len(starts)
+    if not keep_forming and ts[-1] + timeframe_ms(base_timeframe) < bucket[-1] + tf:
+        hi -= 1
+    if lo or hi < len(starts):
+        out = {col: v[lo:max(lo, hi)] for col, v in out.items()}
+    return out
+
+
+def resample_ohlcv(ohlcv, timeframe, base_timeframe=BASE_TIMEFRAME, keep_forming=True):
+    # ccxt の [[ts, o, h, l, c, v], ...] 版。ライブ用なので末尾の形成中の足も残す
+    if not ohlcv:
+        return []
+    a = resample_arrays(candle_store.arrays_from_ohlcv(ohlcv), timeframe, base_timeframe, keep_forming)
+    return [[int(t), *row] for t, *row in zip(a["timestamp"].tolist(), *(a[col].tolist() for col in COLUMNS[1:]))]
+
+
+def source_timeframe(timeframe, available):
+    # 取引所が提供する足（exchange.timeframes）のうち timeframe を割り切る最大のもの。提供されていればそのまま
+    if timeframe in available:
+        return timeframe
+    tf = timeframe_ms(timeframe)
+    divisors = [t for t in available if t != "1M" and tf % timeframe_ms(t) == 0]
+    if not divisors:
+        raise ValueError(f"{timeframe} を合成できる足がありません")
+    return max(divisors, key=timeframe_ms)
+
+
+class CandleAggregator:
+    # WS の足更新（同じ足が何度も届く）を上位足に畳み込む。update は対象の上位足 [ts, o, h, l, c, v] を返す
+    def __init__(self, timeframe):
+        self.tf = timeframe_ms(timeframe)
+        self.bucket = None
+        self.bars = {}  # 現在のバケットに入る元の足（ts -> 足）
+
+    def seed(self, ohlcv):
+        # REST で取得した元の足から、形成中のバケットの途中までを復元する
+        for candle in ohlcv:
+            self.update(candle)
+
+    def update(self, candle):
+        ts = int(candle[0])
+        bucket = bucket_start(ts, self.tf)
+        if self.bucket is None or bucket > self.bucket:
+            self.bucket = bucket
+            self.bars = {}
+        elif bucket < self.bucket:
+            return None  # 既に閉じたバケットの遅延更新
+        self.bars[ts] = candle
+        bars = [self.bars[t] for t in sorted(self.bars)]
+        return [bucket, bars[0][1], max(b[2] for b in bars), min(b[3] for b in bars), bars[-1][4], sum(b[5] for b in bars)]
+
+
+class ResampledStore:
+    # ローソク足ストアのラッパー。保存済みの timeframe はそのまま、無ければ基準足から合成して返す
+    def __init__(self, store, base_timeframe=BASE_TIMEFRAME):
+        self.store = store
+        self.root = store.root
+        self.base = base_timeframe
+        self.cache = candle_store.NpyCandleStore(os.path.join(store.root, DERIVED_DIR))
+        self._memo = {}  # (symbol, timeframe) -> (基準足のスタンプ, 列配列)
+
+    def __getattr__(self, name):
+        # save / append / last_timestamp などは元のストアへ
+        return getattr(self.store, name)
+
+    def _stamp(self, symbol):
+        # 基準足が最後に書き換えたファイル（npy は meta.json、parquet は本体）の更新時刻とサイズ
+        path = self.store.path(symbol, self.base)
+        if os.path.isdir(path):
+            path = os.path.join(path, "meta.json")
+        st = os.stat(path)
+        return [st.st_mtime_ns, st.st_size]
+
+    def derived(self, symbol, timeframe):
+        return not self.store.exists(symbol, timeframe) and self.store.exists(symbol, self.base)
+
+    def exists(self, symbol, timeframe):
+        return self.store.exists(symbol, timeframe) or self.store.exists(symbol, self.base)
+
+    def symbols(self, timeframe):
+        own = self.store.symbols(timeframe)
+        if timeframe == self.base:
+            return own
+        return own + [s for s in self.store.symbols(self.base) if s not in own]
+
+    def read_arrays(self, symbol, timeframe, mmap=True):
+        if not self.derived(symbol, timeframe):
+            return self.store.read_arrays(symbol, timeframe, mmap)
+        stamp = self._stamp(symbol)
+        memo = self._memo.get((symbol, timeframe))
+        if memo and memo[0] == stamp:
+            return memo[1]
+        stamp_path = os.path.join(self.cache.path(symbol, timeframe), "source.json")
+        try:
+            with open(stamp_path) as f:
+                fresh = json.load(f) == {"base": self.base, "stamp": stamp}
+        except (OSError, ValueError):
+            fresh = False
+        if fresh:
+            arrays = self.cache.read_arrays(symbol, timeframe, mmap)
+        else:
+            arrays = resample_arrays(self.store.read_arrays(symbol, self.base, mmap=False), timeframe, self.base)
+            self.cache.save(symbol, timeframe, arrays)
+            with open(stamp_path, "w") as f:
+                json.dump({"base": self.base, "stamp": stamp}, f)
+        self._memo[(symbol, timeframe)] = (stamp, arrays)
+        return arrays
+
+    def load(self, symbol, timeframe):
+        return candle_store.frame_from_arrays(self.read_arrays(symbol, timeframe))
+
+
+def get_store(kind=candle_store.STORE_FORMAT, root=candle_store.STORE_DIR, base_timeframe=BASE_TIMEFRAME):
+    return ResampledStore(candle_store.get_store(kind, root), base_timeframe)
@@ -0,0 +1,91 @@
+import csv
+import hashlib
+import inspect
+import os
+import sqlite3
+import time
+
+# ====== バックテスト結果のストア（SQLite） ======
+# (symbol, data_hash, period, mult, fee_rate, code_version) をキーに統計だけを保存する。
+# 計算済みの組み合わせは再実行時に飛ばし、ランキング・上位 N 件はクエリで取り出す（資産曲線は持たない）。
+RESULTS_PATH = os.path.join("data", "results.db")
+STAT_COLUMNS = ("final_profit", "final_equity", "trade_count", "win_rate", "max_drawdown")
+KEY_COLUMNS = ("symbol", "data_hash", "period", "mult", "fee_rate", "code_version")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS results (
+    symbol TEXT, data_hash TEXT, period INTEGER, mult REAL, fee_rate REAL, code_version TEXT,
+    final_profit REAL, final_equity REAL, trade_count INTEGER, win_rate REAL, max_drawdown REAL,
+    created_at REAL,
+    PRIMARY KEY (symbol, data_hash, period, mult, fee_rate, code_version)
+);
+CREATE INDEX IF NOT EXISTS results_profit ON results (code_version, fee_rate, final_profit);
+"""
+
+
+def code_version(*objs):
+    # 結果に影響するコード（モジュールや関数）のソースから作るハッシュ
+    h = hashlib.blake2b(digest_size=8)
+    for obj in objs:
+        h.update(inspect.getsource(obj).encode())
+    return h.hexdigest()
+
+
+class ResultStore:
+    def __init__(self, path=RESULTS_PATH):
+        d = os.path.dirname(path)
+        if d:
+            os.makedirs(d, exist_ok=True)
+        self.path = path
+        self.conn = sqlite3.connect(path)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.executescript(SCHEMA)
+
+    def close(self):
+        self.conn.close()
+
+    def done(self, symbol, data_hash, fee_rate, code_version):
+        # 計算済みの (period, mult) の集合
+        rows = self.conn.execute(
+            "SELECT period, mult FROM results WHERE symbol = ? AND data_hash = ? AND fee_rate = ? AND code_version = ?",
+            (symbol, data_hash, fee_rate, code_version),
+        )
+        return {(int(p), float(m)) for p, m in rows}
+
+    def add_many(self, results, symbol, data_hash, fee_rate, code_version):
+        # results: period / mult と統計を持つ dict のリスト。1 トランザクションで書く
+        now = time.time()
+        rows = [
+            (symbol, data_hash, int(r["period"]), float(r["mult"]), fee_rate, code_version,
+             *(r[c] for c in STAT_COLUMNS), now)
+            for r in results
+        ]
+        with self.conn:
+            self.conn.executemany(f"INSERT OR REPLACE INTO results VALUES ({', '.join('?' * 12)})", rows)
+
+    def query(self, where="", args=(), order="final_profit DESC", limit=None):
+        sql = f"SELECT {', '.join(KEY_COLUMNS + STAT_COLUMNS)} FROM results"
+        if where:
+            sql += f" WHERE {where}"
+        if order:
+            sql += f" ORDER BY {order}"
+        if limit is not None:
+            sql += f" LIMIT {int(limit)}"
+        for row in self.conn.execute(sql, args):
+            yield dict(zip(KEY_COLUMNS + STAT_COLUMNS, row))
+
+    def top(self, n, symbol, data_hash, fee_rate, code_version, key="final_profit"):
+        return list(self.query(
+            "symbol = ? AND data_hash = ? AND fee_rate = ? AND code_version = ?",
+            (symbol, data_hash, fee_rate, code_version), order=f"{key} DESC", limit=n,
+        ))
+
+    def export_csv(self, path, keys, fieldnames=("symbol", "period", "mult") + STAT_COLUMNS):
+        # keys: [(symbol, data_hash, fee_rate, code_version), ...] の結果だけを 1 行ずつ書き出す（全件をメモリに載せない）
+        with open(path, "w", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=list(fieldnames), extrasaction="ignore")
+            writer.writeheader()
+            for symbol, data_hash, fee_rate, version in keys:
+                for r in self.query("symbol = ? AND data_hash = ? AND fee_rate = ? AND code_version = ?",
+                                    (symbol, data_hash, fee_rate, version), order="period, mult"):
+                    writer.writerow(r)
@@ -0,0 +1,62 @@
+import time
+
+# ====== 足の確定に合わせて起床するスケジューラ ======
+# 取引所のサーバー時刻との差を補正し、timeframe の境界 + settle 秒で "close" を返す。
+# intrabar_sec を指定すると、境界までの間もその間隔で "intrabar" を返す。
+
+
+class BarScheduler:
+    def __init__(self, timeframe_ms, settle_sec=2.0, intrabar_sec=None, server_time=None, resync_sec=3600,
+                 clock=time.time, sleep=time.sleep):
+        self.timeframe_ms = int(timeframe_ms)
+        self.settle_ms = int(settle_sec * 1000)
+        self.intrabar_ms = int(intrabar_sec * 1000) if intrabar_sec else None
+        self.server_time = server_time  # 例: exchange.fetch_time（ミリ秒を返す callable）
+        self.resync_sec = resync_sec
+        self.clock = clock
+        self.sleep = sleep
+        self.offset_ms = 0
+        self.synced_at = None
+        self.last_close_ms = None
+
+    def sync(self):
+        # 往復の中間時刻とサーバー時刻の差をオフセットにする
+        t0 = self.clock()
+        server_ms = self.server_time()
+        t1 = self.clock()
+        self.offset_ms = int(server_ms - (t0 + t1) / 2 * 1000)
+        self.synced_at = t1
+        return self.offset_ms
+
+    def now_ms(self):
+        return int(self.clock() * 1000) + self.offset_ms
+
+    def next_event(self):
+        # (起床する時刻 ms, 種別, 対象の足の境界 ms) を返す
+        now = self.now_ms()
+        close_ms = (now // self.timeframe_ms) * self.timeframe_ms
+        # 直前の境界が未処理（settle 待ちの最中・処理遅れ）ならそれを対象にする
+        if self.last_close_ms is None:
+            pending = now < close_ms + self.settle_ms
+        else:
+            pending = close_ms > self.last_close_ms
+        if not pending:
+            close_ms += self.timeframe_ms
+        target, kind = close_ms + self.settle_ms, "close"
+        if self.intrabar_ms and now + self.intrabar_ms < target:
+            target, kind = now + self.intrabar_ms, "intrabar"
+        return target, kind, close_ms
+
+    def wait(self):
+        if self.server_time and (self.synced_at is None or self.clock() - self.synced_at >= self.resync_sec):
+            try:
+                self.sync()
+            except Exception:
+                pass  # サーバー時刻が取れなくてもローカル時刻で続行
+        target, kind, close_ms = self.next_event()
+        delay = (target - self.now_ms()) / 1000
+        if delay > 0:
+            self.sleep(delay)
+        if kind == "close":
+            self.last_close_ms = close_ms
+        return kind, close_ms
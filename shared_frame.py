@@ -0,0 +1,69 @@
+import os
+import tempfile
+import uuid
+from contextlib import contextmanager
+
+import numpy as np
+
+# ====== プロセス間で OHLCV を共有するためのデータプレーン ======
+# 親プロセスが列を 1 度だけ .npy に書き出し、ワーカーは mmap でパスを開くだけ。
+# /dev/shm があればそこに置くので実体は共有メモリになる。
+SHM_DIR = "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir()
+COLUMNS = ("open", "high", "low", "close", "volume")
+
+# ワーカー側の attach キャッシュ（パス -> ndarray）
+_attached = {}
+
+
+def publish(df, columns=COLUMNS):
+    # (列数 × 本数) の float64 配列として書き出し、pickle しても数十バイトのハンドルを返す
+    arr = np.ascontiguousarray(df[list(columns)].to_numpy(dtype=np.float64).T)
+    path = os.path.join(SHM_DIR, f"piexchange_{os.getpid()}_{uuid.uuid4().hex}.npy")
+    np.save(path, arr)
+    return (path, tuple(columns))
+
+
+def publish_arrays(arrays):
+    # 同じ形の配列（例: 銘柄 × 本数）の dict を (列数 × ...) にまとめて書き出す。attach は各列の ndarray を返す
+    columns = tuple(arrays)
+    arr = np.ascontiguousarray(np.stack([np.asarray(arrays[c], dtype=np.float64) for c in columns]))
+    path = os.path.join(SHM_DIR, f"piexchange_{os.getpid()}_{uuid.uuid4().hex}.npy")
+    np.save(path, arr)
+    return (path, columns)
+
+
+def attach(handle):
+    path, columns = handle
+    arr = _attached.get(path)
+    if arr is None:
+        # 前の銘柄の mmap は手放してから開く
+        _attached.clear()
+        arr = np.load(path, mmap_mode="r")
+        _attached[path] = arr
+    return dict(zip(columns, arr))
+
+
+def release(handle):
+    # 既に attach 済みのワーカーの mmap は unlink 後も有効
+    try:
+        os.remove(handle[0])
+    except FileNotFoundError:
+        pass
+
+
+@contextmanager
+def published(df, columns=COLUMNS):
+    handle = publish(df, columns)
+    try:
+        yield handle
+    finally:
+        release(handle)
+
+
+@contextmanager
+def published_arrays(arrays):
+    handle = publish_arrays(arrays)
+    try:
+        yield handle
+    finally:
+        release(handle)
@@ -0,0 +1,123 @@
+import os
+import sqlite3
+import threading
+import time
+import uuid
+
+# ====== ライブ取引の永続状態（SQLite / WAL） ======
+# ポジション・発注中の注文・最後に処理した確定足を保存し、再起動時はここから即座に復元する。
+# 取引所の実ポジションとは起動時と RECONCILE_INTERVAL_SEC ごとの fetch_positions 1 回で突き合わせる。
+STATE_PATH = os.path.join("data", "state.db")
+RECONCILE_INTERVAL_SEC = 10 * 60
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS positions (
+    key TEXT PRIMARY KEY, symbol TEXT, side TEXT, contracts REAL, updated_at REAL
+);
+CREATE TABLE IF NOT EXISTS pending_orders (
+    id TEXT PRIMARY KEY, key TEXT, symbol TEXT, side TEXT, contracts REAL, created_at REAL
+);
+CREATE TABLE IF NOT EXISTS candles (
+    key TEXT PRIMARY KEY, ts INTEGER, updated_at REAL
+);
+"""
+
+
+class StateStore:
+    # key は戦略の識別子（main.py はシンボル、engine.py は戦略名）
+    def __init__(self, path=STATE_PATH):
+        d = os.path.dirname(path)
+        if d:
+            os.makedirs(d, exist_ok=True)
+        self.path = path
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(SCHEMA)
+
+    def close(self):
+        self.conn.close()
+
+    def _write(self, statements):
+        # 複数の更新を 1 トランザクションで反映する
+        with self.lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                for sql, args in statements:
+                    self.conn.execute(sql, args)
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
+            self.conn.execute("COMMIT")
+
+    def _query(self, sql, args=()):
+        with self.lock:
+            return self.conn.execute(sql, args).fetchall()
+
+    # ---------- ポジション ----------
+    def get_position(self, key):
+        # (side, contracts)。未保存・ノーポジションは (None, None)
+        rows = self._query("SELECT side, contracts FROM positions WHERE key = ?", (key,))
+        return rows[0] if rows else (None, None)
+
+    def set_position(self, key, symbol, side, contracts):
+        self._write([(
+            "INSERT OR REPLACE INTO positions (key, symbol, side, contracts, updated_at) VALUES (?, ?, ?, ?, ?)",
+            (key, symbol, side, contracts, time.time()),
+        )])
+
+    # ---------- 発注中の注文 ----------
+    def begin_order(self, key, symbol, side, contracts):
+        # 発注前に記録しておき、完了時に finish_order でポジション更新と同時に消す
+        order_id = uuid.uuid4().hex
+        self._write([(
+            "INSERT INTO pending_orders (id, key, symbol, side, contracts, created_at) VALUES (?, ?, ?, ?, ?, ?)",
+            (order_id, key, symbol, side, contracts, time.time()),
+        )])
+        return order_id
+
+    def finish_order(self, order_id, key, symbol, position, contracts):
+        self._write([
+            ("DELETE FROM pending_orders WHERE id = ?", (order_id,)),
+            ("INSERT OR REPLACE INTO positions (key, symbol, side, contracts, updated_at) VALUES (?, ?, ?, ?, ?)",
+             (key, symbol, position, contracts, time.time())),
+        ])
+
+    def pending_orders(self, key=None):
+        sql = "SELECT id, key, symbol, side, contracts, created_at FROM pending_orders"
+        rows = self._query(sql + " WHERE key = ?", (key,)) if key is not None else self._query(sql)
+        return [dict(zip(("id", "key", "symbol", "side", "contracts", "created_at"), r)) for r in rows]
+
+    # ---------- 最後に処理した確定足 ----------
+    def last_candle(self, key):
+        rows = self._query("SELECT ts FROM candles WHERE key = ?", (key,))
+        return rows[0][0] if rows else None
+
+    def set_last_candle(self, key, ts):
+        self._write([("INSERT OR REPLACE INTO candles (key, ts, updated_at) VALUES (?, ?, ?)", (key, int(ts), time.time()))])
+
+    # ---------- 取引所との突き合わせ ----------
+    def reconcile(self, positions, keys):
+        # positions: ccxt の fetch_positions の結果 / keys: symbol -> key。
+        # 取引所の状態を正として保存内容を上書きし、途中で止まった発注記録も片付ける。
+        # 変更があった (key, 保存していた状態, 取引所の状態) を返す
+        actual = {}
+        for p in positions:
+            contracts = float(p.get("contracts") or 0)
+            if contracts > 0:
+                actual[p["symbol"]] = (p.get("side"), contracts)
+        changes = []
+        statements = []
+        for symbol, key in keys.items():
+            stored = tuple(self.get_position(key))
+            current = actual.get(symbol, (None, None))
+            if stored != current:
+                changes.append((key, stored, current))
+                statements.append((
+                    "INSERT OR REPLACE INTO positions (key, symbol, side, contracts, updated_at) VALUES (?, ?, ?, ?, ?)",
+                    (key, symbol, current[0], current[1], time.time()),
+                ))
+            statements.append(("DELETE FROM pending_orders WHERE key = ?", (key,)))
+        self._write(statements)
+        return changes
@@ -0,0 +1,82 @@
+import json
+import time
+
+from aiohttp import WSMsgType, web
+
+# ====== テスト用のローカル WebSocket スタンドインサーバー ======
+# 接続ごとに scripts の先頭を 1 つ取り出して実行する。script は async def script(server, ws)、
+# None ならハンドシェイクを HTTP 503 で拒否する。使い切った後の接続はクライアントが閉じるまで受信だけする。
+
+
+class StandInServer:
+    def __init__(self, scripts=()):
+        self.scripts = list(scripts)
+        self.connections = []  # 接続（拒否を含む）を受けた時刻（time.monotonic）
+        self.received = []  # クライアントから届いた JSON（"ping" は除く）
+        self.runner = None
+        self.url = None
+
+    async def __aenter__(self):
+        app = web.Application()
+        app.router.add_get("/ws", self._handle)
+        self.runner = web.AppRunner(app)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, "127.0.0.1", 0)
+        await site.start()
+        host, port = self.runner.addresses[0][:2]
+        self.url = f"http://{host}:{port}/ws"
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.runner.cleanup()
+
+    async def recv(self, ws):
+        # 次の JSON メッセージを受け取って記録する（"ping" は読み飛ばす）
+        while True:
+            msg = await ws.receive()
+            if msg.type != WSMsgType.TEXT:
+                return None
+            if msg.data == "ping":
+                await ws.send_str("pong")
+                continue
+            data = json.loads(msg.data)
+            self.received.append(data)
+            return data
+
+    async def _handle(self, request):
+        self.connections.append(time.monotonic())
+        script = self.scripts.pop(0) if self.scripts else hold
+        if script is None:
+            return web.Response(status=503)
+        ws = web.WebSocketResponse()
+        await ws.prepare(request)
+        await script(self, ws)
+        await ws.close()
+        return ws
+
+
+async def hold(server, ws):
+    while await server.recv(ws) is not None:
+        pass
+
+
+# ---------- Bitget 形式のフレーム ----------
+def candle_frame(inst_id, rows, channel="candle1m", action="update"):
+    # rows: [[ts, o, h, l, c, v], ...]。Bitget と同じく数値は文字列で送る
+    return json.dumps({
+        "action": action,
+        "arg": {"instType": "USDT-FUTURES", "channel": channel, "instId": inst_id},
+        "data": [[str(v) for v in row] for row in rows],
+    })
+
+
+def ticker_frame(inst_id, last, ts):
+    return json.dumps({
+        "action": "snapshot",
+        "arg": {"instType": "USDT-FUTURES", "channel": "ticker", "instId": inst_id},
+        "data": [{"instId": inst_id, "lastPr": str(last), "bidPr": str(last), "askPr": str(last), "ts": str(ts)}],
+    })
+
+
+def event_frame(event, code=0, **extra):
+    return json.dumps({"event": event, "code": code, **extra})
@@ -0,0 +1,123 @@
+import asyncio
+import time
+
+import ccxt
+import numpy as np
+import pytest
+
+import async_fetch
+import bench
+import candle_store
+
+MIN = 60_000
+T0 = 1_700_000_040_000
+
+
+class FakeAsyncExchange:
+    # async_fetch が使う ccxt.async_support のメソッドだけを持つ取引所
+    rateLimit = 1
+    parse_timeframe = staticmethod(ccxt.Exchange.parse_timeframe)
+
+    def __init__(self, rows, now, failures=0):
+        self.rows = rows
+        self.now = now
+        self.failures = failures  # 最初の何回を NetworkError にするか
+        self.calls = []
+        self.closed = False
+
+    async def fetch_ohlcv(self, symbol, timeframe, since=None, limit=None):
+        self.calls.append((symbol, since))
+        if self.failures:
+            self.failures -= 1
+            raise ccxt.RequestTimeout("timeout")
+        return [list(r) for r in self.rows.get(symbol, []) if r[0] >= since][:limit]
+
+    def milliseconds(self):
+        return self.now
+
+    async def close(self):
+        self.closed = True
+
+
+def listing(n, skip=()):
+    a = bench.synthetic_ohlcv(n, start_ms=T0, timeframe_ms=MIN)
+    return [[int(a["timestamp"][i]), *(float(a[c][i]) for c in candle_store.PRICE_COLUMNS)] for i in range(n) if i not in skip]
+
+
+@pytest.fixture(autouse=True)
+def no_backoff(monkeypatch):
+    monkeypatch.setattr(async_fetch, "BACKOFF_BASE_SEC", 0)
+
+
+def test_token_bucket_limits_rate():
+    async def run():
+        bucket = async_fetch.TokenBucket(rate=50, capacity=1)
+        t0 = time.monotonic()
+        await asyncio.gather(*(bucket.acquire() for _ in range(6)))
+        return bucket, time.monotonic() - t0
+
+    bucket, elapsed = asyncio.run(run())
+    # 1 回目はバケットの残りで即時、残り 5 回は 1/50 秒ずつ待つ
+    assert elapsed >= 5 / 50 * 0.9
+    assert bucket.waited == pytest.approx(5 / 50, rel=0.2)
+
+
+def test_token_bucket_burst_up_to_capacity():
+    async def run():
+        bucket = async_fetch.TokenBucket(rate=1, capacity=3)
+        for _ in range(3):
+            await bucket.acquire()
+        return bucket.waited
+
+    assert asyncio.run(run()) == 0
+
+
+def test_fetch_page_retries_network_errors():
+    ex = FakeAsyncExchange({"A/USDT": listing(3)}, now=T0 + 3 * MIN, failures=2)
+    page = asyncio.run(async_fetch.fetch_page(ex, async_fetch.TokenBucket(1000), "A/USDT", "1m", T0, 10))
+    assert len(page) == 3
+    assert len(ex.calls) == 3
+
+
+def test_fetch_page_gives_up_after_max_retries(monkeypatch):
+    monkeypatch.setattr(async_fetch, "MAX_RETRIES", 1)
+    ex = FakeAsyncExchange({"A/USDT": listing(3)}, now=T0 + 3 * MIN, failures=5)
+    with pytest.raises(ccxt.NetworkError):
+        asyncio.run(async_fetch.fetch_page(ex, async_fetch.TokenBucket(1000), "A/USDT", "1m", T0, 10))
+
+
+def test_fetch_range_pages_until_latest():
+    ex = FakeAsyncExchange({"A/USDT": listing(25)}, now=T0 + 24 * MIN + 1)
+    rows = asyncio.run(async_fetch.fetch_range(ex, async_fetch.TokenBucket(1000), "A/USDT", "1m", T0, limit=10))
+    assert [r[0] for r in rows] == [T0 + i * MIN for i in range(25)]
+    assert [since for _, since in ex.calls] == [T0, T0 + 9 * MIN + 1, T0 + 19 * MIN + 1]
+
+
+def test_sync_symbol_tail_gaps_and_empty_gaps(tmp_path):
+    # 0〜39 本目のうち 10〜14（取得できる）と 20〜24（取引所にも無い）が抜けたストアを、59 本目まで同期する
+    rows = listing(60, skip=range(20, 25))
+    store = candle_store.get_store("npy", str(tmp_path))
+    stored = [r for r in rows if r[0] < T0 + 40 * MIN and not T0 + 10 * MIN <= r[0] < T0 + 15 * MIN]
+    store.save("A/USDT", "1m", candle_store.arrays_from_ohlcv(stored))
+    ex = FakeAsyncExchange({"A/USDT": rows}, now=T0 + 59 * MIN + 1)
+    limiter = async_fetch.TokenBucket(1000)
+
+    path, written, gaps = asyncio.run(async_fetch.sync_symbol(ex, limiter, store, "A/USDT", "1m", days=1))
+    assert (path, written, gaps) == (store.path("A/USDT", "1m"), 5 + 20, 2)
+    np.testing.assert_array_equal(store.read_arrays("A/USDT", "1m")["timestamp"], [r[0] for r in rows])
+    assert store.empty_gaps("A/USDT", "1m") == {(T0 + 19 * MIN, T0 + 25 * MIN)}
+
+    ex.calls.clear()
+    _, written, gaps = asyncio.run(async_fetch.sync_symbol(ex, limiter, store, "A/USDT", "1m", days=1))
+    assert (written, gaps) == (0, 0)
+    assert ex.calls == [("A/USDT", T0 + 59 * MIN)]
+
+
+def test_download_all_reports_per_symbol(tmp_path, monkeypatch):
+    ex = FakeAsyncExchange({"A/USDT": listing(30)}, now=T0 + 29 * MIN + 1)
+    monkeypatch.setattr(async_fetch, "make_exchange", lambda: ex)
+    store = candle_store.get_store("npy", str(tmp_path))
+    results = asyncio.run(async_fetch.download_all(["A/USDT", "B/USDT"], store, "1m", days=1, concurrency=2, rate=1000))
+    assert results["A/USDT"][1] == 30
+    assert isinstance(results["B/USDT"], RuntimeError)  # 取得できない銘柄は例外を記録して続行
+    assert ex.closed
@@ -0,0 +1,94 @@
+import os
+
+import numpy as np
+import pytest
+
+import backtest
+import bench
+import candle_store
+import indicators
+
+
+def reference_backtest(close, trend, start, lot_bar=0):
+    # 書き換え前の backtest_supertrend と同じ 1 本ずつのドテン売買
+    lot_size = backtest.initial_capital / close[lot_bar]
+    position = None
+    entry_price = 0.0
+    profit = 0.0
+    profits = []
+    trade_count = 0
+    win_count = 0
+    for i in range(start, len(close)):
+        if position is None:
+            position, entry_price = trend[i], close[i]
+        elif position != trend[i]:
+            trade_profit = (close[i] - entry_price if position else entry_price - close[i]) * lot_size
+            net_profit = trade_profit - (entry_price + close[i]) * lot_size * backtest.taker_fee_rate
+            profit += net_profit
+            trade_count += 1
+            win_count += net_profit > 0
+            position, entry_price = trend[i], close[i]
+        profits.append(profit)
+    equity = backtest.initial_capital + np.array(profits)
+    peak = np.maximum.accumulate(equity)
+    stats = {
+        "final_profit": profit,
+        "trade_count": trade_count,
+        "win_rate": (win_count / trade_count * 100) if trade_count > 0 else 0.0,
+        "max_drawdown": ((equity - peak) / peak).min() * 100,
+    }
+    return equity, stats
+
+
+@pytest.mark.parametrize("lot_bar", [0, 300])
+def test_simulate_grid_matches_scalar_loop(lot_bar):
+    a = bench.synthetic_ohlcv(3000, seed=3)
+    close = a["close"]
+    trend, _, _ = indicators.supertrend_grid(a["high"], a["low"], close, 14, [3.0, 4.5, 9.9])
+    equity, stats = backtest.simulate_grid(close, trend, 14, lot_bar=lot_bar)
+    for r in range(len(trend)):
+        expected_equity, expected = reference_backtest(close, trend[r], 14, lot_bar)
+        np.testing.assert_allclose(equity[r], expected_equity, rtol=1e-12)
+        for key, value in expected.items():
+            assert stats[r][key] == pytest.approx(value, rel=1e-9, abs=1e-9), key
+
+
+@pytest.fixture
+def small_run(tmp_path, monkeypatch):
+    # 小さな合成ストアと 3 通りのパラメータで backtest.main() を回せるようにする
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(backtest.os, "chdir", lambda path: None)  # main() はスクリプトのディレクトリへ移動する
+    monkeypatch.setattr(backtest, "param_sets", [(10, 3.0), (14, 4.5), (21, 6.3)])
+    monkeypatch.setattr(backtest, "PARAM_WORKERS", 1)
+    monkeypatch.setattr(backtest, "TARGET_SYMBOL", "PI")
+    store = candle_store.get_store("npy", candle_store.STORE_DIR)
+    store.save("PI/USDT:USDT", backtest.TIMEFRAME, bench.synthetic_ohlcv(3000))
+    return store
+
+
+def test_main_smoke(small_run):
+    # レポートと CSV が出ることだけを確かめる
+    backtest.main()
+
+    assert os.path.exists(os.path.join("plots", "index.html"))
+    pngs = [f for f in os.listdir("plots") if f.endswith(".png")]
+    assert len(pngs) == 4  # 上位 3 件 + 全銘柄比較
+    assert all(":" not in f for f in pngs)
+    with open("results_all.csv") as f:
+        assert len(f.read().splitlines()) == 1 + 3
+
+
+def test_rerun_skips_computed_params(small_run, monkeypatch):
+    backtest.main()
+    with open("results_all.csv") as f:
+        first = f.read()
+    calls = []
+    monkeypatch.setattr(backtest, "run_params_for_symbol", lambda df, sym, todo, **kw: calls.append(todo))
+    backtest.main()
+    assert calls == []
+    # パラメータを足すと、増えた分だけを計算する
+    monkeypatch.setattr(backtest, "param_sets", backtest.param_sets + [(7, 9.9)])
+    backtest.main()
+    assert calls == [[(7, 9.9)]]
+    with open("results_all.csv") as f:
+        assert f.read() == first
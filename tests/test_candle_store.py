@@ -0,0 +1,145 @@
+import json
+import os
+
+import numpy as np
+import pytest
+
+import bench
+import candle_store
+from candle_store import COLUMNS
+
+SYMBOL = "PI/USDT:USDT"
+TF = "5m"
+
+
+def frame(ts, close):
+    ts = np.asarray(ts, dtype=np.int64)
+    close = np.asarray(close, dtype=np.float64)
+    return {"timestamp": ts, "open": close, "high": close + 1, "low": close - 1, "close": close, "volume": np.ones(len(ts))}
+
+
+def test_merge_arrays_sorts_and_keeps_new_values():
+    old = frame([1, 2, 3], [10, 20, 30])
+    new = frame([5, 3, 4], [50, 31, 40])  # 3 は後から取得した値で上書き
+    merged = candle_store.merge_arrays(old, new)
+    np.testing.assert_array_equal(merged["timestamp"], [1, 2, 3, 4, 5])
+    np.testing.assert_array_equal(merged["close"], [10, 20, 31, 40, 50])
+
+
+def test_find_gaps():
+    assert candle_store.find_gaps([0, 5, 10, 25, 30, 45], 5) == [(10, 25), (30, 45)]
+    assert candle_store.find_gaps([0], 5) == []
+
+
+def test_content_hash_changes_with_any_value():
+    a = bench.synthetic_ohlcv(100)
+    b = {c: a[c].copy() for c in COLUMNS}
+    assert candle_store.content_hash(a) == candle_store.content_hash(b)
+    b["volume"][50] += 1
+    assert candle_store.content_hash(a) != candle_store.content_hash(b)
+
+
+@pytest.mark.parametrize("kind", ["npy", "parquet"])
+def test_save_load_roundtrip(tmp_path, kind):
+    if kind == "parquet":
+        pytest.importorskip("pyarrow")
+    store = candle_store.get_store(kind, str(tmp_path))
+    arrays = bench.synthetic_ohlcv(500)
+    store.save(SYMBOL, TF, arrays)
+    assert store.exists(SYMBOL, TF)
+    assert store.symbols(TF) == [SYMBOL]
+    assert store.last_timestamp(SYMBOL, TF) == int(arrays["timestamp"][-1])
+    got = store.read_arrays(SYMBOL, TF)
+    for col in COLUMNS:
+        np.testing.assert_array_equal(got[col], arrays[col])
+    df = store.load(SYMBOL, TF)
+    assert list(df.columns) == list(COLUMNS)
+    assert df["timestamp"].iloc[0].value // 10**6 == arrays["timestamp"][0]
+
+
+def test_append_counts_new_and_changed_rows(tmp_path):
+    store = candle_store.get_store("npy", str(tmp_path))
+    assert store.append(SYMBOL, TF, frame([0, 5, 10], [1, 2, 3])) == 3  # 未保存なら save と同じ
+    assert store.append(SYMBOL, TF, frame([10, 15], [3.5, 4])) == 2  # 10 は値が変わった
+    assert store.append(SYMBOL, TF, frame([5, 10], [2, 3.5])) == 0
+    got = store.read_arrays(SYMBOL, TF)
+    np.testing.assert_array_equal(got["timestamp"], [0, 5, 10, 15])
+    np.testing.assert_array_equal(got["close"], [1, 2, 3.5, 4])
+
+
+def test_npy_save_switches_versions_through_meta(tmp_path):
+    store = candle_store.get_store("npy", str(tmp_path))
+    d = store.path(SYMBOL, TF)
+    store.save(SYMBOL, TF, frame([0, 5], [1, 2]))
+    store.save(SYMBOL, TF, frame([0, 5, 10], [1, 2, 3]))
+    with open(os.path.join(d, "meta.json")) as f:
+        meta = json.load(f)
+    assert (meta["version"], meta["rows"], meta["symbol"]) == (2, 3, SYMBOL)
+    assert sorted(f for f in os.listdir(d) if f.endswith(".npy")) == sorted(f"{c}.2.npy" for c in COLUMNS)
+
+
+def test_npy_crash_before_meta_keeps_previous_version(tmp_path, monkeypatch):
+    # 列を書いている途中で落ちても、meta.json は前の世代の列を指したまま
+    store = candle_store.get_store("npy", str(tmp_path))
+    store.save(SYMBOL, TF, frame([0, 5], [1, 2]))
+    real_save = np.save
+    written = []
+
+    def crash(path, arr):
+        if len(written) == 3:
+            raise OSError("disk full")
+        written.append(path)
+        real_save(path, arr)
+
+    monkeypatch.setattr(candle_store.np, "save", crash)
+    with pytest.raises(OSError):
+        store.save(SYMBOL, TF, frame([0, 5, 10], [7, 8, 9]))
+    monkeypatch.setattr(candle_store.np, "save", real_save)
+    got = store.read_arrays(SYMBOL, TF)
+    np.testing.assert_array_equal(got["close"], [1, 2])
+    np.testing.assert_array_equal(got["high"], [2, 3])
+    store.save(SYMBOL, TF, frame([0], [4]))  # 次の保存で残骸は消える
+    assert len([f for f in os.listdir(store.path(SYMBOL, TF)) if f.endswith(".npy")]) == len(COLUMNS)
+
+
+def test_npy_reads_legacy_unversioned_columns(tmp_path):
+    store = candle_store.get_store("npy", str(tmp_path))
+    d = store.path(SYMBOL, TF)
+    os.makedirs(d)
+    arrays = frame([0, 5], [1, 2])
+    for col in COLUMNS:
+        np.save(os.path.join(d, f"{col}.npy"), arrays[col])
+    with open(os.path.join(d, "meta.json"), "w") as f:
+        json.dump({"symbol": SYMBOL, "timeframe": TF, "rows": 2}, f)
+    np.testing.assert_array_equal(store.read_arrays(SYMBOL, TF)["close"], [1, 2])
+    store.save(SYMBOL, TF, frame([0, 5, 10], [1, 2, 3]))
+    assert store.read_arrays(SYMBOL, TF)["close"].tolist() == [1, 2, 3]
+    assert not os.path.exists(os.path.join(d, "close.npy"))
+
+
+def test_empty_gaps_survive_saves(tmp_path):
+    store = candle_store.get_store("npy", str(tmp_path))
+    store.save(SYMBOL, TF, frame([0, 5], [1, 2]))
+    store.add_empty_gaps(SYMBOL, TF, [(5, 20)])
+    store.add_empty_gaps(SYMBOL, TF, [(30, 40), (5, 20)])
+    store.save(SYMBOL, TF, frame([0, 5, 10], [1, 2, 3]))
+    assert store.empty_gaps(SYMBOL, TF) == {(5, 20), (30, 40)}
+    assert store.empty_gaps("OTHER/USDT", TF) == set()
+
+
+def test_resolve_symbol_prefers_swap(tmp_path):
+    store = candle_store.get_store("npy", str(tmp_path))
+    for sym in ("PI/USDT", "PI/USDT:USDT", "PIX/USDT:USDT"):
+        store.save(sym, TF, frame([0], [1]))
+    assert candle_store.resolve_symbol(store, "PI", TF) == "PI/USDT:USDT"
+    assert candle_store.resolve_symbol(store, "PI/USDT", TF) == "PI/USDT"
+    with pytest.raises(ValueError):
+        candle_store.resolve_symbol(store, "BTC", TF)
+
+
+def test_convert_csvs(tmp_path):
+    arrays = bench.synthetic_ohlcv(10)
+    candle_store.frame_from_arrays(arrays).to_csv(tmp_path / "PI_USDT_5m_100d.csv", index=False)
+    store = candle_store.get_store("npy", str(tmp_path / "store"))
+    assert candle_store.convert_csvs(str(tmp_path / "*_5m_100d.csv"), TF, store) == ["PI/USDT"]
+    np.testing.assert_array_equal(store.read_arrays("PI/USDT", TF)["timestamp"], arrays["timestamp"])
@@ -0,0 +1,175 @@
+import asyncio
+import json
+
+import ccxt
+import pytest
+
+import execution
+from standin_ws import StandInServer, event_frame, hold
+
+SYMBOL = "PI/USDT:USDT"
+
+
+class FakeExchange:
+    # OrderExecutor が使う ccxt.async_support のメソッドだけを持つローカルのモック取引所
+    def __init__(self, reject=False, status="closed"):
+        self.reject = reject
+        self.status = status
+        self.orders = []  # 受け付けた注文（create_orders の分も 1 件ずつ）
+        self.fetched = []
+        self.closed = False
+
+    async def create_order(self, symbol, type, side, amount, price=None, params=None):
+        if self.reject:
+            raise ccxt.InsufficientFunds("rejected")
+        order = {"id": str(len(self.orders) + 1), "symbol": symbol, "type": type, "side": side, "amount": amount, "params": params}
+        self.orders.append(order)
+        return order
+
+    async def create_orders(self, orders):
+        return [await self.create_order(o["symbol"], o["type"], o["side"], o["amount"], params=o["params"]) for o in orders]
+
+    async def fetch_order(self, order_id, symbol):
+        self.fetched.append(order_id)
+        return {"id": order_id, "symbol": symbol, "status": self.status, "average": 1.25}
+
+    async def close(self):
+        self.closed = True
+
+
+def orders_frame(client_oid, price, status="filled"):
+    return json.dumps({
+        "action": "snapshot",
+        "arg": {"instType": "USDT-FUTURES", "channel": "orders", "instId": "default"},
+        "data": [{"clientOid": client_oid, "status": status, "priceAvg": str(price)}],
+    })
+
+
+@pytest.fixture
+def executor():
+    logs = []
+    fake = FakeExchange()
+    ex = execution.OrderExecutor(exchange=fake, log=logs.append).start(stream=False)
+    ex.logs = logs
+    yield ex
+    ex.stop()
+    assert fake.closed
+
+
+def test_submit_records_ack_and_rest_fill(executor, monkeypatch):
+    # WS が無くても FILL_TIMEOUT_SEC 後の fetch_order で約定を確認する
+    monkeypatch.setattr(execution, "FILL_TIMEOUT_SEC", 0.05)
+    order = executor.submit(SYMBOL, "buy", 5, {"posMode": "one_way"})
+    cid = executor.exchange.orders[0]["params"]["clientOrderId"]
+    assert executor.exchange.orders[0]["params"]["posMode"] == "one_way"
+    assert executor.pending[cid]["order_id"] == order["id"]
+
+    result = executor.wait_fill(cid, timeout=5)
+    assert result["source"] == "rest"
+    assert result["price"] == 1.25
+    assert 0 <= result["ack_ms"] <= result["fill_ms"]
+    assert executor.exchange.fetched == [order["id"]]
+    assert cid not in executor.pending
+    assert list(executor.latencies) == [result]
+    assert executor.wait_fill(cid) == result  # 約定後に問い合わせても記録から返す
+    assert any(line.startswith("[FILL] BUY 5枚") for line in executor.logs)
+
+
+def test_open_order_stays_pending_after_poll(executor):
+    executor.exchange.status = "open"
+    executor.submit(SYMBOL, "sell", 1)
+    cid = executor.exchange.orders[0]["params"]["clientOrderId"]
+    executor._run(executor._poll_fill(cid))
+    assert cid in executor.pending
+    assert not executor.latencies
+
+
+def test_rejected_orders_are_not_tracked(executor):
+    executor.exchange.reject = True
+    with pytest.raises(ccxt.InsufficientFunds):
+        executor.submit(SYMBOL, "buy", 1)
+    executor.flip_mode = "batch"
+    with pytest.raises(ccxt.InsufficientFunds):
+        executor.flip(SYMBOL, "sell", 1, held=1)
+    assert executor.pending == {}
+
+
+def test_flip_single_order_uses_held_size(executor):
+    # 保有 3 枚（部分約定・突き合わせで size とずれた）から 2 枚のショートへ: 5 枚の売り 1 注文
+    executor.flip(SYMBOL, "sell", 2, {"reduceOnly": True}, held=3)
+    (order,) = executor.exchange.orders
+    assert (order["side"], order["amount"]) == ("sell", 5)
+    assert "reduceOnly" not in order["params"]
+
+
+@pytest.mark.parametrize("flip_mode,held,close_amount", [("single", None, 2), ("batch", None, 2), ("batch", 3, 3)])
+def test_flip_batch_closes_reduce_only(executor, flip_mode, held, close_amount):
+    # 保有枚数が不明なら single でも reduceOnly の決済 + 新規に落とす
+    executor.flip_mode = flip_mode
+    last = executor.flip(SYMBOL, "buy", 2, held=held)
+    close, open_ = executor.exchange.orders
+    assert (close["amount"], close["params"]["reduceOnly"]) == (close_amount, True)
+    assert open_["amount"] == 2 and "reduceOnly" not in open_["params"]
+    assert last is open_
+    assert len(executor.pending) == 2
+
+
+def test_private_stream_login_subscribe_and_ws_fill():
+    fills = asyncio.Queue()
+
+    async def bitget(server, ws):
+        await server.recv(ws)  # login
+        await ws.send_str(event_frame("login"))
+        await server.recv(ws)  # subscribe
+        await ws.send_str(event_frame("subscribe", arg={"channel": "orders"}))
+        cid, price = await fills.get()
+        await ws.send_str(orders_frame(cid, price, status="live"))  # 未約定の更新は無視される
+        await ws.send_str(orders_frame(cid, price))
+        await hold(server, ws)
+
+    async def scenario():
+        async with StandInServer([bitget]) as server:
+            ex = execution.OrderExecutor("key", "secret", "pass", exchange=FakeExchange(), ws_url=server.url, log=lambda m: None).start()
+            try:
+                assert await asyncio.to_thread(ex.stream_ready.wait, 5)
+                await asyncio.to_thread(ex.submit, SYMBOL, "sell", 3)
+                cid = ex.exchange.orders[0]["params"]["clientOrderId"]
+                await fills.put((cid, 0.5))
+                result = await asyncio.to_thread(ex.wait_fill, cid, 5)
+            finally:
+                await asyncio.to_thread(ex.stop)
+            return server, result
+
+    server, result = asyncio.run(scenario())
+    login, subscribe = server.received[:2]
+    assert login["op"] == "login"
+    args = login["args"][0]
+    assert (args["apiKey"], args["passphrase"]) == ("key", "pass")
+    assert login == execution.login_message("key", "secret", "pass", int(args["timestamp"]))
+    assert subscribe == {"op": "subscribe", "args": [{"instType": "USDT-FUTURES", "channel": "orders", "instId": "default"}]}
+    assert (result["source"], result["price"], result["side"], result["amount"]) == ("ws", 0.5, "sell", 3)
+    assert result["ack_ms"] is not None
+
+
+def test_private_stream_login_failure_reconnects(monkeypatch):
+    logs = []
+
+    async def refuse(server, ws):
+        await server.recv(ws)
+        await ws.send_str(event_frame("login", code=30005, msg="Invalid sign"))
+        await hold(server, ws)
+
+    async def scenario():
+        async with StandInServer([refuse]) as server:
+            ex = execution.OrderExecutor("key", "bad", "pass", exchange=FakeExchange(), ws_url=server.url, log=logs.append).start()
+            try:
+                async with asyncio.timeout(5):
+                    while len(server.connections) < 2:
+                        await asyncio.sleep(0.01)
+            finally:
+                await asyncio.to_thread(ex.stop)
+            return ex
+
+    ex = asyncio.run(scenario())
+    assert not ex.stream_ready.is_set()
+    assert any("[WS-PRIVATE] login failed" in line for line in logs)
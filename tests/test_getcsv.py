@@ -0,0 +1,75 @@
+import numpy as np
+import pytest
+
+import bench
+import candle_store
+import getcsv
+
+MIN = 60_000
+T0 = 1_700_000_040_000
+SYMBOL = "PI/USDT:USDT"
+
+
+class FakeExchange:
+    # getcsv が使う ccxt のメソッドだけを持つ取引所。rows を since 以降 limit 本ずつ返す
+    rateLimit = 0
+
+    def __init__(self, rows, now):
+        self.rows = rows
+        self.now = now
+        self.calls = []  # fetch_ohlcv の since
+
+    def fetch_ohlcv(self, symbol, timeframe, since=None, limit=None):
+        self.calls.append(since)
+        return [list(r) for r in self.rows if r[0] >= since][:limit]
+
+    def milliseconds(self):
+        return self.now
+
+
+def rows_from(arrays, keep):
+    ts = arrays["timestamp"]
+    return [[int(ts[i]), *(float(arrays[c][i]) for c in candle_store.PRICE_COLUMNS)] for i in keep]
+
+
+@pytest.fixture
+def market(tmp_path, monkeypatch):
+    # 取引所には 0〜105 本目があり、50〜59 本目は取引所にも無い（メンテナンス）。
+    # ストアには 0〜99 本目のうち 20〜29 本目と 50〜59 本目が抜けたものを保存しておく
+    full = bench.synthetic_ohlcv(106, start_ms=T0, timeframe_ms=MIN)
+    listed = [i for i in range(106) if not 50 <= i < 60]
+    stored = [i for i in range(100) if not (20 <= i < 30 or 50 <= i < 60)]
+    fake = FakeExchange(rows_from(full, listed), now=T0 + 105 * MIN + MIN // 2)
+    monkeypatch.setattr(getcsv, "exchange", fake)
+    store = candle_store.get_store("npy", str(tmp_path))
+    store.save(SYMBOL, getcsv.TIMEFRAME, {c: full[c][stored] for c in candle_store.COLUMNS})
+    return fake, store, full, listed
+
+
+def test_sync_fills_gaps_and_records_empty_ones(market):
+    fake, store, full, listed = market
+    path, written, gaps = getcsv.sync_symbol(SYMBOL, store)
+    assert path == store.path(SYMBOL, getcsv.TIMEFRAME)
+    assert gaps == 2
+    assert written == 10 + 6  # 埋まった欠損 20〜29 + 末尾の 100〜105（99 本目は同じ値なので数えない）
+    ts = store.read_arrays(SYMBOL, getcsv.TIMEFRAME)["timestamp"]
+    np.testing.assert_array_equal(ts, full["timestamp"][listed])
+    assert store.empty_gaps(SYMBOL, getcsv.TIMEFRAME) == {(T0 + 49 * MIN, T0 + 60 * MIN)}
+
+
+def test_second_sync_skips_recorded_gaps(market):
+    fake, store, _, _ = market
+    getcsv.sync_symbol(SYMBOL, store)
+    fake.calls.clear()
+    _, written, gaps = getcsv.sync_symbol(SYMBOL, store)
+    assert gaps == 0
+    assert written == 0
+    assert fake.calls == [T0 + 105 * MIN]  # 末尾の 1 リクエストだけ
+
+
+def test_changed_last_candle_counts_as_written(market):
+    fake, store, _, _ = market
+    getcsv.sync_symbol(SYMBOL, store)
+    fake.rows[-1][4] += 0.01  # 形成中だった最終足の終値が確定で変わった
+    _, written, _ = getcsv.sync_symbol(SYMBOL, store)
+    assert written == 1
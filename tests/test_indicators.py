@@ -0,0 +1,75 @@
+import numpy as np
+import pandas as pd
+import pytest
+import ta
+
+import bench
+import indicators
+
+
+def reference_supertrend(high, low, close, period, multiplier):
+    # 書き換え前の backtest.calculate_supertrend（ta の ATR + 逐次ループ）
+    high, low, close = pd.Series(high), pd.Series(low), pd.Series(close)
+    hl2 = (high + low) / 2
+    a = ta.volatility.AverageTrueRange(high, low, close, window=period).average_true_range()
+    upper = (hl2 + (multiplier * a)).tolist()
+    lower = (hl2 - (multiplier * a)).tolist()
+    trend = [True] * len(close)
+    for i in range(1, len(close)):
+        if close.iloc[i] > upper[i - 1]:
+            trend[i] = True
+        elif close.iloc[i] < lower[i - 1]:
+            trend[i] = False
+        else:
+            trend[i] = trend[i - 1]
+            if trend[i] and lower[i] < lower[i - 1]:
+                lower[i] = lower[i - 1]
+            if not trend[i] and upper[i] > upper[i - 1]:
+                upper[i] = upper[i - 1]
+    return np.array(trend), np.array(upper), np.array(lower)
+
+
+@pytest.fixture(scope="module")
+def ohlcv():
+    return bench.synthetic_ohlcv(2000, seed=7)
+
+
+@pytest.mark.parametrize("period,multiplier", [(7, 3.0), (14, 4.5), (27, 10.5)])
+def test_supertrend_matches_ta_reference(ohlcv, period, multiplier):
+    # ta の計算とビット単位で一致する（README の主張）
+    h, l, c = ohlcv["high"], ohlcv["low"], ohlcv["close"]
+    expected = reference_supertrend(h, l, c, period, multiplier)
+    got = indicators.supertrend(h, l, c, period, multiplier)
+    for e, g in zip(expected, got):
+        np.testing.assert_array_equal(g, e)
+
+
+def test_grid_and_panel_match_single(ohlcv):
+    h, l, c = ohlcv["high"], ohlcv["low"], ohlcv["close"]
+    mults = [3.0, 6.3, 9.9]
+    trend, upper, lower = indicators.supertrend_grid(h, l, c, 14, mults)
+    panel, _, _ = indicators.supertrend_panel(np.stack([h, h]), np.stack([l, l]), np.stack([c, c]), 14, mults)
+    for r, m in enumerate(mults):
+        t, u, lo = indicators.supertrend(h, l, c, 14, m)
+        np.testing.assert_array_equal(trend[r], t)
+        np.testing.assert_array_equal(upper[r], u)
+        np.testing.assert_array_equal(lower[r], lo)
+        np.testing.assert_array_equal(panel[r, 1], t)
+
+
+@pytest.mark.parametrize("seed_bars", [0, 5, 500])
+def test_streaming_matches_batch(ohlcv, seed_bars):
+    # 途中まで seed し、残りを確定足で 1 本ずつ流してもバッチ計算と同じ trend になる
+    h, l, c = ohlcv["high"], ohlcv["low"], ohlcv["close"]
+    expected, _, _ = indicators.supertrend(h, l, c, 14, 4.5)
+    st = indicators.StreamingSuperTrend(14, 4.5).seed(h[:seed_bars], l[:seed_bars], c[:seed_bars])
+    got = [st.update(h[i], l[i], c[i]) for i in range(seed_bars, len(c))]
+    np.testing.assert_array_equal(got, expected[seed_bars:])
+
+
+def test_streaming_forming_bar_does_not_advance_state(ohlcv):
+    h, l, c = ohlcv["high"], ohlcv["low"], ohlcv["close"]
+    st = indicators.StreamingSuperTrend(14, 4.5).seed(h[:500], l[:500], c[:500])
+    before = (st.count, st.atr, st.upper, st.lower, st.trend)
+    st.update(h[500] * 2, l[500], c[500] * 2, closed=False)
+    assert (st.count, st.atr, st.upper, st.lower, st.trend) == before
@@ -0,0 +1,59 @@
+import main
+import replay
+
+SYMBOL = "SIM/USDT:USDT"
+
+
+def test_flip_closes_the_stored_position_size():
+    # 突き合わせで保有が 3 枚になっていれば、2 枚のドテンでも決済は 3 枚
+    sim = replay.SimExchange(SYMBOL)
+    sim.price = 1.0
+    with replay.live_context(sim):
+        sim.create_order(SYMBOL, "market", "buy", 3)
+        main.get_state().reconcile(sim.fetch_positions(), {SYMBOL: SYMBOL})
+        assert main.handle_signal(SYMBOL, "long", False, 1.0, contracts=2) == "short"
+    close, open_ = sim.orders[1:]
+    assert (close["side"], close["amount"], close["reduceOnly"]) == ("sell", 3, True)
+    assert (open_["side"], open_["amount"], open_["reduceOnly"]) == ("sell", 2, False)
+    assert sim.position == -2
+
+
+def bars(n, start=0, tf=60_000):
+    return [[start + i * tf, 1.0 + i, 1.5 + i, 0.5 + i, 1.2 + i, 1.0] for i in range(n)]
+
+
+def test_update_supertrend_after_empty_seed():
+    # 取得できたのが形成中の 1 本だけだと確定足 0 本でシードされる（last_timestamp は None）
+    ohlcv = bars(5)
+    st = main.seed_supertrend(ohlcv[:1], period=3, multiplier=2.0)
+    assert st.last_timestamp is None
+    main.update_supertrend(st, ohlcv)
+    expected = main.seed_supertrend(ohlcv, period=3, multiplier=2.0)
+    assert (st.count, st.last_timestamp, st.trend) == (4, ohlcv[3][0], expected.trend)
+    assert (st.upper, st.lower) == (expected.upper, expected.lower)
+
+    st = main.seed_supertrend(ohlcv[:1], period=3, multiplier=2.0)
+    main.commit_closed(st, ohlcv, close_ms=ohlcv[2][0])
+    assert (st.count, st.last_timestamp) == (2, ohlcv[1][0])
+
+
+def test_ws_trend_throttles_intrabar(monkeypatch):
+    # 上昇が続いた後に形成中の足が急落する：暫定トレンドはショート、確定トレンドはロングのまま
+    ohlcv = bars(8)
+    crash = [ohlcv[-1][0], 8.0, 8.0, 0.1, 0.2, 1.0]
+    st = main.seed_supertrend(ohlcv, period=3, multiplier=1.0)
+    window = [ohlcv[-2], crash]
+    assert st.trend
+
+    monkeypatch.setattr(main, "INTRABAR_EVAL_SEC", None)
+    assert main.ws_trend(st, window, False, 0.0, 100.0) == (True, True, 0.0)
+
+    monkeypatch.setattr(main, "INTRABAR_EVAL_SEC", 10)
+    assert main.ws_trend(st, window, False, 0.0, 100.0) == (False, True, 100.0)
+    assert main.ws_trend(st, window, False, 100.0, 105.0) == (None, True, 100.0)  # 間隔内の更新では判断しない
+    assert main.ws_trend(st, window, False, 100.0, 110.0) == (False, True, 110.0)
+
+    # 足が確定した更新は間隔に関係なく確定足のトレンドで判断する
+    window = [crash, [crash[0] + 60_000, 0.2, 0.2, 0.2, 0.2, 1.0]]
+    assert main.ws_trend(st, window, True, 110.0, 111.0) == (False, True, 110.0)
+    assert st.last_timestamp == crash[0]
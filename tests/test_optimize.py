@@ -0,0 +1,70 @@
+import numpy as np
+import pytest
+
+import bench
+import candle_store
+import indicators
+import optimize
+from test_backtest import reference_backtest
+
+
+@pytest.fixture(scope="module")
+def df():
+    return candle_store.frame_from_arrays(bench.synthetic_ohlcv(2000, seed=11))
+
+
+@pytest.fixture(scope="module")
+def cols(df):
+    return {c: df[c].to_numpy(dtype=np.float64) for c in ("high", "low", "close")}
+
+
+def test_walk_forward_windows():
+    assert optimize.walk_forward_windows(100, 30, 10, first=20) == [(20, 50, 60), (30, 60, 70), (40, 70, 80), (50, 80, 90), (60, 90, 100)]
+    anchored = optimize.walk_forward_windows(100, 30, 10, anchored=True, first=20)
+    assert [w[0] for w in anchored] == [20] * 5
+    assert [w[1:] for w in anchored] == [(50, 60), (60, 70), (70, 80), (80, 90), (90, 100)]
+    assert optimize.walk_forward_windows(50, 30, 10, first=20) == []
+
+
+def test_evaluate_segment_matches_scalar_loop(cols):
+    # ウォームアップ込みで指標を作り、[a, b) だけを区間の先頭の価格で決めた枚数で売買する
+    a, b, warmup, period = 800, 1200, 300, 14
+    stats = optimize.evaluate_segment(cols, period, [3.0, 6.3], a, b, warmup)
+    lo = a - warmup
+    for m, st in zip([3.0, 6.3], stats):
+        trend, _, _ = indicators.supertrend(cols["high"][lo:b], cols["low"][lo:b], cols["close"][lo:b], period, m)
+        _, expected = reference_backtest(cols["close"][lo:b], trend, a - lo, lot_bar=a - lo)
+        for key, value in expected.items():
+            assert st[key] == pytest.approx(value, rel=1e-9, abs=1e-9), key
+
+
+def test_evaluate_keeps_candidate_order(cols):
+    candidates = [(21, 6.3), (10, 3.0), (21, 3.0), (10, 9.0)]
+    stats = optimize.evaluate(cols, candidates, 600, 900)
+    for c, st in zip(candidates, stats):
+        assert st == optimize.evaluate_segment(cols, c[0], [c[1]], 600, 900)[0]
+
+
+def test_successive_halving_prunes(cols):
+    candidates = [(p, m) for p in (7, 14, 21) for m in (2.0, 4.0, 6.0, 8.0)]
+    best, score, cost = optimize.successive_halving(cols, candidates, 400, 1200, rungs=1)
+    exhaustive = optimize.evaluate(cols, candidates, 400, 1200)
+    assert score == max(st["final_profit"] for st in exhaustive)
+    assert cost == len(candidates) * 800
+
+    best, score, cost = optimize.successive_halving(cols, candidates, 400, 1200, rungs=3, eta=2)
+    assert best in candidates
+    assert cost < len(candidates) * 800
+
+
+def test_walk_forward_tests_out_of_sample(df, cols):
+    folds = optimize.walk_forward(df, periods=[7, 14], multipliers=[3.0, 6.0], train_days=2, test_days=1,
+                                  rungs=2, eta=2, workers=1, timeframe="5m")
+    assert [f["test"] for f in folds] == [(876, 1164), (1164, 1452), (1452, 1740)]
+    for f in folds:
+        assert f["train"][1] == f["test"][0]
+        assert f["oos"] == optimize.evaluate(cols, [(f["period"], f["mult"])], *f["test"])[0]
+    summary = optimize.summarize(folds)
+    assert summary["folds"] == 3
+    assert summary["oos_profit"] == pytest.approx(sum(f["oos"]["final_profit"] for f in folds))
+    assert 0 < summary["cost_ratio"] < 1
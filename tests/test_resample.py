@@ -0,0 +1,92 @@
+import numpy as np
+import pytest
+
+import bench
+import candle_store
+import resample
+
+MIN = 60_000
+T0 = 1_700_000_160_000  # 5 分足の区切りから 1 分ずれた時刻
+MONDAY = 1_700_438_400_000  # 2023-11-20 00:00 UTC（月曜）
+
+
+def minutes(n, start=T0):
+    return bench.synthetic_ohlcv(n, start_ms=start, timeframe_ms=MIN)
+
+
+def test_resample_arrays_aggregates_ohlcv():
+    a = minutes(16)  # 先頭 4 本は途中から始まるバケット、末尾 2 本は形成中
+    out = resample.resample_arrays(a, "5m")
+    np.testing.assert_array_equal(out["timestamp"], [T0 + 4 * MIN, T0 + 9 * MIN])
+    for k, start in enumerate((4, 9)):
+        s = slice(start, start + 5)
+        assert out["open"][k] == a["open"][start]
+        assert out["high"][k] == a["high"][s].max()
+        assert out["low"][k] == a["low"][s].min()
+        assert out["close"][k] == a["close"][start + 4]
+        assert out["volume"][k] == pytest.approx(a["volume"][s].sum())
+
+    forming = resample.resample_arrays(a, "5m", keep_forming=True)
+    np.testing.assert_array_equal(forming["timestamp"], [T0 + 4 * MIN, T0 + 9 * MIN, T0 + 14 * MIN])
+    assert forming["close"][-1] == a["close"][-1]
+
+
+def test_resample_ohlcv_matches_arrays():
+    a = minutes(12)
+    rows = resample.resample_ohlcv([[int(a["timestamp"][i]), *(a[c][i] for c in candle_store.PRICE_COLUMNS)] for i in range(12)], "5m")
+    full = resample.resample_arrays(a, "5m", keep_forming=True)
+    assert [r[0] for r in rows] == full["timestamp"].tolist()
+    assert [r[4] for r in rows] == full["close"].tolist()
+
+
+def test_weekly_buckets_start_on_monday():
+    day = 24 * 60 * MIN
+    assert resample.bucket_start(MONDAY + 3 * day + 5, resample.timeframe_ms("1w")) == MONDAY
+    assert resample.bucket_start(MONDAY - 1, resample.timeframe_ms("1w")) == MONDAY - 7 * day
+    assert resample.bucket_start(MONDAY + 90 * MIN, resample.timeframe_ms("1h")) == MONDAY + 60 * MIN
+
+    a = bench.synthetic_ohlcv(21, start_ms=MONDAY - 7 * day, timeframe_ms=day)
+    out = resample.resample_arrays(a, "1w", base_timeframe="1d")
+    np.testing.assert_array_equal(out["timestamp"], [MONDAY - 7 * day, MONDAY, MONDAY + 7 * day])
+    assert out["volume"][1] == pytest.approx(a["volume"][7:14].sum())
+
+    agg = resample.CandleAggregator("1w")
+    assert agg.update([MONDAY + 6 * day, 1, 2, 0.5, 1.5, 1])[0] == MONDAY
+    assert agg.update([MONDAY + 7 * day, 2, 3, 1.5, 2.5, 1])[0] == MONDAY + 7 * day
+
+
+def test_candle_aggregator_folds_updates():
+    agg = resample.CandleAggregator("5m")
+    b = T0 + 4 * MIN
+    assert agg.update([b, 10, 12, 9, 11, 1]) == [b, 10, 12, 9, 11, 1]
+    agg.update([b + MIN, 11, 13, 10, 12, 2])
+    assert agg.update([b + MIN, 11, 14, 10, 13, 3]) == [b, 10, 14, 9, 13, 4]  # 同じ足の更新は置き換え
+    assert agg.update([b + 5 * MIN, 13, 13, 13, 13, 1])[0] == b + 5 * MIN
+    assert agg.update([b + 2 * MIN, 1, 1, 1, 1, 1]) is None  # 閉じたバケットへの遅延更新
+
+
+def test_source_timeframe():
+    available = ["1m", "5m", "15m", "1h", "4h", "1d", "1M"]
+    assert resample.source_timeframe("1h", available) == "1h"
+    assert resample.source_timeframe("10m", available) == "5m"
+    assert resample.source_timeframe("8h", available) == "4h"
+
+
+def test_resampled_store_rebuilds_after_append(tmp_path):
+    store = resample.get_store("npy", str(tmp_path))
+    start = T0 + 4 * MIN
+    store.save("PI/USDT:USDT", "1m", minutes(10, start))
+    assert store.symbols("5m") == ["PI/USDT:USDT"]
+    first = store.read_arrays("PI/USDT:USDT", "5m")
+    assert len(first["timestamp"]) == 2
+    assert store.read_arrays("PI/USDT:USDT", "5m") is first  # 変わっていなければメモを返す
+
+    # 別のインスタンス（再起動）はキャッシュを読む
+    again = resample.get_store("npy", str(tmp_path))
+    np.testing.assert_array_equal(again.read_arrays("PI/USDT:USDT", "5m")["close"], first["close"])
+
+    store.append("PI/USDT:USDT", "1m", minutes(20, start))
+    for s in (store, again):
+        out = s.read_arrays("PI/USDT:USDT", "5m")
+        np.testing.assert_array_equal(out["timestamp"], [start + i * 5 * MIN for i in range(4)])
+    assert store.load("PI/USDT:USDT", "5m")["close"].iloc[-1] == minutes(20, start)["close"][-1]
@@ -0,0 +1,50 @@
+import csv
+
+import result_store
+
+KEY = {"symbol": "PI/USDT:USDT", "data_hash": "abc", "fee_rate": 0.00042, "code_version": "v1"}
+
+
+def result(period, mult, profit):
+    return {"period": period, "mult": mult, "final_profit": profit, "final_equity": 1000 + profit,
+            "trade_count": 10, "win_rate": 50.0, "max_drawdown": -5.0}
+
+
+def test_done_is_scoped_to_data_fee_and_code(tmp_path):
+    store = result_store.ResultStore(str(tmp_path / "results.db"))
+    store.add_many([result(10, 3.0, 5.0), result(14, 4.5, -1.0)], **KEY)
+    assert store.done(**KEY) == {(10, 3.0), (14, 4.5)}
+    # データ・手数料・コードのどれかが変われば計算し直す
+    for field, value in (("data_hash", "def"), ("fee_rate", 0.0006), ("code_version", "v2"), ("symbol", "BTC/USDT:USDT")):
+        assert store.done(**{**KEY, field: value}) == set()
+    store.close()
+
+    # 再実行（別の接続）でも計算済みとして見える
+    store = result_store.ResultStore(str(tmp_path / "results.db"))
+    assert store.done(**KEY) == {(10, 3.0), (14, 4.5)}
+
+
+def test_add_many_replaces_same_key_and_top_orders(tmp_path):
+    store = result_store.ResultStore(str(tmp_path / "results.db"))
+    store.add_many([result(10, 3.0, 5.0), result(14, 4.5, 9.0), result(21, 6.3, 1.0)], **KEY)
+    store.add_many([result(10, 3.0, 20.0)], **KEY)
+    top = store.top(2, **KEY)
+    assert [(r["period"], r["mult"], r["final_profit"]) for r in top] == [(10, 3.0, 20.0), (14, 4.5, 9.0)]
+    assert len(list(store.query())) == 3
+
+
+def test_export_csv_writes_only_requested_keys(tmp_path):
+    store = result_store.ResultStore(str(tmp_path / "results.db"))
+    store.add_many([result(14, 4.5, 9.0), result(10, 3.0, 5.0)], **KEY)
+    store.add_many([result(10, 3.0, 1.0)], **{**KEY, "data_hash": "old"})
+    out = tmp_path / "results_all.csv"
+    store.export_csv(str(out), [tuple(KEY.values())])
+    with open(out) as f:
+        rows = list(csv.DictReader(f))
+    assert [(r["period"], r["mult"]) for r in rows] == [("10", "3.0"), ("14", "4.5")]
+    assert set(rows[0]) == {"symbol", "period", "mult", *result_store.STAT_COLUMNS}
+
+
+def test_code_version_tracks_source():
+    assert result_store.code_version(result_store) == result_store.code_version(result_store)
+    assert result_store.code_version(result_store) != result_store.code_version(result_store, csv)
@@ -0,0 +1,48 @@
+import state_store
+
+BTC = "BTC/USDT:USDT"
+PI = "PI/USDT:USDT"
+
+
+def test_position_and_pending_order_lifecycle(tmp_path):
+    store = state_store.StateStore(str(tmp_path / "state.db"))
+    assert store.get_position("k") == (None, None)
+    order_id = store.begin_order("k", PI, "buy", 5)
+    assert [o["id"] for o in store.pending_orders("k")] == [order_id]
+    store.finish_order(order_id, "k", PI, "long", 5)
+    assert store.pending_orders() == []
+    assert store.get_position("k") == ("long", 5)
+    store.close()
+
+    # 再起動後も同じ内容が読める
+    store = state_store.StateStore(str(tmp_path / "state.db"))
+    assert store.get_position("k") == ("long", 5)
+    store.set_last_candle("k", 1_700_000_000_000)
+    assert store.last_candle("k") == 1_700_000_000_000
+    assert store.last_candle("other") is None
+
+
+def test_reconcile_takes_exchange_as_truth():
+    store = state_store.StateStore(":memory:")
+    store.set_position("btc", BTC, "long", 2)
+    store.set_position("pi", PI, "short", 10)
+    store.begin_order("pi", PI, "buy", 10)  # ドテン途中で落ちた
+    positions = [
+        {"symbol": BTC, "side": "long", "contracts": 2},
+        {"symbol": PI, "side": "long", "contracts": 7},
+        {"symbol": "ETH/USDT:USDT", "side": "short", "contracts": 1},  # 管理外の銘柄は見ない
+    ]
+    changes = store.reconcile(positions, {BTC: "btc", PI: "pi"})
+    assert changes == [("pi", ("short", 10), ("long", 7))]
+    assert store.get_position("pi") == ("long", 7)
+    assert store.get_position("btc") == ("long", 2)
+    assert store.pending_orders() == []
+
+
+def test_reconcile_clears_closed_positions():
+    store = state_store.StateStore(":memory:")
+    store.set_position("pi", PI, "long", 3)
+    changes = store.reconcile([{"symbol": PI, "side": "long", "contracts": 0}], {PI: "pi"})
+    assert changes == [("pi", ("long", 3), (None, None))]
+    assert store.get_position("pi") == (None, None)
+    assert store.reconcile([], {PI: "pi"}) == []
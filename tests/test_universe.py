@@ -0,0 +1,77 @@
+import json
+
+import universe
+
+
+def market(symbol, type_="spot", active=True):
+    base, rest = symbol.split("/")
+    quote = rest.split(":")[0]
+    return {"symbol": symbol, "id": symbol.replace("/", "").replace(":USDT", ""), "type": type_, "base": base,
+            "quote": quote, "settle": quote if type_ == "swap" else None, "active": active}
+
+
+class FakeExchange:
+    # Universe が使う load_markets / fetch_tickers だけを持つ取引所
+    def __init__(self, markets, tickers):
+        self.markets = {m["symbol"]: m for m in markets}
+        self.tickers = tickers
+        self.calls = []
+
+    def load_markets(self, reload=False):
+        self.calls.append("load_markets")
+        return self.markets
+
+    def fetch_tickers(self, params=None):
+        self.calls.append(f"fetch_tickers:{params['type']}")
+        return self.tickers
+
+
+def test_leveraged_bases_needs_real_base_and_no_derivative():
+    bases = {"BTC", "BTCUP", "ETH", "ETH3L", "ETHBEAR", "SUP", "SUPER", "JUP", "DOGEUP", "XRP", "XRPDOWN"}
+    # SUPER / JUP は接尾辞に見えない、DOGEUP は DOGE が無い、XRPDOWN は無期限がある
+    assert universe.leveraged_bases(bases, derivative_bases={"BTC", "XRPDOWN"}) == {"BTCUP", "ETH3L", "ETHBEAR"}
+    assert universe.leveraged_bases({"SUPER", "SUP", "JUP", "J"}) == set()
+
+
+def test_market_index_marks_leveraged():
+    markets = {m["symbol"]: m for m in (market("BTC/USDT"), market("BTCUP/USDT"), market("SUPER/USDT"),
+                                        market("BTC/USDT:USDT", "swap"), market("OLD/USDT", active=None))}
+    rows = {r["symbol"]: r for r in universe.market_index(markets)}
+    assert rows["BTCUP/USDT"]["leveraged"]
+    assert not rows["SUPER/USDT"]["leveraged"]
+    assert rows["BTC/USDT:USDT"] == {"symbol": "BTC/USDT:USDT", "id": "BTCUSDT", "type": "swap", "base": "BTC",
+                                     "quote": "USDT", "settle": "USDT", "active": True, "leveraged": False}
+    assert rows["OLD/USDT"]["active"]  # active が不明（None）なら取引可能とみなす
+
+
+def test_top_by_volume_and_cache(tmp_path):
+    ex = FakeExchange(
+        [market("BTC/USDT"), market("BTCUP/USDT"), market("ETH/USDT"), market("PI/USDT"), market("DEAD/USDT", active=False),
+         market("BTC/USDC"), market("BTC/USDT:USDT", "swap")],
+        {"BTC/USDT": {"quoteVolume": 100.0}, "BTCUP/USDT": {"quoteVolume": 500.0}, "DEAD/USDT": {"quoteVolume": 900.0},
+         "ETH/USDT": {"baseVolume": 2.0, "last": 40.0}, "PI/USDT": {"quoteVolume": None}, "BTC/USDC": {"quoteVolume": 1000.0}},
+    )
+    path = str(tmp_path / "data" / "universe.json")
+    u = universe.Universe(ex, path)
+    assert u.top(3, "spot") == ["BTC/USDT", "ETH/USDT", "PI/USDT"]
+    assert u.top(3, "spot", min_volume=1.0) == ["BTC/USDT", "ETH/USDT"]
+    assert u.top(1, "spot", leveraged=True) == ["BTCUP/USDT"]
+    assert [r["symbol"] for r in u.query("swap")] == ["BTC/USDT:USDT"]
+    assert sorted(ex.calls) == ["fetch_tickers:spot", "load_markets"]
+
+    # 保存したスナップショットは TTL 内なら別のインスタンスでもネットワークに出ない
+    ex.calls.clear()
+    again = universe.Universe(ex, path)
+    assert again.top(2, "spot") == ["BTC/USDT", "ETH/USDT"]
+    assert ex.calls == []
+    with open(path) as f:
+        assert json.load(f)["volume"]["spot"]["values"]["ETH/USDT"] == 80.0
+
+
+def test_expired_snapshot_is_refetched(tmp_path):
+    ex = FakeExchange([market("BTC/USDT")], {"BTC/USDT": {"quoteVolume": 1.0}})
+    path = str(tmp_path / "universe.json")
+    universe.Universe(ex, path).top(1, "spot")
+    ex.calls.clear()
+    universe.Universe(ex, path, markets_ttl=-1, volume_ttl=-1).top(1, "spot")
+    assert sorted(ex.calls) == ["fetch_tickers:spot", "load_markets"]
@@ -0,0 +1,81 @@
+import json
+
+import numpy as np
+
+import bench
+import candle_store
+import validate
+from candle_store import COLUMNS
+
+MIN = 60_000
+T0 = 1_700_000_040_000
+SYMBOL = "PI/USDT:USDT"
+
+
+def minutes(n):
+    return bench.synthetic_ohlcv(n, start_ms=T0, timeframe_ms=MIN)
+
+
+def test_clean_data_has_no_issues():
+    a = minutes(3000)
+    fixed, report = validate.validate(a, "1m")
+    assert validate.issues(report) == ""
+    assert report["rows"] == 3000
+    np.testing.assert_array_equal(fixed["timestamp"], a["timestamp"])
+
+
+def test_validate_fixes_order_and_duplicates():
+    a = minutes(10)
+    order = [0, 1, 5, 2, 3, 4, 3, 6, 7, 9]  # 5 が前に来て、3 が 2 回、8 が無い
+    messy = {col: a[col][order].copy() for col in COLUMNS}
+    messy["close"][6] = messy["close"][4]  # 後から届いた 3 の方を残す
+    fixed, report = validate.validate(messy, "1m")
+    np.testing.assert_array_equal(fixed["timestamp"], a["timestamp"][[0, 1, 2, 3, 4, 5, 6, 7, 9]])
+    assert (report["unsorted"], report["duplicates"], report["gaps"], report["missing"]) == (2, 1, 1, 1)
+    assert validate.issues(report) == "unsorted=2 duplicates=1 gaps=1 missing=1"
+
+
+def test_validate_flags_invalid_off_grid_and_outliers():
+    a = {col: v.copy() for col, v in minutes(3000).items()}
+    a["timestamp"][-1] += 1_000  # 格子から 1 秒ずれた足
+    a["low"][100] = a["high"][100] + 1  # 安値 > 高値
+    a["volume"][200] = -1
+    a["close"][1500] *= 3  # 終値のスパイク
+    a["high"][1500] = a["close"][1500]
+    fixed, report = validate.validate(a, "1m")
+    assert report["off_grid"] == 1
+    assert report["invalid"] == 2
+    assert T0 + 1500 * MIN in report["outlier_timestamps"]
+    assert T0 + 100 * MIN not in report["outlier_timestamps"]  # 壊れた足は外れ値に数えない
+
+
+def test_weekly_grid_is_monday():
+    monday = 1_700_438_400_000
+    week = 7 * 24 * 60 * MIN
+    a = bench.synthetic_ohlcv(5, timeframe_ms=week)
+    a["timestamp"] = monday + week * np.arange(5)
+    assert validate.validate(a, "1w")[1]["off_grid"] == 0
+    a["timestamp"] -= 4 * 24 * 60 * MIN  # epoch に揃えた（木曜始まりの）週
+    assert validate.validate(a, "1w")[1]["off_grid"] == 5
+
+
+def test_manifest_and_validate_store(tmp_path):
+    store = candle_store.get_store("npy", str(tmp_path))
+    a = minutes(50)
+    messy = {col: np.r_[a[col], a[col][-1:]] for col in COLUMNS}
+    store.save(SYMBOL, "1m", messy)
+    store.save("BTC/USDT:USDT", "1m", a)
+    logs = []
+    manifests = validate.validate_store(store, "1m", fix=True, log=logs.append)
+    assert logs == [f"[DATA] {SYMBOL} 1m: duplicates=1"]
+    m = manifests[SYMBOL]
+    assert (m["first"], m["last"], m["rows"]) == (T0, T0 + 49 * MIN, 50)
+    assert m["content_hash"] == candle_store.content_hash(a) == manifests["BTC/USDT:USDT"]["content_hash"]
+    assert "outlier_timestamps" not in m
+    assert len(store.read_arrays(SYMBOL, "1m")["timestamp"]) == 50  # fix=True で保存し直す
+
+    validate.validate_store(store, "5m", log=logs.append)
+    with open(tmp_path / validate.MANIFEST_NAME) as f:
+        saved = json.load(f)
+    assert set(saved) == {f"{SYMBOL}|1m", "BTC/USDT:USDT|1m"}
+    assert saved[f"{SYMBOL}|1m"] == m
@@ -0,0 +1,153 @@
+import asyncio
+
+import pytest
+
+import ws_feed
+from standin_ws import StandInServer, candle_frame, hold, ticker_frame
+
+MIN = 60_000
+T0 = 1_700_000_040_000
+
+
+def bar(i, close=1.0, volume=10.0):
+    return [T0 + i * MIN, 1.0, max(1.0, close), min(1.0, close), close, volume]
+
+
+async def collect(feed, queue, until, timeout=5):
+    # until(events) が真になるまで queue の中身を集め、feed を止める
+    task = asyncio.create_task(feed.run())
+    events = []
+    try:
+        async with asyncio.timeout(timeout):
+            while not until(events):
+                events.append(await queue.get())
+    finally:
+        feed.stop()
+        task.cancel()
+    return events
+
+
+@pytest.fixture
+def fast_backoff(monkeypatch):
+    monkeypatch.setattr(ws_feed, "RECONNECT_BASE_SEC", 0.05)
+
+
+def test_reconnect_backoff_and_gap_fill(fast_backoff):
+    gap_calls = []
+    final = {1: bar(2, 1.3), 3: bar(3, 1.4), 4: bar(4, 1.5)}
+
+    async def first(server, ws):
+        await server.recv(ws)  # subscribe
+        await ws.send_str(candle_frame("PIUSDT", [bar(1), bar(0), bar(2, 1.1)], action="snapshot"))
+        await ws.send_str(ticker_frame("PIUSDT", 1.1, T0 + 2 * MIN))
+        await ws.send_str(candle_frame("PIUSDT", [bar(2, 1.2)]))
+
+    async def resumed(server, ws):
+        await server.recv(ws)
+        # 再接続後の snapshot は補完済みの足と重なる
+        await ws.send_str(candle_frame("PIUSDT", [final[3], final[4], bar(1)], action="snapshot"))
+        await ws.send_str(candle_frame("PIUSDT", [bar(4, 1.6)]))
+        await ws.send_str(candle_frame("PIUSDT", [bar(5, 1.7)]))
+        await hold(server, ws)
+
+    async def gap_fill(since):
+        gap_calls.append(since)
+        return [final[3], final[1], final[4]]  # 順不同で返っても ts 順に流れる
+
+    async def scenario():
+        async with StandInServer([first, None, None, resumed]) as server:
+            queue = asyncio.Queue()
+            feed = ws_feed.BitgetPublicFeed("PIUSDT", "1m", queue, url=server.url, gap_fill=gap_fill)
+            events = await collect(feed, queue, lambda ev: ev and ev[-1] == ("candle", bar(5, 1.7)))
+            return server, feed, events
+
+    server, feed, events = asyncio.run(scenario())
+
+    # 切断 → 503 で 2 回拒否 → 再接続。拒否が続く間は待ち時間が倍々に伸びる（ジッターは 0.5〜1 倍）
+    assert len(server.connections) == 4
+    assert feed.reconnects == 3
+    waits = [b - a for a, b in zip(server.connections[1:], server.connections[2:])]
+    assert waits[0] >= 0.05 * 2 * 0.5
+    assert waits[1] >= 0.05 * 4 * 0.5
+    assert sum(1 for kind, _ in events if kind == "error") == 2
+    assert server.received[0] == feed.subscribe_message() == server.received[-1]
+
+    # 再接続時に最後に流した足から REST で補完する
+    assert gap_calls == [T0 + 2 * MIN]
+    candles = [data for kind, data in events if kind == "candle"]
+    assert candles == [bar(0), bar(1), bar(2, 1.1), bar(2, 1.2), bar(2, 1.3), bar(3, 1.4), bar(4, 1.5), bar(4, 1.6), bar(5, 1.7)]
+    ts = [c[0] for c in candles]
+    assert ts == sorted(ts)
+    assert all(a != b for a, b in zip(candles, candles[1:]))
+    assert ("ticker", {"last": 1.1, "bid": 1.1, "ask": 1.1, "ts": T0 + 2 * MIN}) in events
+
+
+def test_no_gap_fill_on_first_connect(fast_backoff):
+    calls = []
+
+    async def first(server, ws):
+        await server.recv(ws)
+        await ws.send_str(candle_frame("PIUSDT", [bar(0)]))
+
+    async def gap_fill(since):
+        calls.append(since)
+        return []
+
+    async def scenario():
+        async with StandInServer([first]) as server:
+            queue = asyncio.Queue()
+            feed = ws_feed.BitgetPublicFeed("PIUSDT", "1m", queue, url=server.url, gap_fill=gap_fill, ticker=False)
+            return await collect(feed, queue, lambda ev: len(ev) == 1)
+
+    assert asyncio.run(scenario()) == [("candle", bar(0))]
+    assert calls == []
+
+
+def test_backoff_keeps_growing_while_server_drops_without_data(fast_backoff):
+    async def drop(server, ws):
+        await server.recv(ws)
+
+    async def scenario():
+        async with StandInServer([drop, drop, drop]) as server:
+            feed = ws_feed.BitgetPublicFeed("PIUSDT", "1m", asyncio.Queue(), url=server.url)
+            task = asyncio.create_task(feed.run())
+            async with asyncio.timeout(5):
+                while len(server.connections) < 4:
+                    await asyncio.sleep(0.01)
+            feed.stop()
+            task.cancel()
+            return server.connections
+
+    t = asyncio.run(scenario())
+    assert t[3] - t[2] >= 0.05 * 4 * 0.5
+
+
+def test_fanout_routes_by_inst_id_and_fills_each_symbol(fast_backoff):
+    calls = []
+
+    async def first(server, ws):
+        await server.recv(ws)
+        await ws.send_str(candle_frame("AUSDT", [bar(0)]))
+        await ws.send_str(candle_frame("BUSDT", [bar(1)]))
+
+    async def resumed(server, ws):
+        await server.recv(ws)
+        await ws.send_str(candle_frame("AUSDT", [bar(3)]))
+        await hold(server, ws)
+
+    async def gap_fill(inst_id, since):
+        calls.append((inst_id, since))
+        return [bar(2)] if inst_id == "AUSDT" else []
+
+    async def scenario():
+        async with StandInServer([first, resumed]) as server:
+            a, b = asyncio.Queue(), asyncio.Queue()
+            feed = ws_feed.BitgetFanoutFeed({"AUSDT": [a], "BUSDT": [b]}, "1m", url=server.url, gap_fill=gap_fill)
+            events = await collect(feed, a, lambda ev: len(ev) == 3)
+            return feed, events, [b.get_nowait() for _ in range(b.qsize())]
+
+    feed, a_events, b_events = asyncio.run(scenario())
+    assert len(feed.subscribe_message()["args"]) == 2
+    assert sorted(calls) == [("AUSDT", T0), ("BUSDT", T0 + MIN)]
+    assert a_events == [("candle", bar(0)), ("candle", bar(2)), ("candle", bar(3))]
+    assert b_events == [("candle", bar(1))]
@@ -0,0 +1,154 @@
+import heapq
+import json
+import os
+import re
+import sys
+import threading
+import time
+
+import ccxt
+
+# ====== 銘柄ユニバース（市場メタデータの索引 + 出来高スナップショット） ======
+# load_markets から (type, base, quote, レバレッジトークンか) の索引を作り、fetch_tickers の出来高と一緒に
+# JSON に保存する。どちらも TTL 内ならネットワークに出ず、上位 N 件は (type, quote) の索引から選ぶだけ。
+# getcsv.py（ダウンロード対象）と engine.py（ライブの戦略）が同じ選び方をするための共通部品。
+UNIVERSE_PATH = os.path.join("data", "universe.json")
+MARKETS_TTL_SEC = 24 * 60 * 60
+VOLUME_TTL_SEC = 60 * 60
+DEFAULT_TYPE = "swap"  # 既定は USDT 無期限（ライブで取引するのと同じ市場）
+DEFAULT_QUOTE = "USDT"
+
+# BTCUP / ETHBEAR / BTC3L のような接尾辞。取り除いた残りが実在する別銘柄の base で、かつ先物・無期限が無い
+# （レバレッジトークンは現物だけ）ときだけレバレッジトークンとみなす（SUPER / JUP のように偶然含むだけの銘柄は落とさない）
+LEVERAGED_SUFFIX = re.compile(r"^(?P<base>[A-Z0-9]{2,}?)(?:UP|DOWN|BULL|BEAR|[2-5][LS])$")
+
+
+def leveraged_bases(bases, derivative_bases=()):
+    out = set()
+    for b in bases:
+        m = LEVERAGED_SUFFIX.match(b.upper())
+        if m and m.group("base") in bases and b not in derivative_bases:
+            out.add(b)
+    return out
+
+
+def market_index(markets):
+    # ccxt の markets -> 索引の行（JSON に保存できる小さな dict）のリスト
+    bases = {m.get("base") for m in markets.values() if m.get("base")}
+    derivative = {m.get("base") for m in markets.values() if m.get("type") in ("swap", "future")}
+    leveraged = leveraged_bases(bases, derivative)
+    rows = []
+    for m in markets.values():
+        rows.append({
+            "symbol": m["symbol"],
+            "id": m.get("id"),
+            "type": m.get("type"),
+            "base": m.get("base"),
+            "quote": m.get("quote"),
+            "settle": m.get("settle"),
+            "active": m.get("active") is not False,
+            "leveraged": m.get("base") in leveraged,
+        })
+    return rows
+
+
+class Universe:
+    def __init__(self, exchange=None, path=UNIVERSE_PATH, markets_ttl=MARKETS_TTL_SEC, volume_ttl=VOLUME_TTL_SEC):
+        self.exchange = exchange or ccxt.bitget({"enableRateLimit": True})
+        self.path = path
+        self.markets_ttl = markets_ttl
+        self.volume_ttl = volume_ttl
+        self.lock = threading.Lock()
+        self._data = None
+        self._by_key = None  # (type, quote) -> [行, ...]
+
+    def _read(self):
+        if self._data is None:
+            try:
+                with open(self.path) as f:
+                    self._data = json.load(f)
+            except (FileNotFoundError, ValueError):
+                self._data = {}
+            self._data.setdefault("volume", {})
+            self._by_key = None
+        return self._data
+
+    def _write(self):
+        d = os.path.dirname(self.path)
+        if d:
+            os.makedirs(d, exist_ok=True)
+        tmp = f"{self.path}.tmp"
+        with open(tmp, "w") as f:
+            json.dump(self._data, f)
+        os.replace(tmp, self.path)
+
+    def _stale(self, fetched_at, ttl):
+        return fetched_at is None or time.time() - fetched_at > ttl
+
+    def markets(self, refresh=False):
+        with self.lock:
+            data = self._read()
+            if refresh or self._stale(data.get("markets_at"), self.markets_ttl):
+                data["markets"] = market_index(self.exchange.load_markets(reload=True))
+                data["markets_at"] = time.time()
+                self._by_key = None
+                self._write()
+            return data["markets"]
+
+    def _index(self):
+        rows = self.markets()  # TTL 切れならここで作り直される
+        if self._by_key is None:
+            by_key = {}
+            for row in rows:
+                by_key.setdefault((row["type"], row["quote"]), []).append(row)
+            self._by_key = by_key
+        return self._by_key
+
+    def volumes(self, market_type=DEFAULT_TYPE, refresh=False):
+        # 24h の quoteVolume（無ければ baseVolume × last）。market_type ごとに fetch_tickers 1 回
+        with self.lock:
+            snap = self._read()["volume"].get(market_type)
+            if snap and not refresh and not self._stale(snap["fetched_at"], self.volume_ttl):
+                return snap["values"]
+        tickers = self.exchange.fetch_tickers(params={"type": market_type})
+        values = {}
+        for sym, t in tickers.items():
+            vol = t.get("quoteVolume")
+            if vol is None and t.get("baseVolume") is not None and t.get("last") is not None:
+                vol = t["baseVolume"] * t["last"]
+            values[sym] = float(vol or 0)
+        with self.lock:
+            self._read()["volume"][market_type] = {"fetched_at": time.time(), "values": values}
+            self._write()
+        return values
+
+    def query(self, market_type=DEFAULT_TYPE, quote=DEFAULT_QUOTE, leveraged=False, active=True):
+        rows = self._index().get((market_type, quote), [])
+        return [r for r in rows if (leveraged or not r["leveraged"]) and (not active or r["active"])]
+
+    def top(self, n, market_type=DEFAULT_TYPE, quote=DEFAULT_QUOTE, leveraged=False, min_volume=0.0):
+        # 出来高上位 n 件のシンボル
+        volume = self.volumes(market_type)
+        rows = [(volume.get(r["symbol"], 0.0), r["symbol"]) for r in self.query(market_type, quote, leveraged)]
+        return [sym for vol, sym in heapq.nlargest(n, rows) if vol >= min_volume]
+
+
+_universe = None
+
+
+def get_universe(exchange=None):
+    # プロセス内で共有するインスタンス（初回に渡した exchange を使う）
+    global _universe
+    if _universe is None:
+        _universe = Universe(exchange)
+    return _universe
+
+
+if __name__ == "__main__":
+    # 使い方: python universe.py [N] [swap|spot]
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 30
+    market_type = sys.argv[2] if len(sys.argv) > 2 else DEFAULT_TYPE
+    u = Universe()
+    volume = u.volumes(market_type)
+    for i, sym in enumerate(u.top(n, market_type), start=1):
+        print(f"{i:>3} {sym:<24} {volume.get(sym, 0):>18,.0f}")
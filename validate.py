@@ -0,0 +1,129 @@
+import json
+import os
+import sys
+
+import ccxt
+import numpy as np
+
+import candle_store
+import resample
+from candle_store import COLUMNS
+
+# ====== ローソク足データの検証（全列を NumPy でまとめて検査） ======
+# 時刻の単調性・timeframe の格子からのずれ・重複・欠損と、OHLC の矛盾・外れ値（スパイク）を調べる。
+# 並べ替えと重複除去（同じ timestamp は後から取得した方を残す）は修正し、外れ値は印を付けるだけ。
+# 銘柄ごとのマニフェスト（期間・欠損数・content hash）は結果キャッシュのキーにも使える。
+OUTLIER_SIGMA = 20.0  # 局所的な |対数リターン| の中央値の何倍で外れ値とみなすか
+OUTLIER_BLOCK = 1000  # 中央値を取る区間の本数（ボラティリティの変化に追従させる）
+MANIFEST_NAME = "manifest.json"  # ストアの root に置く
+
+
+def clean(arrays):
+    # 時刻順に並べ替え、同じ timestamp は最後に現れた行（後のページ）を残す
+    return candle_store.merge_arrays({col: np.asarray(arrays[col])[:0] for col in COLUMNS}, arrays)
+
+
+def outlier_mask(arrays, sigma=OUTLIER_SIGMA, block=OUTLIER_BLOCK):
+    # 終値の対数リターン・ヒゲの長さが、その区間の |対数リターン| の中央値 × sigma を超える足
+    close = np.asarray(arrays["close"], dtype=np.float64)
+    n = len(close)
+    mask = np.zeros(n, dtype=bool)
+    if n < 3:
+        return mask
+    open_, high, low = (np.asarray(arrays[col], dtype=np.float64) for col in ("open", "high", "low"))
+    with np.errstate(divide="ignore", invalid="ignore"):
+        r = np.abs(np.diff(np.log(close)))
+        wick = np.maximum(np.log(high / np.maximum(open_, close)), np.log(np.minimum(open_, close) / low))
+    pad = (-len(r)) % block
+    blocks = np.concatenate([r, np.full(pad, np.nan)]).reshape(-1, block)
+    scale = np.repeat(np.nanmedian(blocks, axis=1), block)[:len(r)]
+    scale = np.where(scale > 0, scale, np.nanmedian(r) or np.inf)
+    mask[1:] = r > sigma * scale
+    mask |= wick > sigma * np.r_[scale[:1], scale]
+    return mask
+
+
+def validate(arrays, timeframe, sigma=OUTLIER_SIGMA):
+    # (修正済みの列配列, 検査結果の dict) を返す
+    tf_ms = ccxt.Exchange.parse_timeframe(timeframe) * 1000
+    ts = np.asarray(arrays["timestamp"], dtype=np.int64)
+    d = np.diff(ts)
+    fixed = clean(arrays) if len(ts) and not np.all(d > 0) else {col: np.asarray(arrays[col]) for col in COLUMNS}
+    ts = fixed["timestamp"]
+    o, h, l, c, v = (np.asarray(fixed[col], dtype=np.float64) for col in COLUMNS[1:])
+    prices = np.stack([o, h, l, c])
+    invalid = (~np.isfinite(prices).all(axis=0) | (prices <= 0).any(axis=0) | ~(v >= 0)
+               | (h < np.maximum(o, c)) | (l > np.minimum(o, c)))
+    gaps = candle_store.find_gaps(ts, tf_ms)
+    missing = int(sum((end - start) // tf_ms - 1 for start, end in gaps))
+    outliers = outlier_mask(fixed, sigma) & ~invalid
+    report = {
+        "rows": int(len(ts)),
+        "unsorted": int(np.count_nonzero(d < 0)),
+        "duplicates": int(len(arrays["timestamp"]) - len(ts)),
+        "off_grid": int(np.count_nonzero(ts != resample.bucket_start(ts, tf_ms))),
+        "gaps": len(gaps),
+        "missing": missing,
+        "invalid": int(np.count_nonzero(invalid)),
+        "outliers": int(np.count_nonzero(outliers)),
+        "outlier_timestamps": ts[outliers][:20].tolist(),
+    }
+    return fixed, report
+
+
+def issues(report):
+    # 問題のある項目だけを "duplicates=3 gaps=1" の形にする（無ければ空文字）
+    keys = ("unsorted", "duplicates", "off_grid", "gaps", "missing", "invalid", "outliers")
+    return " ".join(f"{k}={report[k]}" for k in keys if report[k])
+
+
+def manifest(symbol, timeframe, arrays, report):
+    ts = arrays["timestamp"]
+    return {
+        "symbol": symbol,
+        "timeframe": timeframe,
+        "first": int(ts[0]) if len(ts) else None,
+        "last": int(ts[-1]) if len(ts) else None,
+        **{k: v for k, v in report.items() if k != "outlier_timestamps"},
+        "content_hash": candle_store.content_hash(arrays),
+    }
+
+
+def validate_store(store, timeframe, symbols=None, fix=False, log=print):
+    # ストア内の銘柄を検証し、{symbol: マニフェスト} を {root}/manifest.json に書く。
+    # fix=True なら並べ替え・重複除去した結果をストアへ保存し直す
+    manifests = {}
+    for symbol in symbols or store.symbols(timeframe):
+        arrays = store.read_arrays(symbol, timeframe, mmap=False)
+        fixed, report = validate(arrays, timeframe)
+        if fix and (report["unsorted"] or report["duplicates"]):
+            store.save(symbol, timeframe, fixed)
+        manifests[symbol] = manifest(symbol, timeframe, fixed, report)
+        found = issues(report)
+        if found:
+            log(f"[DATA] {symbol} {timeframe}: {found}")
+    path = os.path.join(store.root, MANIFEST_NAME)
+    try:
+        with open(path) as f:
+            saved = json.load(f)
+    except (FileNotFoundError, ValueError):
+        saved = {}
+    saved.update({f"{m['symbol']}|{timeframe}": m for m in manifests.values()})
+    os.makedirs(store.root, exist_ok=True)
+    tmp = f"{path}.tmp"
+    with open(tmp, "w") as f:
+        json.dump(saved, f, indent=1)
+    os.replace(tmp, path)
+    return manifests
+
+
+if __name__ == "__main__":
+    # 使い方: python validate.py <timeframe> [--fix] [npy|parquet]
+    if len(sys.argv) < 2:
+        print("usage: python validate.py <timeframe> [--fix] [npy|parquet]")
+        sys.exit(1)
+    args = [a for a in sys.argv[2:] if a != "--fix"]
+    store = candle_store.get_store(args[0] if args else candle_store.STORE_FORMAT)
+    result = validate_store(store, sys.argv[1], fix="--fix" in sys.argv)
+    bad = sum(1 for m in result.values() if issues(m))
+    print(f"{len(result)} symbols, {bad} with issues -> {os.path.join(store.root, MANIFEST_NAME)}")
@@ -0,0 +1,181 @@
+import asyncio
+import json
+import os
+import random
+
+import aiohttp
+
+# ====== Bitget 公開 WebSocket（ローソク足・ティッカー） ======
+# BITGET_WS_URL を差し替えればローカルのスタンドインサーバーでも動かせる
+WS_URL = os.getenv("BITGET_WS_URL", "wss://ws.bitget.com/v2/ws/public")
+PING_INTERVAL_SEC = 25  # Bitget は 30 秒無通信で切断するので "ping" を送る
+RECONNECT_BASE_SEC = 1
+RECONNECT_MAX_SEC = 30
+
+
+def candle_channel(timeframe: str) -> str:
+    # ccxt の "5m" / "1h" / "1d" -> Bitget の "candle5m" / "candle1H" / "candle1D"
+    unit = timeframe[-1]
+    return f"candle{timeframe[:-1]}{unit if unit == 'm' else unit.upper()}"
+
+
+def parse_candle(row):
+    # [ts, open, high, low, close, baseVolume, ...]（文字列）-> ccxt 形式の float リスト
+    return [int(row[0]), float(row[1]), float(row[2]), float(row[3]), float(row[4]), float(row[5])]
+
+
+def parse_ticker(row):
+    return {
+        "last": float(row["lastPr"]) if row.get("lastPr") else None,
+        "bid": float(row["bidPr"]) if row.get("bidPr") else None,
+        "ask": float(row["askPr"]) if row.get("askPr") else None,
+        "ts": int(row["ts"]) if row.get("ts") else None,
+    }
+
+
+class BitgetPublicFeed:
+    # 受信したイベントを queue に ("candle", [ts, o, h, l, c, v]) / ("ticker", {...}) で流す。
+    # 切断時は指数バックオフで再接続し、gap_fill(since_ms) があれば REST で取りこぼした足を補完する。
+    def __init__(self, inst_id, timeframe, queue, inst_type="USDT-FUTURES", url=None, gap_fill=None, ticker=True):
+        self.inst_id = inst_id
+        self.timeframe = timeframe
+        self.queue = queue
+        self.inst_type = inst_type
+        self.url = url or WS_URL
+        self.gap_fill = gap_fill
+        self.ticker = ticker
+        self.last_candle = None  # 最後に queue へ流した足
+        self.last_candle_ts = None
+        self.reconnects = 0
+        self._stopped = False
+
+    def subscribe_message(self):
+        args = [{"instType": self.inst_type, "channel": candle_channel(self.timeframe), "instId": self.inst_id}]
+        if self.ticker:
+            args.append({"instType": self.inst_type, "channel": "ticker", "instId": self.inst_id})
+        return {"op": "subscribe", "args": args}
+
+    def stop(self):
+        self._stopped = True
+
+    async def run(self):
+        attempt = 0
+        async with aiohttp.ClientSession() as session:
+            while not self._stopped:
+                try:
+                    # 受信できた接続の後だけバックオフを戻す（接続直後に切られ続ける間は間隔を広げる）
+                    if await self._connect(session, resumed=self.reconnects > 0):
+                        attempt = 0
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    await self._broadcast(("error", e))
+                if self._stopped:
+                    break
+                self.reconnects += 1
+                delay = min(RECONNECT_MAX_SEC, RECONNECT_BASE_SEC * (2 ** attempt)) * (0.5 + random.random() / 2)
+                attempt += 1
+                await asyncio.sleep(delay)
+
+    async def _connect(self, session, resumed):
+        # 1 通でも受信できたら True を返す
+        received = False
+        async with session.ws_connect(self.url, heartbeat=None) as ws:
+            await ws.send_str(json.dumps(self.subscribe_message()))
+            if resumed and self.gap_fill:
+                await self._resume()
+            ping = asyncio.create_task(self._ping(ws))
+            try:
+                async for msg in ws:
+                    if msg.type == aiohttp.WSMsgType.TEXT:
+                        received = True
+                        await self._on_text(msg.data)
+                    elif msg.type in (aiohttp.WSMsgType.CLOSED, aiohttp.WSMsgType.ERROR):
+                        break
+                    if self._stopped:
+                        break
+            finally:
+                ping.cancel()
+        return received
+
+    async def _ping(self, ws):
+        while True:
+            await asyncio.sleep(PING_INTERVAL_SEC)
+            await ws.send_str("ping")
+
+    async def _resume(self):
+        # 切断中に確定した足を REST で補完（以降の WS 更新と重複しても ts で整合する）
+        if self.last_candle is not None:
+            for row in sorted(await self.gap_fill(self.last_candle[0]), key=lambda r: r[0]):
+                await self._emit_candle(list(row))
+
+    async def _broadcast(self, event):
+        await self.queue.put(event)
+
+    async def _emit(self, event, inst_id=None):
+        await self.queue.put(event)
+
+    async def _emit_candle(self, candle, inst_id=None):
+        # 古い足と、直前に流した足と同じ内容（再接続後の snapshot と補完の重なり）は流さない
+        last = self.last_candle
+        if last is not None and (candle[0] < last[0] or candle == last):
+            return
+        self.last_candle = candle
+        self.last_candle_ts = candle[0]
+        await self._emit(("candle", candle), inst_id)
+
+    async def _on_text(self, text):
+        if text == "pong":
+            return
+        msg = json.loads(text)
+        if msg.get("event") == "error":
+            raise RuntimeError(f"WS subscribe error: {msg}")
+        arg = msg.get("arg", {})
+        channel = arg.get("channel", "")
+        inst_id = arg.get("instId")
+        data = msg.get("data") or []
+        if channel.startswith("candle"):
+            # snapshot は古い順に複数本、update は形成中の足
+            for row in sorted(data, key=lambda r: int(r[0])):
+                await self._emit_candle(parse_candle(row), inst_id)
+        elif channel == "ticker":
+            for row in data:
+                await self._emit(("ticker", parse_ticker(row)), inst_id)
+
+
+class BitgetFanoutFeed(BitgetPublicFeed):
+    # 1 本の接続で複数銘柄を購読し、instId ごとに登録された複数の queue へ配る。
+    # gap_fill は (inst_id, since_ms) を受け取る。エラーは全 queue に流す
+    def __init__(self, queues, timeframe, inst_type="USDT-FUTURES", url=None, gap_fill=None, ticker=False):
+        super().__init__(None, timeframe, None, inst_type=inst_type, url=url, gap_fill=gap_fill, ticker=ticker)
+        self.queues = queues  # inst_id -> [asyncio.Queue, ...]
+        self.last_candles = {}  # inst_id -> 最後に流した足
+
+    def subscribe_message(self):
+        args = []
+        for inst_id in self.queues:
+            args.append({"instType": self.inst_type, "channel": candle_channel(self.timeframe), "instId": inst_id})
+            if self.ticker:
+                args.append({"instType": self.inst_type, "channel": "ticker", "instId": inst_id})
+        return {"op": "subscribe", "args": args}
+
+    async def _resume(self):
+        for inst_id, last in list(self.last_candles.items()):
+            for row in sorted(await self.gap_fill(inst_id, last[0]), key=lambda r: r[0]):
+                await self._emit_candle(list(row), inst_id)
+
+    async def _broadcast(self, event):
+        for qs in self.queues.values():
+            for q in qs:
+                await q.put(event)
+
+    async def _emit(self, event, inst_id=None):
+        for q in self.queues.get(inst_id, ()):
+            await q.put(event)
+
+    async def _emit_candle(self, candle, inst_id=None):
+        last = self.last_candles.get(inst_id)
+        if last is not None and (candle[0] < last[0] or candle == last):
+            return
+        self.last_candles[inst_id] = candle
+        await self._emit(("candle", candle), inst_id)